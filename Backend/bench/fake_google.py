@@ -0,0 +1,443 @@
+"""
+Pengganti in-process untuk Drive v3 dan Sheets (gspread) yang dipakai backend.
+
+Hanya method yang benar-benar dipanggil kode ini yang ditiru:
+- Drive : files.list/create/copy/update/delete/get, permissions.create,
+          new_batch_http_request, upload resumable (next_chunk)
+- Sheets: get_all_values, get_all_records, append_rows, batch_update,
+          delete_rows
+
+Setiap panggilan HTTP tiruan melewati FaultProfile: latency (+ jitter),
+batas bandwidth upload dan error 429/5xx acak. Error dilempar dengan tipe
+yang sama seperti library aslinya (HttpError / gspread APIError) sehingga
+jalur retry di backend ikut teruji.
+"""
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+from gspread.exceptions import APIError
+from gspread.utils import numericise_all
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+@dataclass
+class FaultProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    # 0 = bandwidth upload tidak dibatasi
+    upload_mbps: float = 0.0
+    seed: int | None = None
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self, payload_bytes: int = 0):
+        seconds = self.latency_ms / 1000.0
+        if self.jitter_ms:
+            seconds += self._random() * self.jitter_ms / 1000.0
+        if self.upload_mbps and payload_bytes:
+            seconds += payload_bytes * 8 / (self.upload_mbps * 1_000_000)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+
+def _error_body(status: int) -> bytes:
+    return json.dumps({"error": {"code": status, "message": "fake error", "status": "UNAVAILABLE"}}).encode()
+
+
+def _drive_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), _error_body(status))
+
+
+def _sheets_error(status: int) -> APIError:
+    response = requests.Response()
+    response.status_code = status
+    response._content = _error_body(status)
+    return APIError(response)
+
+
+# =========================
+# DRIVE
+# =========================
+class FakeRequest:
+    """Tiruan HttpRequest googleapiclient: execute() menjalankan operasi."""
+
+    def __init__(self, drive: "FakeDrive", op, payload_bytes: int = 0):
+        self._drive = drive
+        self._op = op
+        self._payload_bytes = payload_bytes
+
+    def _call(self, payload_bytes: int = 0):
+        profile = self._drive.profile
+        profile.delay(payload_bytes)
+        if profile.should_fail():
+            raise _drive_error(profile.error_status)
+
+    def execute(self, num_retries: int = 0):
+        self._call(self._payload_bytes)
+        return self._op()
+
+
+class FakeResumableRequest(FakeRequest):
+    """files.create dengan media resumable: satu chunk per next_chunk()."""
+
+    def __init__(self, drive: "FakeDrive", body: dict, media):
+        super().__init__(drive, None)
+        self._body = body
+        self._media = media
+        self._offset = 0
+        self._buffer = bytearray()
+
+    def next_chunk(self, num_retries: int = 0):
+        size = self._media.size()
+        length = min(self._media.chunksize(), size - self._offset)
+        chunk = self._media.getbytes(self._offset, length)
+        self._call(len(chunk))
+        self._buffer.extend(chunk)
+        self._offset += len(chunk)
+        if self._offset < size:
+            return {"resumable_progress": self._offset}, None
+        return None, self._drive._store_file(self._body, bytes(self._buffer))
+
+
+class FakeBatch:
+    """Satu request HTTP untuk banyak operasi; error dilaporkan per item."""
+
+    def __init__(self, drive: "FakeDrive", callback):
+        self._drive = drive
+        self._callback = callback
+        self._items: list[tuple[str, FakeRequest]] = []
+
+    def add(self, request: FakeRequest, request_id: str):
+        self._items.append((request_id, request))
+
+    def execute(self):
+        profile = self._drive.profile
+        profile.delay()
+        if profile.should_fail():
+            raise _drive_error(profile.error_status)
+        for request_id, request in self._items:
+            if profile.should_fail():
+                self._callback(request_id, None, _drive_error(profile.error_status))
+                continue
+            try:
+                self._callback(request_id, request._op(), None)
+            except HttpError as e:
+                self._callback(request_id, None, e)
+
+
+class _Query:
+    """Parser minimal untuk query files.list yang dibuat backend."""
+
+    _NAME = re.compile(r"name\s*=\s*'((?:[^'\\]|\\.)*)'")
+    _PARENT = re.compile(r"'([^']+)'\s+in\s+parents")
+    _MIME = re.compile(r"mimeType\s*(!?=)\s*'([^']+)'")
+
+    def __init__(self, q: str):
+        q = q or ""
+        name = self._NAME.search(q)
+        self.name = name.group(1).replace("\\'", "'") if name else None
+        self.parents = set(self._PARENT.findall(q))
+        self.mime = self._MIME.findall(q)
+        self.not_trashed = bool(re.search(r"trashed\s*=\s*false", q))
+
+    def matches(self, f: dict) -> bool:
+        if self.name is not None and f["name"] != self.name:
+            return False
+        if self.parents and not self.parents.intersection(f.get("parents", [])):
+            return False
+        for op, mime in self.mime:
+            if (f["mimeType"] == mime) != (op == "="):
+                return False
+        if self.not_trashed and f.get("trashed"):
+            return False
+        return True
+
+
+class _Files:
+    def __init__(self, drive: "FakeDrive"):
+        self._drive = drive
+
+    def create(self, body: dict, media_body=None, fields: str | None = None):
+        drive = self._drive
+        if media_body is None:
+            return FakeRequest(drive, lambda: drive._store_file(body, None))
+        if media_body.resumable():
+            return FakeResumableRequest(drive, body, media_body)
+        data = media_body.getbytes(0, media_body.size())
+        return FakeRequest(drive, lambda: drive._store_file(body, data), len(data))
+
+    def list(self, q: str = "", fields: str | None = None, pageSize: int = 100,
+             pageToken: str | None = None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive._list(q, pageSize, pageToken))
+
+    def get(self, fileId: str, fields: str | None = None, **kwargs):
+        return FakeRequest(self._drive, lambda: dict(self._drive._get(fileId)))
+
+    def update(self, fileId: str, body: dict | None = None, fields: str | None = None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive._update(fileId, body or {}))
+
+    def delete(self, fileId: str, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive._delete(fileId))
+
+    def copy(self, fileId: str, body: dict | None = None, fields: str | None = None, **kwargs):
+        return FakeRequest(self._drive, lambda: self._drive._copy(fileId, body or {}))
+
+
+class _Permissions:
+    def __init__(self, drive: "FakeDrive"):
+        self._drive = drive
+
+    def create(self, fileId: str, body: dict, fields: str | None = None, **kwargs):
+        def op():
+            self._drive._get(fileId)
+            return {"id": f"perm-{fileId}"}
+        return FakeRequest(self._drive, op)
+
+
+class FakeDrive:
+    """Drive v3 tiruan; data disimpan di memori dan dipakai bersama antar thread."""
+
+    def __init__(self, profile: FaultProfile | None = None, root_id: str = "root"):
+        self.profile = profile or FaultProfile()
+        self.root_id = root_id
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._files: dict[str, dict] = {
+            root_id: {"id": root_id, "name": "root", "mimeType": FOLDER_MIME, "parents": []},
+        }
+        self.bytes_stored = 0
+
+    # Antarmuka resource googleapiclient
+    def files(self):
+        return _Files(self)
+
+    def permissions(self):
+        return _Permissions(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    # Operasi data
+    def _store_file(self, body: dict, data: bytes | None) -> dict:
+        with self._lock:
+            fid = f"fake{next(self._ids):08d}"
+            f = {
+                "id": fid,
+                "name": body["name"],
+                "mimeType": body.get("mimeType") or "application/octet-stream",
+                "parents": list(body.get("parents") or []),
+                "webViewLink": f"https://drive.google.com/file/d/{fid}/view",
+                "trashed": False,
+            }
+            if body.get("appProperties"):
+                f["appProperties"] = dict(body["appProperties"])
+            if data is not None:
+                f["size"] = str(len(data))
+                f["md5Checksum"] = hashlib.md5(data).hexdigest()
+                self.bytes_stored += len(data)
+            self._files[fid] = f
+            return dict(f)
+
+    def _get(self, file_id: str) -> dict:
+        with self._lock:
+            f = self._files.get(file_id)
+        if f is None:
+            raise _drive_error(404)
+        return f
+
+    def _list(self, q: str, page_size: int, page_token: str | None) -> dict:
+        query = _Query(q)
+        with self._lock:
+            matched = [dict(f) for f in self._files.values() if f["id"] != self.root_id and query.matches(f)]
+        start = int(page_token or 0)
+        end = start + max(1, int(page_size or 100))
+        result = {"files": matched[start:end]}
+        if end < len(matched):
+            result["nextPageToken"] = str(end)
+        return result
+
+    def _copy(self, file_id: str, body: dict) -> dict:
+        with self._lock:
+            src = self._files.get(file_id)
+            if src is None:
+                raise _drive_error(404)
+            fid = f"fake{next(self._ids):08d}"
+            f = {
+                **src,
+                "id": fid,
+                "name": body.get("name", src["name"]),
+                "parents": list(body.get("parents") or src.get("parents", [])),
+                "webViewLink": f"https://drive.google.com/file/d/{fid}/view",
+            }
+            if body.get("appProperties"):
+                f["appProperties"] = {**src.get("appProperties", {}), **body["appProperties"]}
+            self._files[fid] = f
+            return dict(f)
+
+    def _update(self, file_id: str, body: dict) -> dict:
+        with self._lock:
+            f = self._files.get(file_id)
+            if f is None:
+                raise _drive_error(404)
+            if "name" in body:
+                f["name"] = body["name"]
+            return dict(f)
+
+    def _delete(self, file_id: str):
+        with self._lock:
+            if file_id not in self._files:
+                raise _drive_error(404)
+            # Hapus folder = hapus seluruh isinya
+            doomed = {file_id}
+            changed = True
+            while changed:
+                changed = False
+                for f in self._files.values():
+                    if f["id"] not in doomed and doomed.intersection(f.get("parents", [])):
+                        doomed.add(f["id"])
+                        changed = True
+            for fid in doomed:
+                self._files.pop(fid, None)
+        return ""
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._files) - 1
+
+
+# =========================
+# SHEETS
+# =========================
+_A1 = re.compile(r"^([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+
+def _column_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - ord("A") + 1)
+    return n - 1
+
+
+class FakeWorksheet:
+    """Worksheet gspread tiruan (baris 1 = header)."""
+
+    def __init__(self, title: str, headers: list[str], rows: list[list] | None = None,
+                 profile: FaultProfile | None = None):
+        self.title = title
+        self.profile = profile or FaultProfile()
+        self._lock = threading.Lock()
+        self._values: list[list] = [list(headers)] + [list(r) for r in rows or []]
+
+    def _call(self):
+        self.profile.delay()
+        if self.profile.should_fail():
+            raise _sheets_error(self.profile.error_status)
+
+    def get_all_values(self) -> list[list]:
+        self._call()
+        with self._lock:
+            return [[str(v) for v in row] for row in self._values]
+
+    def get_all_records(self) -> list[dict]:
+        values = self.get_all_values()
+        if not values:
+            return []
+        headers = values[0]
+        return [
+            dict(zip(headers, numericise_all(row + [""] * (len(headers) - len(row)))))
+            for row in values[1:]
+        ]
+
+    def col_values(self, col: int) -> list[str]:
+        self._call()
+        with self._lock:
+            return [str(row[col - 1]) if len(row) >= col else "" for row in self._values]
+
+    def append_rows(self, rows: list[list], value_input_option: str = "RAW", **kwargs):
+        self._call()
+        with self._lock:
+            self._values.extend(list(r) for r in rows)
+
+    def batch_update(self, data: list[dict], value_input_option: str = "RAW", **kwargs):
+        self._call()
+        with self._lock:
+            for item in data:
+                match = _A1.match(item["range"])
+                if not match:
+                    raise ValueError(f"Range tidak didukung: {item['range']}")
+                col, row = _column_index(match.group(1)), int(match.group(2))
+                for r_off, values in enumerate(item["values"]):
+                    target = row - 1 + r_off
+                    while len(self._values) <= target:
+                        self._values.append([])
+                    line = self._values[target]
+                    while len(line) < col + len(values):
+                        line.append("")
+                    line[col:col + len(values)] = values
+
+    def delete_rows(self, start_index: int, end_index: int | None = None):
+        self._call()
+        end_index = end_index or start_index
+        with self._lock:
+            del self._values[start_index - 1:end_index]
+
+    def row_count(self) -> int:
+        with self._lock:
+            return len(self._values) - 1
+
+
+DOCUMENT_HEADERS = [
+    "kode_toko", "nama_toko", "cabang", "luas_sales", "luas_parkir",
+    "luas_gudang", "folder_link", "file_links", "timestamp",
+]
+CABANG_HEADERS = ["EMAIL_SAT", "NAMA LENGKAP", "JABATAN", "CABANG"]
+
+
+class FakeGoogle:
+    """Satu set layanan tiruan: Drive + worksheet dokumen + worksheet Cabang."""
+
+    def __init__(self, profile: FaultProfile | None = None, sheet_name: str = "Dokumen",
+                 root_id: str = "root", users: list[list] | None = None):
+        self.profile = profile or FaultProfile()
+        self.drive = FakeDrive(self.profile, root_id=root_id)
+        self.worksheets = {
+            sheet_name: FakeWorksheet(sheet_name, DOCUMENT_HEADERS, profile=self.profile),
+            "Cabang": FakeWorksheet("Cabang", CABANG_HEADERS, users or [], profile=self.profile),
+        }
+
+    def worksheet(self, name: str) -> FakeWorksheet:
+        return self.worksheets[name]
+
+    def install(self, pool):
+        """Arahkan GoogleServicePool ke layanan tiruan ini."""
+        pool.credentials = lambda: None
+        pool.drive = lambda: self.drive
+        pool.worksheet = self.worksheet
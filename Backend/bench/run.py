@@ -0,0 +1,323 @@
+"""
+Benchmark offline untuk endpoint utama, tanpa menyentuh kuota Google.
+
+Backend dijalankan di proses ini (uvicorn di thread terpisah) dengan
+GoogleServicePool diarahkan ke bench.fake_google. Toko sintetis berisi
+N file x M MB lalu di-replay ke:
+- save   : POST /save-document-base64/
+- update : PUT /document/{kode_toko} (separuh file diganti, sisanya tetap)
+- list   : GET /documents?cabang=...&limit=50
+
+Hasil per endpoint: jumlah request, error, p50/p99 latency, request per
+detik dan puncak RSS proses selama skenario. Client dan server berbagi
+proses (dan GIL), jadi angka absolut lebih rendah dari produksi; yang
+dibandingkan adalah perubahan antar versi dengan parameter sama.
+
+Contoh (dari folder Backend):
+    python -m bench.run --stores 20 --files 5 --file-mb 1 --concurrency 4 \\
+        --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CABANG = "BENCH"
+BENCH_USER = ["bench@example.com", "Bench User", "BRANCH BUILDING SUPPORT", CABANG]
+
+
+# -------------------------
+# Lingkungan & server
+# -------------------------
+def _prepare_env(workdir: str):
+    """Semua state lokal (SQLite, spool) diarahkan ke folder sementara."""
+    defaults = {
+        "SPREADSHEET_ID": "bench",
+        "SHEET_NAME": "Dokumen",
+        "DRIVE_ROOT_ID": "root",
+        "FILE_STORE_DB": os.path.join(workdir, "files.sqlite3"),
+        "FOLDER_CACHE_DB": os.path.join(workdir, "folders.sqlite3"),
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "JOB_SPOOL_DIR": os.path.join(workdir, "job_spool"),
+        "UPLOAD_SESSION_DIR": os.path.join(workdir, "upload_sessions"),
+        "UPLOAD_RATE_PER_SEC": "0",
+        # Fake Drive tidak punya changes feed
+        "DRIVE_MIRROR_INTERVAL": "0",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(app, port: int):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="critical", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Server benchmark tidak mau start.")
+        time.sleep(0.05)
+    return server, thread
+
+
+# -------------------------
+# Pengukuran
+# -------------------------
+def _current_rss() -> int:
+    """RSS saat ini (byte); fallback ke puncak getrusage jika /proc tidak ada."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class Client:
+    """Satu koneksi keep-alive per thread client."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=600)
+        return conn
+
+    def request(self, method: str, path: str, body: bytes | None = None) -> int:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn = self._conn()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+def run_scenario(name: str, client: Client, requests_: list[tuple], concurrency: int) -> dict:
+    """requests_: list (method, path, body). Kembalikan ringkasan statistik."""
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(req):
+        nonlocal errors
+        method, path, body = req
+        start = time.perf_counter()
+        try:
+            status = client.request(method, path, body)
+            ok = 200 <= status < 300
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            list(ex.map(one, requests_))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+
+
+# -------------------------
+# Data sintetis
+# -------------------------
+def _file_b64(size: int, seed: str) -> str:
+    # Isi unik per (toko, file, versi) supaya diff md5 tidak menganggap sama
+    block = (seed.encode() * (64 // max(1, len(seed)) + 1))[:64]
+    data = (block * (size // len(block) + 1))[:size]
+    return base64.b64encode(data).decode()
+
+
+def _store_payload(i: int, files: int, size: int) -> dict:
+    kode = f"B{i:05d}"
+    return {
+        "kode_toko": kode,
+        "nama_toko": f"TOKO {i}",
+        "cabang": CABANG,
+        "luas_sales": "100",
+        "luas_parkir": "20",
+        "luas_gudang": "10",
+        "files": [
+            {
+                "category": f"kategori{j % 3}",
+                "filename": f"file{j}.bin",
+                "type": "application/octet-stream",
+                "data": _file_b64(size, f"{kode}-{j}-v1"),
+            }
+            for j in range(files)
+        ],
+    }
+
+
+def _update_payload(payload: dict, size: int) -> dict:
+    files = []
+    for j, f in enumerate(payload["files"]):
+        entry = {"category": f["category"], "filename": f["filename"], "type": f["type"]}
+        if j % 2 == 0:
+            entry["data"] = _file_b64(size, f"{payload['kode_toko']}-{j}-v2")
+        files.append(entry)
+    return {**{k: v for k, v in payload.items() if k != "files"}, "files": files}
+
+
+# -------------------------
+# Main
+# -------------------------
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark offline backend dokumen (fake Drive/Sheets).")
+    p.add_argument("--stores", type=int, default=10, help="jumlah toko sintetis")
+    p.add_argument("--files", type=int, default=4, help="file per toko")
+    p.add_argument("--file-mb", type=float, default=1.0, help="ukuran tiap file (MB)")
+    p.add_argument("--concurrency", type=int, default=4, help="request paralel dari client")
+    p.add_argument("--list-requests", type=int, default=200, help="jumlah request skenario list")
+    p.add_argument("--latency-ms", type=float, default=50.0, help="latency tiap panggilan Google tiruan")
+    p.add_argument("--jitter-ms", type=float, default=20.0, help="tambahan latency acak maksimum")
+    p.add_argument("--error-rate", type=float, default=0.0, help="peluang error per panggilan (0-1)")
+    p.add_argument("--error-status", type=int, default=503, help="status HTTP error yang disuntik")
+    p.add_argument("--upload-mbps", type=float, default=0.0, help="batas bandwidth upload (0 = tanpa batas)")
+    p.add_argument("--seed", type=int, default=1, help="seed error/jitter")
+    p.add_argument("--scenarios", default="save,update,list", help="urutan skenario, dipisah koma")
+    p.add_argument("--json", action="store_true", help="cetak hasil sebagai JSON")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    _prepare_env(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+
+    from bench.fake_google import FakeGoogle, FaultProfile
+    import main as backend
+
+    profile = FaultProfile(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        upload_mbps=args.upload_mbps,
+        seed=args.seed,
+    )
+    fake = FakeGoogle(profile, sheet_name=os.environ["SHEET_NAME"],
+                      root_id=os.environ["DRIVE_ROOT_ID"], users=[BENCH_USER])
+    fake.install(backend.POOL)
+
+    port = _free_port()
+    server, thread = _start_server(backend.app, port)
+    client = Client(port)
+    size = int(args.file_mb * 1024 * 1024)
+    results = []
+    try:
+        payloads = [_store_payload(i, args.files, size) for i in range(args.stores)]
+        for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            if scenario == "save":
+                reqs = [("POST", "/save-document-base64/", json.dumps(p).encode()) for p in payloads]
+            elif scenario == "update":
+                reqs = [
+                    ("PUT", f"/document/{p['kode_toko']}", json.dumps(_update_payload(p, size)).encode())
+                    for p in payloads
+                ]
+            elif scenario == "list":
+                reqs = [("GET", f"/documents?cabang={CABANG}&limit=50", None)] * args.list_requests
+            else:
+                raise SystemExit(f"Skenario tidak dikenal: {scenario}")
+            results.append(run_scenario(scenario, client, reqs, args.concurrency))
+            del reqs
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+
+    summary = {
+        "params": vars(args),
+        "results": results,
+        "fake_api_calls": profile.calls,
+        "fake_api_errors": profile.errors,
+        "drive_files": fake.drive.count(),
+        "drive_bytes": fake.drive.bytes_stored,
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return summary
+
+    print(f"\n{'endpoint':<10}{'req':>6}{'err':>6}{'p50 ms':>10}{'p99 ms':>10}{'rps':>9}{'peak RSS MB':>13}")
+    for r in results:
+        print(f"{r['endpoint']:<10}{r['requests']:>6}{r['errors']:>6}{r['p50_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['rps']:>9}{r['peak_rss_mb']:>13}")
+    print(f"\npanggilan Google tiruan: {profile.calls} (error disuntik: {profile.errors}), "
+          f"file di Drive: {summary['drive_files']}, byte: {summary['drive_bytes']}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
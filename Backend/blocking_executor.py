@@ -0,0 +1,83 @@
+"""
+Executor terbatas untuk pekerjaan blocking (googleapiclient, gspread, sleep
+retry) yang dipanggil dari handler async.
+
+Handler async tidak boleh memanggil I/O blocking langsung karena seluruh
+event loop uvicorn (termasuk /health) ikut berhenti. Pekerjaan dikirim ke
+ThreadPoolExecutor dengan jumlah thread tetap; jumlah pekerjaan yang
+menunggu juga dibatasi sehingga lonjakan upload ditolak cepat (503)
+alih-alih menumpuk tanpa batas.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    """Antrian executor penuh."""
+
+
+class BlockingExecutor:
+    def __init__(self, name: str, workers: int = 8, max_queue: int = 32):
+        self.name = name
+        self.workers = max(1, int(workers))
+        # 0 = antrian tidak dibatasi
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def _wrap(self, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.stats["failed"] += 1
+            else:
+                self.stats["completed"] += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Kirim pekerjaan; raise ExecutorBusy jika antrian sudah penuh."""
+        with self._lock:
+            if self.max_queue and self._pending >= self.workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise ExecutorBusy(f"Executor {self.name} penuh ({self._pending} pekerjaan).")
+            self._pending += 1
+            self.stats["submitted"] += 1
+        # Context disalin supaya trace metrik request ikut ke thread pekerja
+        ctx = contextvars.copy_context()
+        future = self._pool.submit(ctx.run, self._wrap, fn, args, kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Jalankan fn di thread pool dan tunggu hasilnya tanpa memblokir loop.
+        Jika request dibatalkan (client putus), pekerjaan tetap diselesaikan
+        di thread-nya; slot antrian baru dilepas setelah benar-benar selesai.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(0, self._pending - self._running),
+                **self.stats,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
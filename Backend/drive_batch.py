@@ -0,0 +1,230 @@
+"""
+Lapisan batch untuk Drive API (new_batch_http_request).
+
+Beberapa operasi kecil (permission, buat folder, hapus file, cari folder)
+digabung ke satu request multipart berisi maksimal 100 operasi. Hasil
+tetap dilaporkan per item lewat BatchItem.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+from google_retry import GOOGLE_RETRY, is_retryable, is_throttled, retry_after_of
+from metrics import API_RETRIES, stage
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+MAX_PER_BATCH = 100
+
+
+@dataclass
+class BatchItem:
+    key: Hashable
+    request: Any
+    response: Optional[dict] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class DriveBatch:
+    def __init__(self, drive_service, max_per_batch: int = MAX_PER_BATCH, op: str = "batch",
+                 idempotent: bool = True):
+        self.drive_service = drive_service
+        # Nama operasi untuk metrik (permission, delete, rename, ...)
+        self.op = op
+        # create/copy: mengulang setelah 5xx/putus bisa membuat duplikat
+        self.idempotent = idempotent
+        self.max_per_batch = max(1, min(MAX_PER_BATCH, int(max_per_batch)))
+        self._items: list[BatchItem] = []
+
+    def add(self, key: Hashable, request):
+        self._items.append(BatchItem(key=key, request=request))
+
+    def __len__(self):
+        return len(self._items)
+
+    def _send(self, items: list[BatchItem]):
+        """Satu request batch (retry penuh jika request HTTP-nya sendiri gagal)."""
+        def send():
+            by_id = {str(i): item for i, item in enumerate(items)}
+
+            def callback(request_id, response, exception):
+                item = by_id[request_id]
+                item.response = response
+                item.error = exception
+
+            batch = self.drive_service.new_batch_http_request(callback=callback)
+            for request_id, item in by_id.items():
+                batch.add(item.request, request_id=request_id)
+            batch.execute()
+
+        GOOGLE_RETRY.call("drive", f"batch_{self.op}", send, idempotent=self.idempotent)
+
+    def execute(self) -> dict:
+        """
+        Kirim semua operasi, kembalikan {key: BatchItem}.
+        Item yang gagal dengan error sementara (429/5xx) dikirim ulang dalam
+        batch berikutnya dengan backoff, sampai batas percobaan engine retry.
+        """
+        results: dict = {}
+        items, self._items = self._items, []
+
+        for start in range(0, len(items), self.max_per_batch):
+            chunk = items[start:start + self.max_per_batch]
+            pending = chunk
+            for attempt in range(GOOGLE_RETRY.max_attempts):
+                for item in pending:
+                    item.response = item.error = None
+                try:
+                    with stage(f"drive_{self.op}"):
+                        self._send(pending)
+                except Exception as e:
+                    # Request batch gagal total: tandai semua item yang tersisa
+                    for item in pending:
+                        if item.response is None and item.error is None:
+                            item.error = e
+                    break
+
+                pending = [
+                    i for i in pending
+                    if i.error is not None
+                    and (is_throttled(i.error) if not self.idempotent else is_retryable(i.error))
+                ]
+                if not pending or attempt + 1 >= GOOGLE_RETRY.max_attempts:
+                    break
+                if any(is_throttled(i.error) for i in pending):
+                    GOOGLE_RETRY.note_throttle("drive")
+                retry_after = max((retry_after_of(i.error) or 0.0) for i in pending)
+                API_RETRIES.inc(len(pending), api="drive", op=f"batch_{self.op}_item")
+                time.sleep(GOOGLE_RETRY.backoff(attempt, retry_after or None))
+
+            for item in chunk:
+                results[item.key] = item
+        return results
+
+
+# =========================
+# OPERASI UMUM
+# =========================
+def escape_name_for_query(name: str) -> str:
+    # Escape tanda petik tunggal untuk query Drive
+    return name.replace("'", "\\'")
+
+
+def grant_public_batch(drive_service, file_ids: list[str]) -> dict:
+    """Beri akses anyone/reader ke banyak file. Kembalikan {file_id: BatchItem}."""
+    batch = DriveBatch(drive_service, op="permission")
+    for fid in dict.fromkeys(file_ids):
+        batch.add(fid, drive_service.permissions().create(
+            fileId=fid,
+            body={"type": "anyone", "role": "reader"},
+            fields="id",
+        ))
+    return batch.execute()
+
+
+def delete_files_batch(drive_service, file_ids: list[str]) -> dict:
+    """Hapus banyak file/folder. Kembalikan {file_id: BatchItem}."""
+    batch = DriveBatch(drive_service, op="delete")
+    for fid in dict.fromkeys(file_ids):
+        batch.add(fid, drive_service.files().delete(fileId=fid))
+    return batch.execute()
+
+
+def rename_files_batch(drive_service, new_names: dict) -> dict:
+    """Ganti nama banyak file: {file_id: nama_baru}. Kembalikan {file_id: BatchItem}."""
+    batch = DriveBatch(drive_service, op="rename")
+    for fid, name in new_names.items():
+        batch.add(fid, drive_service.files().update(fileId=fid, body={"name": name}, fields="id, name"))
+    return batch.execute()
+
+
+def copy_files_batch(drive_service, copies: dict, fields: str = "id") -> dict:
+    """
+    Salin banyak file di sisi server Drive (tanpa transfer isi).
+    copies: {key: {"file_id", "name", "parent_id", "app_properties"?}}.
+    Kembalikan {key: BatchItem}.
+    """
+    batch = DriveBatch(drive_service, op="copy", idempotent=False)
+    for key, c in copies.items():
+        body = {"name": c["name"], "parents": [c["parent_id"]]}
+        if c.get("app_properties"):
+            body["appProperties"] = c["app_properties"]
+        batch.add(key, drive_service.files().copy(fileId=c["file_id"], body=body, fields=fields))
+    return batch.execute()
+
+
+def create_folders_batch(drive_service, names: list[str], parent_id: str) -> dict:
+    """Buat banyak folder di parent yang sama. Kembalikan {name: folder_id}."""
+    batch = DriveBatch(drive_service, op="create_folder", idempotent=False)
+    for name in dict.fromkeys(names):
+        batch.add(name, drive_service.files().create(
+            body={"name": name, "mimeType": FOLDER_MIME, "parents": [parent_id]},
+            fields="id",
+        ))
+    folders = {}
+    for name, item in batch.execute().items():
+        if not item.ok:
+            raise item.error
+        folders[name] = item.response["id"]
+    return folders
+
+
+def get_or_create_folders(drive_service, names: list[str], parent_id: str, cache=None) -> dict:
+    """
+    Versi batch dari get_or_create_folder: satu batch files().list untuk
+    semua nama, lalu satu batch files().create untuk yang belum ada.
+    Jika `cache` (FolderCache) diberikan, nama yang sudah ada di cache tidak
+    dicari lagi dan hasil baru disimpan ke cache.
+    Kembalikan {name: folder_id}.
+    """
+    names = list(dict.fromkeys(names))
+    folders: dict[str, str] = {}
+    if cache is not None:
+        for name in names:
+            cached = cache.get(parent_id, name)
+            if cached:
+                folders[name] = cached
+        names = [n for n in names if n not in folders]
+    if not names:
+        return folders
+
+    resolved = _lookup_or_create(drive_service, names, parent_id)
+    if cache is not None:
+        cache.put_many(parent_id, resolved)
+    folders.update(resolved)
+    return folders
+
+
+def _lookup_or_create(drive_service, names: list[str], parent_id: str, retry_create: bool = True) -> dict:
+    lookup = DriveBatch(drive_service, op="folder_lookup")
+    for name in names:
+        query = (
+            f"name='{escape_name_for_query(name)}' and '{parent_id}' in parents and "
+            f"mimeType='{FOLDER_MIME}' and trashed=false"
+        )
+        lookup.add(name, drive_service.files().list(q=query, fields="files(id)"))
+
+    folders: dict[str, str] = {}
+    missing: list[str] = []
+    for name, item in lookup.execute().items():
+        if not item.ok:
+            raise item.error
+        found = (item.response or {}).get("files", [])
+        if found:
+            folders[name] = found[0]["id"]
+        else:
+            missing.append(name)
+
+    if missing:
+        try:
+            folders.update(create_folders_batch(drive_service, missing, parent_id))
+        except Exception as e:
+            if not (retry_create and is_retryable(e)):
+                raise
+            # Hasil create tidak pasti (sebagian mungkin sudah dibuat):
+            # cari ulang dulu, baru buat yang memang belum ada
+            folders.update(_lookup_or_create(drive_service, missing, parent_id, retry_create=False))
+    return folders
@@ -0,0 +1,266 @@
+"""
+Mirror metadata Drive (SQLite) yang disinkronkan lewat changes feed.
+
+Semua file/folder di bawah DRIVE_ROOT_ID disimpan lokal: id, nama,
+parent, mimeType, md5, ukuran, appProperties. Sekali saja dilakukan
+crawl penuh (startPageToken diambil SEBELUM crawl supaya perubahan selama
+crawl tidak hilang); setelah itu hanya delta dari changes.list yang
+diterapkan, dengan page token yang disimpan di database sehingga restart
+tidak perlu crawl ulang.
+
+tree(toko_folder_id) mengembalikan bentuk yang sama dengan
+folder_cache.resolve_tree() tanpa round trip files().list. Sebelum
+membaca, mirror mengejar delta terbaru (satu changes.list, biasanya
+kosong) jika sinkronisasi terakhir lebih lama dari max_staleness.
+"""
+import json
+import sqlite3
+import threading
+import time
+import traceback
+
+from drive_batch import FOLDER_MIME
+from folder_cache import PARENTS_PER_QUERY, list_all
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+_FILE_FIELDS = "id, name, parents, mimeType, md5Checksum, size, trashed, appProperties"
+_CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({_FILE_FIELDS}))"
+
+
+class DriveMirror:
+    def __init__(self, db_path: str, drive_factory, root_id: str | None,
+                 interval: float = 60.0, max_staleness: float = 0.0):
+        self._drive = drive_factory
+        self.root_id = root_id
+        self.interval = interval
+        self.max_staleness = max_staleness
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._synced_at = 0.0
+        self.stats = {"syncs": 0, "changes": 0, "reads": 0, "bootstraps": 0, "failures": 0}
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS drive_files (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    parent_id TEXT,
+                    mime_type TEXT,
+                    md5 TEXT,
+                    size INTEGER,
+                    app_properties TEXT
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS drive_files_parent ON drive_files(parent_id)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS mirror_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    # -------------------------
+    # State
+    # -------------------------
+    def _get_state(self, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM mirror_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, db, key: str, value: str):
+        db.execute("INSERT OR REPLACE INTO mirror_state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and bool(self.root_id)
+
+    @property
+    def ready(self) -> bool:
+        """True jika crawl awal selesai untuk root yang sama."""
+        return self.enabled and self._get_state("root_id") == self.root_id \
+            and self._get_state("page_token") is not None
+
+    # -------------------------
+    # Tulis
+    # -------------------------
+    @staticmethod
+    def _row(f: dict) -> tuple:
+        parents = f.get("parents") or []
+        return (
+            f["id"], f.get("name", ""), parents[0] if parents else None, f.get("mimeType"),
+            f.get("md5Checksum"), int(f["size"]) if f.get("size") else None,
+            json.dumps(f["appProperties"]) if f.get("appProperties") else None,
+        )
+
+    def _upsert(self, db, files: list[dict]):
+        db.executemany(
+            "INSERT OR REPLACE INTO drive_files "
+            "(id, name, parent_id, mime_type, md5, size, app_properties) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._row(f) for f in files],
+        )
+
+    def _bootstrap(self, drive):
+        """Crawl penuh di bawah root (BFS per 40 folder sekaligus)."""
+        start_token = GOOGLE_RETRY.call(
+            "drive", "changes_start", drive.changes().getStartPageToken().execute
+        )["startPageToken"]
+        found: list[dict] = []
+        frontier = [self.root_id]
+        while frontier:
+            next_frontier = []
+            for i in range(0, len(frontier), PARENTS_PER_QUERY):
+                chunk = frontier[i:i + PARENTS_PER_QUERY]
+                parents_q = " or ".join(f"'{fid}' in parents" for fid in chunk)
+                for f in list_all(drive, f"({parents_q}) and trashed = false", _FILE_FIELDS):
+                    found.append(f)
+                    if f.get("mimeType") == FOLDER_MIME:
+                        next_frontier.append(f["id"])
+            frontier = next_frontier
+
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM drive_files")
+            self._upsert(self._db, found)
+            self._set_state(self._db, "root_id", self.root_id)
+            self._set_state(self._db, "page_token", start_token)
+        self.stats["bootstraps"] += 1
+        print(f"Mirror Drive siap: {len(found)} item di bawah root.")
+
+    def _in_scope(self, db, f: dict) -> bool:
+        parents = f.get("parents") or []
+        if not parents:
+            return False
+        if parents[0] == self.root_id:
+            return True
+        return db.execute("SELECT 1 FROM drive_files WHERE id = ?", (parents[0],)).fetchone() is not None
+
+    def _apply(self, changes: list[dict]):
+        with self._lock, self._db:
+            for change in changes:
+                f = change.get("file") or {}
+                file_id = change.get("fileId") or f.get("id")
+                if change.get("removed") or f.get("trashed") or not self._in_scope(self._db, f):
+                    # Dihapus / dibuang / dipindah keluar root
+                    self._db.execute("DELETE FROM drive_files WHERE id = ?", (file_id,))
+                else:
+                    self._upsert(self._db, [f])
+        self.stats["changes"] += len(changes)
+
+    def sync(self):
+        """Terapkan semua delta sejak page token terakhir (atau crawl awal)."""
+        if not self.enabled:
+            return
+        with self._sync_lock:
+            drive = self._drive()
+            with stage("drive_mirror_sync"):
+                if not self.ready:
+                    self._bootstrap(drive)
+                token = self._get_state("page_token")
+                while token:
+                    request = drive.changes().list(
+                        pageToken=token, pageSize=1000, spaces="drive",
+                        includeRemoved=True, fields=_CHANGE_FIELDS,
+                    )
+                    res = GOOGLE_RETRY.call("drive", "changes_list", request.execute)
+                    self._apply(res.get("changes", []))
+                    if res.get("newStartPageToken"):
+                        with self._lock, self._db:
+                            self._set_state(self._db, "page_token", res["newStartPageToken"])
+                        break
+                    token = res.get("nextPageToken")
+                    with self._lock, self._db:
+                        self._set_state(self._db, "page_token", token)
+            self._synced_at = time.monotonic()
+            self.stats["syncs"] += 1
+
+    # -------------------------
+    # Baca
+    # -------------------------
+    @staticmethod
+    def _as_drive_file(row) -> dict:
+        file_id, name, parent_id, mime_type, md5, size, app_properties = row
+        f = {"id": file_id, "name": name, "parents": [parent_id] if parent_id else [], "mimeType": mime_type}
+        if md5:
+            f["md5Checksum"] = md5
+        if size is not None:
+            f["size"] = str(size)
+        if app_properties:
+            f["appProperties"] = json.loads(app_properties)
+        return f
+
+    def tree(self, toko_folder_id: str) -> tuple[dict, list[dict]] | None:
+        """
+        (category_folders, files) seperti resolve_tree(), atau None jika
+        mirror belum siap / gagal mengejar delta (pemanggil fallback ke list).
+        """
+        if not self.ready:
+            return None
+        if time.monotonic() - self._synced_at > self.max_staleness:
+            try:
+                self.sync()
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Mirror Drive gagal sinkron, pakai list langsung: {e}")
+                return None
+
+        with self._lock:
+            subfolders = self._db.execute(
+                "SELECT id, name FROM drive_files WHERE parent_id = ? AND mime_type = ?",
+                (toko_folder_id, FOLDER_MIME),
+            ).fetchall()
+            category_folders = {name: fid for fid, name in subfolders}
+            by_folder_id = {fid: name for fid, name in subfolders}
+            rows = []
+            ids = list(by_folder_id)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows.extend(self._db.execute(
+                    "SELECT id, name, parent_id, mime_type, md5, size, app_properties FROM drive_files "
+                    f"WHERE parent_id IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall())
+        files = []
+        for row in rows:
+            f = self._as_drive_file(row)
+            f["category"] = by_folder_id[row[2]]
+            files.append(f)
+        self.stats["reads"] += 1
+        return category_folders, files
+
+    def info(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM drive_files").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "items": count,
+            "interval": self.interval,
+            "seconds_since_sync": round(time.monotonic() - self._synced_at, 1) if self._synced_at else None,
+            **self.stats,
+        }
+
+    # -------------------------
+    # Background sync
+    # -------------------------
+    def _loop(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                self.stats["failures"] += 1
+                print("Sinkronisasi mirror Drive gagal, dicoba lagi nanti.")
+                traceback.print_exc()
+            if self._stop.wait(timeout=self.interval):
+                return
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        # Crawl awal juga berjalan di thread ini: startup tidak tertahan
+        self._thread = threading.Thread(target=self._loop, name="drive-mirror", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
@@ -0,0 +1,198 @@
+"""
+Penyimpanan terstruktur daftar file per toko (mirror SQLite lokal).
+
+Kolom file_links di sheet tetap diisi (dibaca frontend), tetapi sumber
+kebenaran untuk rekonsiliasi adalah tabel ini dengan kunci
+(kode_toko, category, filename) + ID file Drive, ukuran dan checksum.
+Lookup memakai index, dan perubahan satu file cukup satu baris SQL.
+Kolom sha256 (isi asli file) menjadi index hash untuk deduplikasi
+lintas toko: isi yang sudah ada di Drive cukup disalin, tidak diunggah.
+
+Format sel file_links: "kategori|nama|link[|thumbnail]" dipisah ", ".
+Karakter "," dan "|" di nama file di-escape (%2C / %7C) supaya sel bisa
+diurai ulang dengan aman.
+"""
+import sqlite3
+import threading
+import time
+
+_ESCAPES = (("%", "%25"), (",", "%2C"), ("|", "%7C"))
+
+
+def quote_name(name: str) -> str:
+    for raw, esc in _ESCAPES:
+        name = name.replace(raw, esc)
+    return name
+
+
+def unquote_name(name: str) -> str:
+    for raw, esc in reversed(_ESCAPES):
+        name = name.replace(esc, raw)
+    return name
+
+
+def render_file_links(entries: list[dict]) -> str:
+    parts = []
+    for e in entries:
+        entry = f"{e['category']}|{quote_name(e['filename'])}|{e['link']}"
+        if e.get("thumb_link"):
+            entry += f"|{e['thumb_link']}"
+        parts.append(entry)
+    return ", ".join(parts)
+
+
+def parse_file_links(cell: str) -> list[dict]:
+    entries = []
+    for entry in (cell or "").split(","):
+        parts = [p.strip() for p in entry.split("|")]
+        if len(parts) >= 3:
+            entries.append({
+                "category": parts[0],
+                "filename": unquote_name(parts[1]),
+                "link": parts[2],
+                "thumb_link": parts[3] if len(parts) > 3 else "",
+            })
+    return entries
+
+
+def file_id_from_link(link: str) -> str | None:
+    if "/media/" in link:
+        return link.split("/media/")[-1].split("?")[0].split("/")[0]
+    if "id=" in link:
+        return link.split("id=")[-1].split("&")[0]
+    if "/d/" in link:
+        return link.split("/d/")[-1].split("/")[0]
+    return None
+
+
+_COLUMNS = ("category", "filename", "file_id", "link", "thumb_link", "size", "md5", "sha256", "position")
+
+
+class FileStore:
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    kode_toko TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    file_id TEXT,
+                    link TEXT NOT NULL,
+                    thumb_link TEXT,
+                    size INTEGER,
+                    md5 TEXT,
+                    position INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (kode_toko, category, filename)
+                )
+            """)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(files)")}
+            if "sha256" not in columns:
+                # Database lama: tambahkan kolom hash tanpa membuang isi
+                self._db.execute("ALTER TABLE files ADD COLUMN sha256 TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_file_id ON files(file_id)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_md5 ON files(md5)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_thumb_link ON files(thumb_link)")
+
+    @staticmethod
+    def _key(kode_toko: str) -> str:
+        return str(kode_toko or "").strip().upper()
+
+    def _row(self, row) -> dict:
+        return dict(zip(_COLUMNS, row))
+
+    def has_store(self, kode_toko: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM files WHERE kode_toko = ? LIMIT 1", (self._key(kode_toko),)
+            ).fetchone()
+        return row is not None
+
+    def files_for(self, kode_toko: str) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM files WHERE kode_toko = ? ORDER BY position",
+                (self._key(kode_toko),),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def get(self, kode_toko: str, category: str, filename: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM files "
+                "WHERE kode_toko = ? AND category = ? AND filename = ?",
+                (self._key(kode_toko), category, filename),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def replace_all(self, kode_toko: str, entries: list[dict]):
+        """Set ulang seluruh daftar file satu toko (urutan = urutan list)."""
+        kode = self._key(kode_toko)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE kode_toko = ?", (kode,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (kode_toko, category, filename, file_id, link, "
+                "thumb_link, size, md5, sha256, position, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (kode, e["category"], e["filename"], e.get("file_id") or file_id_from_link(e["link"]),
+                     e["link"], e.get("thumb_link") or "", e.get("size"), e.get("md5"),
+                     (e.get("sha256") or "").lower() or None, pos, now)
+                    for pos, e in enumerate(entries)
+                ],
+            )
+
+    def has_file(self, file_id: str, thumb_links: list[str]) -> bool:
+        """True jika file_id milik salah satu toko (file asli atau thumbnail)."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT 1 FROM files WHERE file_id = ? "
+                f"OR thumb_link IN ({', '.join('?' * len(thumb_links))}) LIMIT 1",
+                (file_id, *thumb_links),
+            ).fetchone()
+        return row is not None
+
+    def find_by_hash(self, sha256: str) -> dict | None:
+        """File mana pun (toko apa pun) dengan isi sha256 ini, yang terbaru."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM files "
+                "WHERE sha256 = ? AND file_id IS NOT NULL ORDER BY updated_at DESC LIMIT 1",
+                ((sha256 or "").lower(),),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def known_hashes(self, hashes: list[str]) -> set[str]:
+        """Subset `hashes` yang isinya sudah tersimpan di Drive."""
+        wanted = sorted({(h or "").lower() for h in hashes if h})
+        found: set[str] = set()
+        with self._lock:
+            # Batas parameter SQLite: kirim per 500 hash
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT DISTINCT sha256 FROM files WHERE file_id IS NOT NULL "
+                    f"AND sha256 IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(r[0] for r in rows)
+        return found
+
+    def delete(self, kode_toko: str, category: str, filename: str) -> bool:
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "DELETE FROM files WHERE kode_toko = ? AND category = ? AND filename = ?",
+                (self._key(kode_toko), category, filename),
+            )
+        return cur.rowcount > 0
+
+    def delete_store(self, kode_toko: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE kode_toko = ?", (self._key(kode_toko),))
+
+    def render(self, kode_toko: str) -> str:
+        return render_file_links(self.files_for(kode_toko))
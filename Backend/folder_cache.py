@@ -0,0 +1,161 @@
+"""
+Cache persisten (SQLite) untuk ID folder Drive.
+
+Struktur cabang -> toko -> kategori hampir tidak pernah berubah, jadi ID
+folder disimpan dengan kunci (parent_id, nama). Saat cache miss, folder
+dicari/dibuat lewat Drive lalu hasilnya disimpan. Jika sebuah ID ternyata
+sudah tidak valid (misal folder toko dihapus), panggil forget().
+
+resolve_tree() mengambil seluruh isi folder toko (folder kategori + file di
+dalamnya) dengan satu query `'A' in parents or 'B' in parents ...` alih-alih
+satu files().list per kategori.
+"""
+import sqlite3
+import threading
+import time
+
+from drive_batch import FOLDER_MIME
+from google_retry import GOOGLE_RETRY, status_of
+from metrics import stage
+
+# Batas jumlah parent per query agar panjang q tetap aman
+PARENTS_PER_QUERY = 40
+
+
+class FolderCache:
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS folders (
+                    parent_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (parent_id, name)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS folders_id ON folders(folder_id)")
+
+    def get(self, parent_id: str, name: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT folder_id FROM folders WHERE parent_id = ? AND name = ?",
+                (parent_id, name),
+            ).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def children(self, parent_id: str) -> dict:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, folder_id FROM folders WHERE parent_id = ?", (parent_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def put(self, parent_id: str, name: str, folder_id: str):
+        self.put_many(parent_id, {name: folder_id})
+
+    def put_many(self, parent_id: str, folders: dict):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO folders (parent_id, name, folder_id, updated_at) VALUES (?, ?, ?, ?)",
+                [(parent_id, name, fid, now) for name, fid in folders.items()],
+            )
+
+    def forget(self, folder_id: str, name: str | None = None):
+        """
+        Buang folder (dan anak langsungnya) dari cache. forget(parent_id, name)
+        membuang entri (parent_id, name) beserta anak langsungnya.
+        """
+        with self._lock, self._db:
+            if name is not None:
+                row = self._db.execute(
+                    "SELECT folder_id FROM folders WHERE parent_id = ? AND name = ?", (folder_id, name)
+                ).fetchone()
+                self._db.execute("DELETE FROM folders WHERE parent_id = ? AND name = ?", (folder_id, name))
+                if row is None:
+                    return
+                folder_id = row[0]
+            self._db.execute(
+                "DELETE FROM folders WHERE folder_id = ? OR parent_id = ?", (folder_id, folder_id)
+            )
+
+
+def list_all(drive_service, query: str, fields: str) -> list[dict]:
+    """Semua hasil files().list untuk query (semua halaman)."""
+    items, page_token = [], None
+    while True:
+        request = drive_service.files().list(
+            q=query,
+            fields=f"nextPageToken, files({fields})",
+            pageSize=1000,
+            pageToken=page_token,
+        )
+        with stage("drive_list"):
+            res = GOOGLE_RETRY.call("drive", "list", request.execute)
+        items.extend(res.get("files", []))
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            return items
+
+
+def folders_exist(drive_service, parent_id: str, folder_ids) -> bool:
+    """
+    Validasi ID dari cache dengan satu request: semua folder_ids masih
+    subfolder aktif parent_id (parent dihapus/dibuang -> daftar anaknya
+    kosong), atau tanpa folder_ids: parent_id sendiri masih ada.
+    """
+    folder_ids = list(folder_ids)
+    if not folder_ids:
+        try:
+            meta = GOOGLE_RETRY.call(
+                "drive", "get", drive_service.files().get(fileId=parent_id, fields="id, trashed").execute
+            )
+        except Exception as e:
+            if status_of(e) == 404:
+                return False
+            raise
+        return not meta.get("trashed")
+    found = {
+        f["id"] for f in list_all(
+            drive_service,
+            f"'{parent_id}' in parents and trashed = false and mimeType = '{FOLDER_MIME}'",
+            "id",
+        )
+    }
+    return all(fid in found for fid in folder_ids)
+
+
+def resolve_tree(drive_service, toko_folder_id: str, cache: FolderCache | None = None,
+                 file_fields: str = "id, name, parents") -> tuple[dict, list[dict]]:
+    """
+    Kembalikan (category_folders {nama: id}, files [{id, name, category, ...}])
+    untuk satu folder toko: satu list untuk folder kategori, lalu satu list
+    (per 40 kategori) untuk seluruh file di dalamnya.
+    """
+    subfolders = list_all(
+        drive_service,
+        f"'{toko_folder_id}' in parents and trashed = false and mimeType = '{FOLDER_MIME}'",
+        "id, name",
+    )
+    category_folders = {sf["name"]: sf["id"] for sf in subfolders}
+    if cache is not None:
+        cache.put_many(toko_folder_id, category_folders)
+
+    by_folder_id = {fid: name for name, fid in category_folders.items()}
+    folder_ids = list(by_folder_id)
+    files: list[dict] = []
+    for start in range(0, len(folder_ids), PARENTS_PER_QUERY):
+        chunk = folder_ids[start:start + PARENTS_PER_QUERY]
+        parents_q = " or ".join(f"'{fid}' in parents" for fid in chunk)
+        for f in list_all(drive_service, f"({parents_q}) and trashed = false", file_fields):
+            parent = next((p for p in f.get("parents", []) if p in by_folder_id), None)
+            if parent is None:
+                continue
+            f["category"] = by_folder_id[parent]
+            files.append(f)
+    return category_folders, files
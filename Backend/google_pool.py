@@ -0,0 +1,142 @@
+"""
+Pool layanan Google (Drive + gspread) yang hidup selama proses berjalan.
+
+- Credential dibaca sekali dari token.json, refresh dijaga lock supaya
+  hanya satu thread yang memanggil endpoint token Google.
+- Client gspread dan handle worksheet dipakai ulang antar request.
+- Client Drive dibuat per thread karena httplib2 tidak thread-safe.
+"""
+import json
+import os
+import threading
+
+import gspread
+from google.auth.transport.requests import Request as GoogleRequest
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+
+class GoogleServicePool:
+    def __init__(self, token_path: str, scopes: list[str], spreadsheet_id: str | None):
+        self.token_path = token_path
+        self.scopes = scopes
+        self.spreadsheet_id = spreadsheet_id
+
+        self._creds: Credentials | None = None
+        self._creds_lock = threading.Lock()
+        self._gspread_lock = threading.Lock()
+        self._gspread_client = None
+        self._spreadsheet = None
+        self._worksheets: dict[str, gspread.Worksheet] = {}
+        self._local = threading.local()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "credential_loads": 0,
+            "credential_refreshes": 0,
+            "drive_builds": 0,
+            "drive_hits": 0,
+            "gspread_authorizes": 0,
+            "worksheet_opens": 0,
+            "worksheet_hits": 0,
+        }
+
+    # -------------------------
+    # Statistik
+    # -------------------------
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    # -------------------------
+    # Credential
+    # -------------------------
+    def _load_from_disk(self) -> Credentials:
+        if not os.path.exists(self.token_path):
+            raise Exception("token.json tidak ditemukan. Jalankan dulu auth_google.py untuk login.")
+        with open(self.token_path, "r") as token_file:
+            creds_data = json.load(token_file)
+        self._count("credential_loads")
+        return Credentials.from_authorized_user_info(creds_data, self.scopes)
+
+    def credentials(self) -> Credentials:
+        """
+        Kembalikan credential yang valid. Refresh hanya dilakukan oleh satu
+        thread; thread lain menunggu lalu memakai token hasil refresh.
+        """
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+
+        with self._creds_lock:
+            if self._creds is None:
+                self._creds = self._load_from_disk()
+            creds = self._creds
+            # Cek ulang setelah lock: mungkin thread lain sudah refresh
+            if creds.expired and creds.refresh_token:
+                with stage("credential_refresh"):
+                    GOOGLE_RETRY.call("oauth", "refresh", lambda: creds.refresh(GoogleRequest()))
+                self._count("credential_refreshes")
+                with open(self.token_path, "w") as token_file:
+                    token_file.write(creds.to_json())
+            return creds
+
+    # -------------------------
+    # Drive (per thread)
+    # -------------------------
+    def drive(self):
+        creds = self.credentials()
+        service = getattr(self._local, "drive", None)
+        if service is not None and getattr(self._local, "creds", None) is creds:
+            self._count("drive_hits")
+            return service
+
+        # cache_discovery=False untuk menghindari warning cache di beberapa environment
+        with stage("drive_build"):
+            service = build("drive", "v3", credentials=creds, cache_discovery=False)
+        self._local.drive = service
+        self._local.creds = creds
+        self._count("drive_builds")
+        return service
+
+    # -------------------------
+    # gspread (dipakai bersama)
+    # -------------------------
+    def _client(self):
+        # gspread memakai requests.Session yang aman dipakai antar thread;
+        # credential object-nya sama dengan milik pool sehingga refresh ikut.
+        if self._gspread_client is None:
+            self._gspread_client = gspread.authorize(self.credentials())
+            self._count("gspread_authorizes")
+        return self._gspread_client
+
+    def worksheet(self, name: str) -> gspread.Worksheet:
+        ws = self._worksheets.get(name)
+        if ws is not None:
+            self.credentials()  # pastikan token masih segar
+            self._count("worksheet_hits")
+            return ws
+
+        with self._gspread_lock:
+            ws = self._worksheets.get(name)
+            if ws is None:
+                with stage("worksheet_open"):
+                    if self._spreadsheet is None:
+                        client = self._client()
+                        self._spreadsheet = GOOGLE_RETRY.call(
+                            "sheets", "open", lambda: client.open_by_key(self.spreadsheet_id)
+                        )
+                    spreadsheet = self._spreadsheet
+                    ws = GOOGLE_RETRY.call("sheets", "worksheet", lambda: spreadsheet.worksheet(name))
+                self._worksheets[name] = ws
+                self._count("worksheet_opens")
+            else:
+                self._count("worksheet_hits")
+            return ws
@@ -0,0 +1,327 @@
+"""
+Lapisan retry & kendali laju bersama untuk semua panggilan Google API.
+
+Setiap panggilan Drive/Sheets dibungkus GOOGLE_RETRY.call(api, op, fn):
+- Retry untuk 429, 5xx, 403 rate limit dan error koneksi, dengan backoff
+  eksponensial + full jitter; header Retry-After dihormati jika ada
+- Operasi tidak idempoten (append, delete baris, create) hanya diulang
+  untuk 429: error koneksi/5xx tidak memastikan operasi gagal di server
+- Circuit breaker per API: setelah sejumlah kegagalan server berturut-turut
+  panggilan langsung ditolak (CircuitOpenError) sampai masa tunggu habis,
+  lalu satu panggilan percobaan dibiarkan lewat (half-open)
+- Batas konkurensi AIMD per API: naik +1 perlahan selama sukses, turun
+  setengah setiap kali Google membalas 429 -> berjalan dekat batas kuota
+  tanpa banjir error
+Panggilan bersarang di thread yang sama tidak mengambil slot konkurensi
+dua kali (menghindari deadlock).
+"""
+import json
+import random
+import socket
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from metrics import API_CALLS, API_RETRIES, REGISTRY
+
+try:
+    from gspread.exceptions import APIError as GspreadAPIError
+except ImportError:  # gspread opsional untuk modul ini
+    GspreadAPIError = None
+
+try:
+    import requests
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError, socket.timeout,
+                         requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+except ImportError:
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError, socket.timeout)
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "google_api_concurrency_limit", "Batas konkurensi AIMD saat ini.", ("api",)
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    "google_api_circuit_open", "1 jika circuit breaker sedang terbuka.", ("api",)
+)
+
+
+class CircuitOpenError(Exception):
+    """Circuit breaker terbuka: Google API dianggap sedang bermasalah."""
+
+
+# -------------------------
+# Klasifikasi error
+# -------------------------
+def status_of(error: Exception) -> int | None:
+    if isinstance(error, HttpError):
+        # status_code tidak selalu terisi di HttpError; resp.status selalu ada
+        return getattr(error, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+    if GspreadAPIError is not None and isinstance(error, GspreadAPIError):
+        return getattr(getattr(error, "response", None), "status_code", None)
+    return None
+
+
+def _reason_of(error: Exception) -> str | None:
+    content = getattr(error, "content", None)
+    if content is None and getattr(error, "response", None) is not None:
+        content = getattr(error.response, "content", None)
+    try:
+        body = json.loads(content or b"{}")
+        errors = body.get("error", {}).get("errors") or [{}]
+        return errors[0].get("reason")
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def retry_after_of(error: Exception) -> float | None:
+    headers = getattr(error, "resp", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(error: Exception) -> bool:
+    status = status_of(error)
+    return status == 429 or (status == 403 and _reason_of(error) in _RATE_LIMIT_REASONS)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    return status_of(error) in RETRY_STATUS or is_throttled(error)
+
+
+# -------------------------
+# Circuit breaker
+# -------------------------
+class CircuitBreaker:
+    def __init__(self, api: str, failure_threshold: int = 8, reset_timeout: float = 30.0):
+        self.api = api
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    def before_call(self) -> bool:
+        """Kembalikan True jika panggilan ini adalah percobaan half-open."""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(f"Google API {self.api} sementara tidak tersedia (circuit open).")
+            # half-open: satu panggilan percobaan
+            self._trial_running = True
+            return True
+
+    def release_trial(self):
+        """Percobaan selesai tanpa vonis (misal 429): izinkan percobaan berikutnya."""
+        with self._lock:
+            self._trial_running = False
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            if self._opened_at is not None:
+                self._opened_at = None
+                CIRCUIT_OPEN.set(0, api=self.api)
+
+    def on_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"Circuit breaker {self.api} terbuka setelah {self._failures} kegagalan.")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                CIRCUIT_OPEN.set(1, api=self.api)
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+
+# -------------------------
+# AIMD concurrency limit
+# -------------------------
+class AimdLimiter:
+    def __init__(self, api: str, initial: int = 8, minimum: int = 1, maximum: int = 32,
+                 backoff: float = 0.5):
+        self.api = api
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.backoff = backoff
+        self._limit = float(min(self.maximum, max(self.minimum, initial)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._last_decrease = 0.0
+        CONCURRENCY_LIMIT.set(int(self._limit), api=api)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            if self._limit < self.maximum:
+                # additive increase: kira-kira +1 per "putaran" sukses penuh
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+                CONCURRENCY_LIMIT.set(int(self._limit), api=self.api)
+                self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            now = time.monotonic()
+            # Banyak 429 dari gelombang yang sama hanya menurunkan sekali
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self._limit = max(self.minimum, self._limit * self.backoff)
+            CONCURRENCY_LIMIT.set(int(self._limit), api=self.api)
+
+
+# -------------------------
+# Engine
+# -------------------------
+class RetryEngine:
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 breaker_threshold: int = 8, breaker_reset: float = 30.0,
+                 initial_concurrency: int = 8, max_concurrency: int = 32):
+        self._local = threading.local()
+        self.configure(
+            max_attempts=max_attempts, base_delay=base_delay, max_delay=max_delay,
+            breaker_threshold=breaker_threshold, breaker_reset=breaker_reset,
+            initial_concurrency=initial_concurrency, max_concurrency=max_concurrency,
+        )
+
+    def configure(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                  breaker_threshold: int = 8, breaker_reset: float = 30.0,
+                  initial_concurrency: int = 8, max_concurrency: int = 32):
+        """Set ulang kebijakan (dipanggil sekali saat startup dari env)."""
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self._breaker_args = (int(breaker_threshold), float(breaker_reset))
+        self._limiter_args = (int(initial_concurrency), int(max_concurrency))
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._limiters: dict[str, AimdLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, api: str) -> CircuitBreaker:
+        with self._lock:
+            if api not in self._breakers:
+                self._breakers[api] = CircuitBreaker(api, *self._breaker_args)
+            return self._breakers[api]
+
+    def _limiter(self, api: str) -> AimdLimiter:
+        with self._lock:
+            if api not in self._limiters:
+                initial, maximum = self._limiter_args
+                self._limiters[api] = AimdLimiter(api, initial=initial, maximum=maximum)
+            return self._limiters[api]
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Full jitter: acak 0..min(max_delay, base * 2^attempt)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _held(self) -> set:
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = set()
+        return held
+
+    def call(self, api: str, op: str, fn, attempts: int | None = None, idempotent: bool = True):
+        """
+        Jalankan fn() dengan retry/backoff, circuit breaker dan batas AIMD.
+        idempotent=False: hanya throttle (ditolak sebelum diproses) yang diulang.
+        """
+        attempts = self.max_attempts if attempts is None else max(1, attempts)
+        breaker = self._breaker(api)
+        limiter = self._limiter(api)
+        held = self._held()
+        nested = api in held
+
+        for attempt in range(attempts):
+            trial = breaker.before_call()
+            if not nested:
+                limiter.acquire()
+                held.add(api)
+            try:
+                API_CALLS.inc(api=api, op=op)
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    # Error klien (400/404/...) berarti Google sehat
+                    breaker.on_success()
+                    raise
+                throttled = is_throttled(e)
+                if throttled:
+                    limiter.on_throttle()
+                else:
+                    breaker.on_failure()
+                if attempt + 1 >= attempts or not (idempotent or throttled):
+                    raise
+                delay = self.backoff(attempt, retry_after_of(e))
+                API_RETRIES.inc(api=api, op=op)
+            else:
+                breaker.on_success()
+                limiter.on_success()
+                return result
+            finally:
+                if trial:
+                    # Jalur apa pun (429, error lain) tidak boleh meninggalkan flag trial
+                    breaker.release_trial()
+                if not nested:
+                    held.discard(api)
+                    limiter.release()
+            # Tidur di luar slot konkurensi supaya panggilan lain tetap jalan
+            time.sleep(delay)
+
+    def note_throttle(self, api: str):
+        """Laporkan 429 yang ditangani di luar call() (misal item batch)."""
+        self._limiter(api).on_throttle()
+
+    def info(self) -> dict:
+        with self._lock:
+            apis = sorted(set(self._breakers) | set(self._limiters))
+        return {
+            api: {
+                "concurrency_limit": self._limiter(api).limit,
+                "circuit_open": self._breaker(api).is_open,
+            }
+            for api in apis
+        }
+
+
+# Satu engine untuk seluruh proses (dikonfigurasi dari env di main.py)
+GOOGLE_RETRY = RetryEngine()
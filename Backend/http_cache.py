@@ -0,0 +1,188 @@
+"""
+Helper HTTP untuk endpoint baca: ETag/304, kompresi respons dan JSON cepat.
+
+- weak_etag()/etag_matches(): ETag lemah (tetap valid setelah kompresi)
+  dan pencocokan If-None-Match
+- FastJSONResponse: orjson jika terpasang, selain itu JSONResponse biasa
+- CompressionMiddleware: brotli (jika modul brotli terpasang) atau gzip
+  untuk respons teks/JSON di atas minimum_size; respons stream (NDJSON,
+  CSV) dikompresi per chunk tanpa ditampung utuh. ETag kuat pada respons
+  yang dikompresi diubah menjadi lemah (W/)
+"""
+import hashlib
+import zlib
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # orjson opsional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli opsional: tanpa modul ini hanya gzip
+    brotli = None
+
+_COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+
+
+# -------------------------
+# ETag
+# -------------------------
+def weak_etag(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return f'W/"{h.hexdigest()[:32]}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """If-None-Match cocok (perbandingan lemah: awalan W/ diabaikan)."""
+    if not header:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or opaque in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+# -------------------------
+# JSON
+# -------------------------
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Tipe yang tidak dikenal orjson: pakai encoder bawaan
+            return super().render(content)
+
+
+# -------------------------
+# Kompresi
+# -------------------------
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        out = self._z.compress(data)
+        return out + (self._z.flush() if final else self._z.flush(zlib.Z_SYNC_FLUSH))
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        out = self._c.process(data)
+        return out + (self._c.finish() if final else self._c.flush())
+
+
+def _accepted(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for p in params.split(";"):
+            key, _, value = p.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _compressor(self, scope):
+        accepted = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return lambda: _Brotli(self.brotli_quality)
+        if "gzip" in accepted or "*" in accepted:
+            return lambda: _Gzip(self.gzip_level)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        factory = self._compressor(scope) if scope["type"] == "http" else None
+        if factory is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Ditunda sampai chunk body pertama: ukuran belum diketahui
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=list(start["headers"]))
+                if not _compressible(start["status"], headers) or (not more and len(body) < self.minimum_size):
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = factory()
+                headers["Content-Encoding"] = compressor.name
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # Byte terkompresi != byte asli: ETag kuat jadi lemah
+                    headers["ETag"] = f"W/{etag}"
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more:
+                    data = compressor.chunk(body, final=True)
+                    headers["Content-Length"] = str(len(data))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": headers.raw})
+
+            if compressor is None:
+                await send(message)
+                return
+            await send({
+                "type": "http.response.body",
+                "body": compressor.chunk(body, final=not more),
+                "more_body": more,
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _compressible(status: int, headers: MutableHeaders) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return False
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
@@ -0,0 +1,140 @@
+"""
+Tahap pemrosesan foto (opsional) sebelum upload ke Drive.
+
+- HEIC/HEIF dinormalisasi ke JPEG (butuh pillow-heif)
+- Orientasi EXIF diterapkan lalu seluruh metadata EXIF dibuang
+- Gambar di-encode ulang dengan kualitas tertentu (sisi terpanjang dibatasi)
+- Thumbnail kecil dibuat untuk disimpan di folder _thumbnails toko
+
+Pekerjaan CPU berjalan di ProcessPoolExecutor agar tidak berebut GIL dengan
+thread upload. Jika Pillow tidak terpasang, tahap ini otomatis nonaktif.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow opsional
+    Image = None
+    ImageOps = None
+
+try:
+    from pillow_heif import register_heif_opener
+except ImportError:  # dukungan HEIC opsional
+    register_heif_opener = None
+
+if register_heif_opener is not None:
+    register_heif_opener()
+
+THUMBNAIL_FOLDER = "_thumbnails"
+
+# Format yang diproses; selain ini file diunggah apa adanya
+_PROCESSABLE_MIME = {"image/jpeg", "image/jpg", "image/png", "image/webp", "image/heic", "image/heif"}
+_HEIC_MIME = {"image/heic", "image/heif"}
+
+
+@dataclass
+class ProcessedImage:
+    data: bytes
+    filename: str
+    mime_type: str
+    thumbnail: Optional[bytes] = None
+
+
+def _to_jpeg_name(filename: str) -> str:
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}.jpg"
+
+
+def _process(raw: bytes, filename: str, mime_type: str, quality: int,
+             max_side: int, thumb_side: int) -> tuple[bytes, str, str, Optional[bytes]]:
+    """Dijalankan di process pool: kembalikan (data, filename, mime, thumbnail)."""
+    if mime_type == "image/jpg":
+        mime_type = "image/jpeg"
+    img = Image.open(io.BytesIO(raw))
+    img = ImageOps.exif_transpose(img)
+
+    is_heic = mime_type in _HEIC_MIME
+    keep_png = mime_type == "image/png" and img.mode in ("RGBA", "LA", "P")
+    if not keep_png and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if keep_png:
+        # PNG transparan tetap PNG, cukup dibuang metadata-nya
+        img.save(out, format="PNG", optimize=True)
+        out_name, out_mime = filename, "image/png"
+    else:
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        out_name = _to_jpeg_name(filename) if is_heic or mime_type != "image/jpeg" else filename
+        out_mime = "image/jpeg"
+
+    thumb = None
+    if thumb_side:
+        t = img.convert("RGB") if img.mode != "RGB" else img.copy()
+        t.thumbnail((thumb_side, thumb_side), Image.LANCZOS)
+        tb = io.BytesIO()
+        t.save(tb, format="JPEG", quality=75, optimize=True)
+        thumb = tb.getvalue()
+
+    return out.getvalue(), out_name, out_mime, thumb
+
+
+class ImageProcessor:
+    def __init__(self, enabled: bool = True, workers: int = 2, quality: int = 82,
+                 max_side: int = 2560, thumb_side: int = 320, max_bytes: int = 40 * 1024 * 1024):
+        self.enabled = bool(enabled) and Image is not None
+        self.workers = max(1, int(workers))
+        self.quality = int(quality)
+        self.max_side = int(max_side)
+        self.thumb_side = int(thumb_side)
+        self.max_bytes = int(max_bytes)
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+
+        if enabled and Image is None:
+            print("Pillow tidak terpasang: pemrosesan gambar dinonaktifkan.")
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # forkserver, bukan fork: fork di server multi-thread bisa
+                # mewarisi lock (logging, SSL, sqlite3) yang sedang dipegang
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                )
+            return self._pool
+
+    def accepts(self, mime_type: str, size: int) -> bool:
+        if not self.enabled or size > self.max_bytes:
+            return False
+        if mime_type in _HEIC_MIME and register_heif_opener is None:
+            return False
+        return mime_type in _PROCESSABLE_MIME
+
+    def processed_name(self, filename: str, mime_type: str) -> str | None:
+        """Nama file setelah diproses jika bisa berubah (misal .heic -> .jpg)."""
+        if not self.enabled or mime_type not in _PROCESSABLE_MIME or mime_type in ("image/jpeg", "image/jpg"):
+            return None
+        name = _to_jpeg_name(filename)
+        return name if name != filename else None
+
+    def process(self, raw: bytes, filename: str, mime_type: str) -> ProcessedImage:
+        data, out_name, out_mime, thumb = self._executor().submit(
+            _process, raw, filename, mime_type,
+            self.quality, self.max_side, self.thumb_side,
+        ).result()
+        return ProcessedImage(data=data, filename=out_name, mime_type=out_mime, thumbnail=thumb)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
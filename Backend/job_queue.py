@@ -0,0 +1,179 @@
+"""
+Antrian job lokal (SQLite) untuk proses simpan dokumen di background.
+
+- Payload job ditulis ke folder spool sebagai file JSON, baris job di SQLite
+- Worker thread mengambil job berstatus "queued" satu per satu
+- Progres (kategori_log) disimpan per job untuk endpoint /jobs/{id}
+- Saat start, job "running" milik proses sebelumnya dikembalikan ke antrian
+  sehingga submission tidak hilang ketika proses restart
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable
+
+
+class JobQueue:
+    def __init__(self, db_path: str, spool_dir: str, handler: Callable, workers: int = 2):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        # handler(kind, payload, progress) -> dict hasil
+        self.handler = handler
+        self.workers = max(1, int(workers))
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        with self._db_lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+    # -------------------------
+    # Util
+    # -------------------------
+    def _spool_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._db_lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    # -------------------------
+    # API
+    # -------------------------
+    def submit(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        tmp = self._spool_path(job_id) + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(payload, fh)
+        os.replace(tmp, self._spool_path(job_id))
+
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, kind, now, now),
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        rows = self._execute(
+            "SELECT id, kind, status, progress, result, error, attempts, created_at, updated_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+        if not rows:
+            return None
+        id_, kind, status, progress, result, error, attempts, created_at, updated_at = rows[0]
+        return {
+            "job_id": id_,
+            "kind": kind,
+            "status": status,
+            "progress": json.loads(progress) if progress else {},
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def queue_depth(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")[0][0]
+
+    # -------------------------
+    # Worker
+    # -------------------------
+    def _claim(self) -> tuple[str, str] | None:
+        with self._db_lock, self._db:
+            row = self._db.execute(
+                "SELECT id, kind FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), row[0]),
+            )
+            return row
+
+    def _set_progress(self, job_id: str, progress: dict):
+        self._execute(
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(progress), time.time(), job_id),
+        )
+
+    def _finish(self, job_id: str, status: str, result: dict | None = None, error: str | None = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+        try:
+            os.remove(self._spool_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _run_one(self, job_id: str, kind: str):
+        try:
+            with open(self._spool_path(job_id), "r") as fh:
+                payload = json.load(fh)
+        except FileNotFoundError:
+            self._finish(job_id, "failed", error="Payload job tidak ditemukan di spool.")
+            return
+
+        try:
+            result = self.handler(kind, payload, lambda p: self._set_progress(job_id, p))
+            self._finish(job_id, "done", result=result)
+        except Exception as e:
+            traceback.print_exc()
+            detail = getattr(e, "detail", None) or str(e)
+            self._finish(job_id, "failed", error=str(detail))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=2.0)
+                continue
+            self._run_one(*claimed)
+
+    def start(self):
+        # Job yang terputus saat proses sebelumnya mati diantrikan ulang
+        self._execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),),
+        )
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
@@ -0,0 +1,139 @@
+"""
+Index login dari worksheet Cabang.
+
+Isi sheet Cabang dimuat ke memori sebagai dict dengan kunci EMAIL_SAT
+(lower, trim) -> {CABANG (upper) -> data user}. Login cukup dua lookup
+dict tanpa memanggil Google API. Index dimuat ulang berkala oleh thread
+latar belakang; jika pemuatan gagal, index lama tetap dipakai.
+"""
+import threading
+import time
+import traceback
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+
+def _email_key(value) -> str:
+    return str(value or "").strip().lower()
+
+
+def _upper(value) -> str:
+    return str(value or "").strip().upper()
+
+
+class LoginIndex:
+    def __init__(self, worksheet_getter, refresh_interval: float = 300.0,
+                 allowed_roles: list[str] | None = None):
+        self._get_ws = worksheet_getter
+        self.refresh_interval = refresh_interval
+        self.allowed_roles = {_upper(r) for r in (allowed_roles or [])}
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._by_email: dict[str, dict[str, dict]] | None = None
+        self._loaded_at = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"loads": 0, "load_failures": 0, "lookups": 0, "rows": 0}
+
+    # -------------------------
+    # Pemuatan
+    # -------------------------
+    def _build(self, records: list[dict]) -> dict[str, dict[str, dict]]:
+        index: dict[str, dict[str, dict]] = {}
+        for row in records:
+            email = _email_key(row.get("EMAIL_SAT"))
+            cabang = _upper(row.get("CABANG"))
+            if not email:
+                continue
+            # Baris pertama yang cocok menang (sama seperti scan lama)
+            index.setdefault(email, {}).setdefault(cabang, {
+                "email": email,
+                "nama": str(row.get("NAMA LENGKAP", "")).strip(),
+                "jabatan": _upper(row.get("JABATAN")),
+                "cabang": cabang,
+            })
+        return index
+
+    def reload(self):
+        """Muat ulang index dari sheet sekarang juga."""
+        with self._load_lock:
+            try:
+                ws = self._get_ws()
+                with stage("sheet_read_cabang"):
+                    records = GOOGLE_RETRY.call("sheets", "get_all_records", ws.get_all_records)
+            except Exception:
+                self.stats["load_failures"] += 1
+                raise
+            index = self._build(records)
+            with self._lock:
+                self._by_email = index
+                self._loaded_at = time.time()
+            self.stats["loads"] += 1
+            self.stats["rows"] = len(records)
+
+    def invalidate(self):
+        """Buang index; login berikutnya memuat ulang secara sinkron."""
+        with self._lock:
+            self._by_email = None
+
+    # -------------------------
+    # Lookup
+    # -------------------------
+    def lookup(self, email: str, cabang: str) -> dict | None:
+        """Kembalikan data user untuk pasangan (EMAIL_SAT, CABANG) atau None."""
+        with self._lock:
+            index = self._by_email
+        if index is None:
+            self.reload()
+            with self._lock:
+                index = self._by_email or {}
+        self.stats["lookups"] += 1
+        user = index.get(_email_key(email), {}).get(_upper(cabang))
+        return dict(user) if user else None
+
+    def role_allowed(self, jabatan: str) -> bool:
+        return _upper(jabatan) in self.allowed_roles
+
+    def info(self) -> dict:
+        with self._lock:
+            loaded = self._by_email is not None
+            emails = len(self._by_email or {})
+            loaded_at = self._loaded_at
+        return {
+            "loaded": loaded,
+            "emails": emails,
+            "loaded_at": loaded_at,
+            "refresh_interval": self.refresh_interval,
+            **self.stats,
+        }
+
+    # -------------------------
+    # Background refresh
+    # -------------------------
+    def _loop(self):
+        while not self._stop.wait(timeout=self.refresh_interval):
+            try:
+                self.reload()
+            except Exception:
+                print("Gagal memuat ulang index login, index lama tetap dipakai.")
+                traceback.print_exc()
+
+    def start(self):
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        try:
+            self.reload()
+        except Exception:
+            # Jangan gagalkan startup; dicoba lagi saat login/refresh berikutnya
+            traceback.print_exc()
+        self._thread = threading.Thread(target=self._loop, name="login-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
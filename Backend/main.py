@@ -1,13 +1,10 @@
 from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleRequest
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
-from googleapiclient.errors import HttpError
 from datetime import datetime
-import gspread
 import base64
+import csv
+import hashlib
 import io
 import json
 import traceback
@@ -15,11 +12,57 @@ import os
 import mimetypes
 import time
 import re
+import tempfile
+import threading
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from datetime import datetime, timedelta, timezone
 import uvicorn
+from contextlib import contextmanager
+
+from google_pool import GoogleServicePool
+from sheet_cache import SheetCache
+from sheet_writer import SheetWriteBuffer
+from store_locks import StoreLocks
+from login_index import LoginIndex
+from blocking_executor import BlockingExecutor, ExecutorBusy
+from google_retry import GOOGLE_RETRY, CircuitOpenError, is_retryable, status_of
+from metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_SECONDS,
+    REGISTRY,
+    UPLOAD_BYTES,
+    end_trace,
+    server_timing,
+    stage,
+    start_trace,
+)
+from drive_batch import (
+    copy_files_batch,
+    create_folders_batch,
+    delete_files_batch,
+    escape_name_for_query,
+    get_or_create_folders,
+    grant_public_batch,
+    rename_files_batch,
+)
+from upload_pipeline import TokenBucket, UploadJob, UploadPipeline
+from upload_sessions import UploadSessionError, UploadSessionStore
+from job_queue import JobQueue
+from folder_cache import FolderCache, folders_exist, resolve_tree
+from drive_mirror import DriveMirror
+from image_processing import THUMBNAIL_FOLDER, ImageProcessor
+from store_archive import StoreArchiver
+from media_cache import MediaCache, iter_range
+from http_cache import CompressionMiddleware, FastJSONResponse, etag_matches, weak_etag
+from file_store import (
+    FileStore,
+    file_id_from_link,
+    parse_file_links,
+    render_file_links,
+)
 
 # =========================
 # KONFIGURASI GOOGLE (dari environment)
@@ -33,40 +76,116 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
+# Retry/backoff, circuit breaker & batas konkurensi AIMD untuk semua
+# panggilan Drive/Sheets (lihat google_retry.py)
+GOOGLE_RETRY.configure(
+    max_attempts=int(os.getenv("GOOGLE_RETRY_ATTEMPTS", "5")),
+    base_delay=float(os.getenv("GOOGLE_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("GOOGLE_RETRY_MAX_DELAY", "30")),
+    breaker_threshold=int(os.getenv("GOOGLE_BREAKER_THRESHOLD", "8")),
+    breaker_reset=float(os.getenv("GOOGLE_BREAKER_RESET", "30")),
+    initial_concurrency=int(os.getenv("GOOGLE_CONCURRENCY", "8")),
+    max_concurrency=int(os.getenv("GOOGLE_MAX_CONCURRENCY", "32")),
+)
+
 # =========================
 # UTIL AUTH OAUTH
 # =========================
-def load_credentials():
-    if not os.path.exists("token.json"):
-        raise Exception("token.json tidak ditemukan. Jalankan dulu auth_google.py untuk login.")
+# Satu pool untuk seluruh proses: credential, client gspread dan handle
+# worksheet dipakai ulang; client Drive dibuat sekali per thread.
+POOL = GoogleServicePool("token.json", SCOPES, SPREADSHEET_ID)
+
+
+# Daftar file per toko (kode_toko, kategori, nama) -> ID Drive, ukuran, md5
+FILE_STORE = FileStore(os.getenv("FILE_STORE_DB", "files.sqlite3"))
+
+# Tulisan ke sheet dokumen digabung & dikirim berkala (write-behind).
+# SHEET_FLUSH_INTERVAL=0 -> setiap tulisan langsung dikirim (mode lama).
+SHEET_WRITER = SheetWriteBuffer(
+    lambda: POOL.worksheet(SHEET_NAME),
+    flush_interval=float(os.getenv("SHEET_FLUSH_INTERVAL", "1.0")),
+    max_backoff=float(os.getenv("SHEET_FLUSH_MAX_BACKOFF", "60")),
+    dead_letter_path=os.getenv("SHEET_DEAD_LETTER", "sheet_dead_letter.jsonl"),
+    on_drop=lambda: SHEET_CACHE.invalidate(),
+)
+
+
+def _flush_before_load() -> bool:
+    """Flush tulisan tertunda; False jika masih ada yang gagal terkirim."""
+    SHEET_WRITER.flush()
+    return SHEET_WRITER.pending() == 0
+
+
+# Snapshot sheet dokumen + index kode_toko/cabang (write-through)
+SHEET_CACHE = SheetCache(
+    lambda: POOL.worksheet(SHEET_NAME),
+    ttl=float(os.getenv("SHEET_CACHE_TTL", "30")),
+    before_load=_flush_before_load,
+)
+
+# Lock per kode_toko. STORE_LOCK_DIR diisi -> lock file, berlaku antar worker.
+STORE_LOCKS = StoreLocks(os.getenv("STORE_LOCK_DIR") or None)
+_ROWS_LOCK_KEY = "__rows__"
 
-    with open("token.json", "r") as token_file:
-        creds_data = json.load(token_file)
 
-    creds = Credentials.from_authorized_user_info(creds_data, SCOPES)
+@contextmanager
+def sheet_rows():
+    """
+    Lock struktur baris sheet. Pencarian row index dan penulisan (termasuk
+    write-through ke cache) dilakukan di dalam lock ini sehingga delete lain
+    tidak bisa menggeser baris di antaranya.
+    """
+    with STORE_LOCKS.hold(_ROWS_LOCK_KEY):
+        if STORE_LOCKS.shared:
+            # Worker lain mungkin sudah mengubah sheet: muat ulang dulu
+            SHEET_CACHE.refresh()
+        yield
+        if STORE_LOCKS.shared:
+            SHEET_WRITER.flush(raise_errors=True)
+
+
+# =========================
+# EXECUTOR I/O BLOCKING
+# =========================
+# Handler async tidak memanggil Google API / disk langsung; semua lewat
+# executor terbatas supaya event loop (dan /health) tetap responsif.
+# - DOCUMENT_EXECUTOR: simpan/update/hapus dokumen (lama, banyak upload)
+# - IO_EXECUTOR      : pekerjaan singkat (login, parse JSON, chunk session)
+DOCUMENT_EXECUTOR = BlockingExecutor(
+    "dokumen",
+    workers=int(os.getenv("DOCUMENT_WORKERS", "8")),
+    max_queue=int(os.getenv("DOCUMENT_QUEUE", "32")),
+)
+IO_EXECUTOR = BlockingExecutor(
+    "io",
+    workers=int(os.getenv("IO_WORKERS", "8")),
+    max_queue=int(os.getenv("IO_QUEUE", "128")),
+)
 
-    # Refresh token jika expired
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(GoogleRequest())
-        with open("token.json", "w") as token_file:
-            token_file.write(creds.to_json())
 
-    return creds
+async def run_blocking(executor: BlockingExecutor, fn, *args, **kwargs):
+    """Jalankan fn di executor; antrian penuh -> 503 + Retry-After."""
+    try:
+        return await executor.run(fn, *args, **kwargs)
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Server sedang sibuk, coba lagi sebentar.",
+            headers={"Retry-After": os.getenv("BUSY_RETRY_AFTER", "5")},
+        )
 
 
-def get_services():
-    creds = load_credentials()
-    # cache_discovery=False untuk menghindari warning cache di beberapa environment
-    drive_service = build("drive", "v3", credentials=creds, cache_discovery=False)
-    gspread_client = gspread.authorize(creds)
-    sheet_ws = gspread_client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
-    return drive_service, sheet_ws
+async def read_json(request: Request):
+    """Body JSON (bisa berisi base64 besar) di-parse di luar event loop."""
+    body = await request.body()
+    return await run_blocking(IO_EXECUTOR, json.loads, body)
 
 
 # =========================
 # FASTAPI APP
 # =========================
-app = FastAPI(title="Backend Alfamart (OAuth Multi-Upload Stable)")
+# orjson (jika terpasang) untuk semua respons JSON
+app = FastAPI(title="Backend Alfamart (OAuth Multi-Upload Stable)", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -77,35 +196,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Respons teks/JSON >= COMPRESS_MIN_SIZE byte dikompresi (brotli/gzip)
+if os.getenv("HTTP_COMPRESSION", "1") == "1":
+    app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_SIZE", "1024")))
+
 # =========================
 # HELPERS
 # =========================
-def _escape_name_for_query(name: str) -> str:
-    # Escape tanda petik tunggal untuk query Drive
-    return name.replace("'", "\\'")
+# Peta persisten (parent_id, nama) -> ID folder Drive
+FOLDER_CACHE = FolderCache(os.getenv("FOLDER_CACHE_DB", "folders.sqlite3"))
 
 
 def get_or_create_folder(name: str, parent_id: str, drive_service):
     """Cek folder (by name+parent). Jika belum ada, buat baru."""
-    safe_name = _escape_name_for_query(name)
+    cached = FOLDER_CACHE.get(parent_id, name)
+    if cached:
+        return cached
+
+    folder_id = _find_or_create_folder(name, parent_id, drive_service)
+    FOLDER_CACHE.put(parent_id, name, folder_id)
+    return folder_id
+
+
+# Mirror metadata Drive lokal (changes feed). Default nonaktif: dengan
+# DRIVE_MIRROR_MAX_STALENESS=0 setiap baca tetap satu changes.list, jadi
+# baru menguntungkan jika jendela staleness boleh > 0.
+DRIVE_MIRROR = DriveMirror(
+    os.getenv("DRIVE_MIRROR_DB", "drive_mirror.sqlite3"),
+    drive_factory=lambda: POOL.drive(),
+    root_id=DRIVE_ROOT_ID,
+    interval=float(os.getenv("DRIVE_MIRROR_INTERVAL", "0")),
+    max_staleness=float(os.getenv("DRIVE_MIRROR_MAX_STALENESS", "0")),
+)
+
+
+def _find_or_create_folder(name: str, parent_id: str, drive_service):
+    safe_name = escape_name_for_query(name)
     query = (
         f"name='{safe_name}' and '{parent_id}' in parents and "
         f"mimeType='application/vnd.google-apps.folder' and trashed=false"
     )
-    res = drive_service.files().list(q=query, fields="files(id)").execute()
-    items = res.get("files", [])
-    if items:
-        return items[0]["id"]
-
     folder_metadata = {
         "name": name,
         "mimeType": "application/vnd.google-apps.folder",
         "parents": [parent_id],
     }
-    folder = drive_service.files().create(body=folder_metadata, fields="id").execute()
-    return folder["id"]
+    for attempt in range(2):
+        res = GOOGLE_RETRY.call(
+            "drive", "list", drive_service.files().list(q=query, fields="files(id)").execute
+        )
+        items = res.get("files", [])
+        if items:
+            return items[0]["id"]
+        try:
+            folder = GOOGLE_RETRY.call(
+                "drive", "create_folder",
+                drive_service.files().create(body=folder_metadata, fields="id").execute,
+                idempotent=False,
+            )
+            return folder["id"]
+        except Exception as e:
+            # Create mungkin sudah berhasil di server: cari lagi sebelum membuat ulang
+            if attempt or not is_retryable(e):
+                raise
 
 
 # MIME khusus (DWG/DXF/HEIC)
@@ -138,42 +294,240 @@ def decode_base64_maybe_with_prefix(b64_str: str) -> bytes:
     return base64.b64decode(cleaned, validate=False)
 
 
+# Ukuran chunk upload resumable (harus kelipatan 256 KB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# File >= batas ini diunggah lewat resumable session Drive
+RESUMABLE_THRESHOLD = int(os.getenv("RESUMABLE_THRESHOLD", str(5 * 1024 * 1024)))
+
 def upload_one_file(
     drive_service,
     folder_id: str,
     filename: str,
     mime_type: str,
-    raw_bytes: bytes,
-    max_retry: int = 2
+    raw_bytes: bytes | None = None,
+    max_retry: int | None = None,
+    stream=None,
+    app_properties: dict | None = None,
 ) -> dict:
     """
-    Upload satu file (non-resumable) dengan retry ringan.
+    Upload satu file; retry/backoff lewat GOOGLE_RETRY (max_retry = jumlah
+    retry tambahan, default mengikuti GOOGLE_RETRY_ATTEMPTS).
+    - Sumber: raw_bytes atau stream file-like (misal SpooledTemporaryFile)
+    - File kecil: satu request non-resumable, retry dari awal
+    - File >= RESUMABLE_THRESHOLD: resumable session per UPLOAD_CHUNK_SIZE;
+      saat error 429/5xx chunk diulang dari offset terakhir yang diterima
+      Drive, bukan dari byte nol
     Mengembalikan dict {'id': ..., 'webViewLink': ...}
+    Pengaturan laju antar upload ada di UPLOAD_PIPELINE (token bucket).
     """
-    for attempt in range(max_retry + 1):
-        try:
-            stream = io.BytesIO(raw_bytes)
+    if stream is None:
+        stream = io.BytesIO(raw_bytes)
+    size = stream.seek(0, io.SEEK_END)
+    metadata = {"name": filename, "parents": [folder_id]}
+    if app_properties:
+        metadata["appProperties"] = app_properties
+    fields = "id, webViewLink, thumbnailLink, name, mimeType, md5Checksum, size, appProperties"
+
+    with stage("drive_upload"):
+        uploaded = _upload_content(
+            drive_service, stream, size, metadata, mime_type, fields, max_retry
+        )
+    UPLOAD_BYTES.inc(size)
+    return uploaded
+
+
+def _upload_content(drive_service, stream, size, metadata, mime_type, fields, max_retry):
+    attempts = None if max_retry is None else max_retry + 1
+    if size < RESUMABLE_THRESHOLD:
+        def send():
             stream.seek(0)  # pastikan dari awal
             media = MediaIoBaseUpload(stream, mimetype=mime_type, resumable=False)
-            metadata = {"name": filename, "parents": [folder_id]}
-
-            uploaded = drive_service.files().create(
-                body=metadata,
-                media_body=media,
-                fields="id, webViewLink, thumbnailLink, name, mimeType"
+            return drive_service.files().create(
+                body=metadata, media_body=media, fields=fields
             ).execute()
+        # files.create tidak idempoten: hanya 429 yang diulang otomatis
+        try:
+            return GOOGLE_RETRY.call("drive", "upload", send, attempts=attempts, idempotent=False)
+        except Exception as e:
+            sha256 = (metadata.get("appProperties") or {}).get("sha256")
+            if not sha256 or not is_retryable(e):
+                raise
+            # 5xx / respons hilang: file mungkin sudah terbuat. Cari dulu lewat
+            # sha256 di folder tujuan supaya tidak ada salinan yatim
+            existing = _find_uploaded(drive_service, metadata, sha256, fields)
+            if existing:
+                return existing
+            return GOOGLE_RETRY.call("drive", "upload", send, attempts=attempts, idempotent=False)
+
+    stream.seek(0)
+    media = MediaIoBaseUpload(
+        stream, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True
+    )
+    request = drive_service.files().create(body=metadata, media_body=media, fields=fields)
+    uploaded = None
+    while uploaded is None:
+        # Setelah error, next_chunk berikutnya menanyakan offset terakhir ke
+        # Drive lalu melanjutkan dari sana; jatah retry berlaku per chunk.
+        _, uploaded = GOOGLE_RETRY.call(
+            "drive", "upload_chunk", lambda: request.next_chunk(num_retries=0), attempts=attempts
+        )
+    return uploaded
 
-            return uploaded
-        except HttpError as e:
-            status = getattr(e, "status_code", None)
-            # Retry jika error 429 / 5xx
-            if status in (429, 500, 502, 503, 504) and attempt < max_retry:
-                time.sleep(0.8 * (attempt + 1))
-                continue
-            raise
-        finally:
-            # jeda kecil antar upload untuk stabilitas batch
-            time.sleep(0.25)
+
+def _find_uploaded(drive_service, metadata: dict, sha256: str, fields: str) -> dict | None:
+    query = (
+        f"name='{escape_name_for_query(metadata['name'])}' and "
+        f"'{metadata['parents'][0]}' in parents and trashed=false and "
+        f"appProperties has {{ key='sha256' and value='{sha256}' }}"
+    )
+    res = GOOGLE_RETRY.call(
+        "drive", "list", drive_service.files().list(q=query, fields=f"files({fields})").execute
+    )
+    items = res.get("files", [])
+    return items[0] if items else None
+
+
+# MEDIA_BASE_URL diisi (misal https://api.example.com) -> link file baru
+# lewat proxy /media/{id} dan file tidak perlu dibuka untuk publik.
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "").rstrip("/")
+
+
+def drive_view_link(file_id: str) -> str:
+    return f"https://drive.google.com/uc?export=view&id={file_id}"
+
+
+def direct_link_for_id(file_id: str) -> str:
+    if MEDIA_BASE_URL:
+        return f"{MEDIA_BASE_URL}/media/{file_id}"
+    return drive_view_link(file_id)
+
+
+def file_entry(category: str, filename: str, link: str, thumb_link: str = "",
+               drive_file: dict | None = None) -> dict:
+    """Satu entri file (untuk FILE_STORE dan sel file_links)."""
+    drive_file = drive_file or {}
+    return {
+        "category": category,
+        "filename": filename,
+        "link": link,
+        "thumb_link": thumb_link,
+        "file_id": drive_file.get("id"),
+        "size": int(drive_file["size"]) if drive_file.get("size") else None,
+        "md5": _content_md5(drive_file) if drive_file else None,
+        "sha256": (drive_file.get("appProperties") or {}).get("sha256"),
+    }
+
+
+def thumb_link_for(res) -> str:
+    thumb = res.extra.get("thumbnail") or {}
+    return direct_link_for_id(thumb["id"]) if thumb.get("id") else ""
+
+
+def direct_link_for(uploaded: dict) -> str:
+    """Bentuk direct link (uc?export=view) dari hasil files().create."""
+    link = uploaded.get("webViewLink")
+    if link:
+        fid = link.split("/d/")[-1].split("/")[0]
+        return direct_link_for_id(fid)
+    return uploaded.get("thumbnailLink") or ""
+
+
+# Upload paralel: jumlah worker & laju request ke Drive bisa diatur via env.
+# Kompresi foto + thumbnail (opsional, butuh Pillow; HEIC butuh pillow-heif)
+IMAGE_PROCESSOR = ImageProcessor(
+    enabled=os.getenv("IMAGE_PROCESSING", "0") == "1",
+    workers=int(os.getenv("IMAGE_WORKERS", "2")),
+    quality=int(os.getenv("IMAGE_QUALITY", "82")),
+    max_side=int(os.getenv("IMAGE_MAX_SIDE", "2560")),
+    thumb_side=int(os.getenv("THUMBNAIL_SIZE", "320")),
+)
+
+# Permission publik tidak diberikan per file, tapi digabung lewat
+# grant_public_batch setelah semua upload selesai.
+UPLOAD_PIPELINE = UploadPipeline(
+    drive_factory=lambda: POOL.drive(),
+    upload_fn=upload_one_file,
+    concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+    workers=int(os.getenv("UPLOAD_WORKERS", "16")),
+    limiter=TokenBucket(
+        rate=float(os.getenv("UPLOAD_RATE_PER_SEC", "8")),
+        burst=int(os.getenv("UPLOAD_RATE_BURST", "8")),
+    ),
+    grant_public=False,
+    image_processor=IMAGE_PROCESSOR if IMAGE_PROCESSOR.enabled else None,
+)
+
+
+def run_uploads(drive_service, jobs: list[UploadJob], on_result=None):
+    """Upload paralel lalu grant permission publik dalam batch."""
+    results = UPLOAD_PIPELINE.run(jobs, on_result=on_result)
+    if MEDIA_BASE_URL:
+        # File dibaca lewat proxy /media, tidak perlu izin publik
+        return results
+    file_ids = []
+    for r in results:
+        if r.ok and r.uploaded.get("id"):
+            file_ids.append(r.uploaded["id"])
+            if r.extra.get("thumbnail", {}).get("id"):
+                file_ids.append(r.extra["thumbnail"]["id"])
+    if file_ids:
+        for fid, item in grant_public_batch(drive_service, file_ids).items():
+            if not item.ok:
+                print(f"Tidak bisa set permission publik untuk {fid}: {item.error}")
+    return results
+
+
+def _decoder(b64_str):
+    def load():
+        with stage("base64_decode"):
+            return decode_base64_maybe_with_prefix(b64_str or "")
+    return load
+
+
+# =========================
+# METRICS
+# =========================
+# METRICS_TRACE=1 -> tiap response membawa header Server-Timing berisi
+# durasi per stage (upload, baca sheet, decode, ...) untuk request itu.
+METRICS_TRACE = os.getenv("METRICS_TRACE", "0") == "1"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    HTTP_IN_FLIGHT.inc()
+    token = start_trace() if METRICS_TRACE else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if token is not None:
+            timing = server_timing(end_trace(token))
+            token = None
+            if timing:
+                response.headers["Server-Timing"] = timing
+        return response
+    finally:
+        if token is not None:
+            end_trace(token)
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            # template path (/document/{kode_toko}) supaya label tidak meledak
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+        HTTP_IN_FLIGHT.dec()
+
+
+@app.get("/metrics", response_class=Response)
+def metrics():
+    """Metrik format teks Prometheus."""
+    return Response(
+        content=REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
 # =========================
@@ -183,13 +537,59 @@ def upload_one_file(
 def root():
     return {"message": "Backend Alfamart (OAuth Multi-Upload) aktif!"}
 
+@app.get("/pool/stats")
+def pool_stats():
+    """Counter pool layanan Google (hit, build, refresh token) + executor."""
+    return {
+        "ok": True,
+        "stats": POOL.stats(),
+        "google_api": GOOGLE_RETRY.info(),
+        "drive_mirror": DRIVE_MIRROR.info(),
+        "media_cache": MEDIA_CACHE.info(),
+        "executors": {
+            "dokumen": DOCUMENT_EXECUTOR.info(),
+            "io": IO_EXECUTOR.info(),
+        },
+    }
+
+
+# Index login dari sheet 'Cabang' (EMAIL_SAT -> CABANG -> user), dimuat
+# ulang di background setiap LOGIN_REFRESH_INTERVAL detik.
+LOGIN_INDEX = LoginIndex(
+    lambda: POOL.worksheet("Cabang"),
+    refresh_interval=float(os.getenv("LOGIN_REFRESH_INTERVAL", "300")),
+    allowed_roles=[
+        r for r in os.getenv(
+            "LOGIN_ALLOWED_ROLES",
+            "BRANCH BUILDING SUPPORT,BRANCH BUILDING COORDINATOR",
+        ).split(",") if r.strip()
+    ],
+)
+
+
+@app.get("/auth/login-index")
+def login_index_info():
+    """Status index login (jumlah email, waktu muat terakhir, counter)."""
+    return {"ok": True, "index": LOGIN_INDEX.info()}
+
+
+@app.post("/auth/login-index/refresh")
+def refresh_login_index():
+    """Muat ulang index login sekarang (misal setelah sheet Cabang diubah)."""
+    try:
+        LOGIN_INDEX.reload()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal memuat index login: {e}")
+    return {"ok": True, "index": LOGIN_INDEX.info()}
+
+
 @app.post("/auth/login")
 async def login(request: Request):
     """
     Login berdasarkan EMAIL_SAT (username) dan CABANG (password)
     Hanya jabatan tertentu yang diizinkan login.
     """
-    data = await request.json()
+    data = await read_json(request)
     username = data.get("username", "").strip().lower()
     password = data.get("password", "").strip().upper()
 
@@ -197,38 +597,13 @@ async def login(request: Request):
         raise HTTPException(status_code=400, detail="Username dan password wajib diisi")
 
     try:
-        # 🔹 Buka sheet 'Cabang'
-        drive_service, _ = get_services()
-        gc = gspread.authorize(load_credentials())
-        ws = gc.open_by_key(SPREADSHEET_ID).worksheet("Cabang")
-        records = ws.get_all_records()
-
-        allowed_roles = [
-            "BRANCH BUILDING SUPPORT",
-            "BRANCH BUILDING COORDINATOR",
-        ]
-
-        for row in records:
-            email = str(row.get("EMAIL_SAT", "")).strip().lower()
-            jabatan = str(row.get("JABATAN", "")).strip().upper()
-            cabang = str(row.get("CABANG", "")).strip().upper()
-            nama = str(row.get("NAMA LENGKAP", "")).strip()
-
-            if email == username and password == cabang:
-                if jabatan in allowed_roles:
-                    return {
-                        "ok": True,
-                        "user": {
-                            "email": email,
-                            "nama": nama,
-                            "jabatan": jabatan,
-                            "cabang": cabang,
-                        },
-                    }
-                else:
-                    raise HTTPException(status_code=403, detail="Jabatan tidak diizinkan")
-
-        raise HTTPException(status_code=401, detail="Username atau password salah")
+        # 🔹 Cari di index sheet 'Cabang' (tanpa panggilan Google API)
+        user = await run_blocking(IO_EXECUTOR, LOGIN_INDEX.lookup, username, password)
+        if not user:
+            raise HTTPException(status_code=401, detail="Username atau password salah")
+        if not LOGIN_INDEX.role_allowed(user["jabatan"]):
+            raise HTTPException(status_code=403, detail="Jabatan tidak diizinkan")
+        return {"ok": True, "user": user}
 
     except Exception as e:
         # Biarkan HTTPException lewat tanpa dibungkus ulang
@@ -238,30 +613,620 @@ async def login(request: Request):
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan server: {e}")
 
 
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return int(json.loads(base64.urlsafe_b64decode(padded))["o"])
+
+
+def _project(row: dict, include: set[str] | None, exclude: set[str]) -> dict:
+    # Normalisasi kolom agar tidak masalah dengan kapitalisasi
+    out = {}
+    for k, v in row.items():
+        key = k.lower()
+        if (include is None or key in include) and key not in exclude:
+            out[key] = v
+    return out
+
+
+def _field_set(value: Optional[str]) -> set[str]:
+    return {f.strip().lower() for f in (value or "").split(",") if f.strip()}
+
+
 @app.get("/documents")
-def list_documents(cabang: Optional[str] = Query(None)):
+def list_documents(
+    request: Request,
+    cabang: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = Query(None),
+    exclude: Optional[str] = Query(None),
+):
+    """
+    Daftar dokumen (opsional filter cabang).
+    - limit + offset/cursor: paginasi; next_cursor kosong di halaman terakhir
+    - sort=<kolom>&order=asc|desc: urutan (disimpan per cabang di cache)
+    - fields=kode_toko,nama_toko / exclude=file_links: proyeksi kolom
+    Tanpa limit semua baris dikembalikan seperti sebelumnya.
+    ETag = versi snapshot sheet + query; If-None-Match cocok -> 304.
+    """
     try:
-        _, SHEET = get_services()
-        data = SHEET.get_all_records()
-
-        # Normalisasi kolom agar tidak masalah dengan kapitalisasi
-        for row in data:
-            # ubah key-key yang ada menjadi lowercase semua
-            for k in list(row.keys()):
-                row[k.lower()] = row.pop(k)
-
-        # Jika user kirim filter cabang
-        if cabang:
-            cabang_lower = cabang.strip().lower()
-            filtered = [r for r in data if r.get("cabang", "").strip().lower() == cabang_lower]
-        else:
-            filtered = data
+        # Dicek sebelum membangun halaman: polling tanpa perubahan tidak
+        # menyalin maupun men-serialisasi baris sama sekali
+        etag = weak_etag(SHEET_CACHE.etag, sorted(request.query_params.multi_items()))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if cursor:
+            try:
+                offset = _decode_cursor(cursor)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Cursor tidak valid.")
+
+        # Filter cabang memakai index cache (tanpa scan seluruh sheet)
+        try:
+            total, rows = SHEET_CACHE.page(
+                cabang=cabang,
+                sort=sort,
+                descending=(order == "desc"),
+                offset=offset,
+                limit=limit,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        include = _field_set(fields) or None
+        items = [_project(row, include, _field_set(exclude)) for row in rows]
+
+        response = {"ok": True, "items": items, "total": total}
+        if limit is not None:
+            next_offset = offset + len(items)
+            response["next_cursor"] = _encode_cursor(next_offset) if next_offset < total else None
+        return FastJSONResponse(response, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal membaca spreadsheet: {e}")
+
+
+# =========================
+# EXPORT / IMPORT MASSAL
+# =========================
+# Export dibaca per batch dari cache dan ditulis per blok ~64 KB, jadi
+# memori tetap konstan berapa pun jumlah toko.
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "500"))
+_EXPORT_CHUNK = 64 * 1024
 
-        return {"ok": True, "items": filtered}
 
+def _iter_documents(cabang: Optional[str], sort: Optional[str], descending: bool):
+    offset = 0
+    while True:
+        _, rows = SHEET_CACHE.page(
+            cabang=cabang, sort=sort, descending=descending, offset=offset, limit=EXPORT_BATCH,
+        )
+        yield from rows
+        if len(rows) < EXPORT_BATCH:
+            return
+        offset += len(rows)
+
+
+def _export_ndjson(rows, include, excluded):
+    buf = []
+    size = 0
+    for row in rows:
+        line = json.dumps(_project(row, include, excluded), ensure_ascii=False, default=str) + "\n"
+        buf.append(line)
+        size += len(line)
+        if size >= _EXPORT_CHUNK:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def _export_csv(rows, columns: list[str], include, excluded):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        item = _project(row, include, excluded)
+        writer.writerow([item.get(c, "") for c in columns])
+        if buf.tell() >= _EXPORT_CHUNK:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+@app.get("/documents/export")
+def export_documents(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    cabang: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = Query(None),
+    exclude: Optional[str] = Query(None),
+):
+    """
+    Semua dokumen sebagai stream NDJSON (satu objek per baris) atau CSV.
+    Filter, urutan dan proyeksi kolom sama dengan GET /documents.
+    """
+    # Dicek sebelum stream dimulai: setelah itu status tidak bisa diubah lagi
+    if sort and sort.lower() not in {h.lower() for h in SHEET_CACHE.headers()}:
+        raise HTTPException(status_code=400, detail=f"Kolom sort tidak dikenal: {sort}")
+    try:
+        include = _field_set(fields) or None
+        excluded = _field_set(exclude)
+        rows = _iter_documents(cabang, sort, order == "desc")
+        if format == "csv":
+            columns = [
+                h.lower() for h in SHEET_CACHE.headers()
+                if (include is None or h.lower() in include) and h.lower() not in excluded
+            ]
+            body, media_type = _export_csv(rows, columns, include, excluded), "text/csv; charset=utf-8"
+        else:
+            body, media_type = _export_ndjson(rows, include, excluded), "application/x-ndjson"
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal membaca spreadsheet: {e}")
 
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="documents.{format}"'},
+    )
+
+
+_IMPORT_REQUIRED = ("kode_toko", "nama_toko", "cabang")
+_IMPORT_FIELDS = _IMPORT_REQUIRED + ("luas_sales", "luas_parkir", "luas_gudang")
+
+
+def _parse_import(body: bytes, content_type: str) -> list:
+    """Body import: CSV (header), NDJSON, atau JSON list / {"items": [...]}."""
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type:
+        return list(csv.DictReader(io.StringIO(text)))
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    data = json.loads(text)
+    return data.get("items") if isinstance(data, dict) else data
+
+
+def impor_dokumen(records: list, skip_existing: bool = False) -> dict:
+    """
+    Daftarkan banyak toko sekaligus (metadata saja, tanpa file):
+    1. Semua baris divalidasi & kode_toko dicek ke index cache dalam satu lock
+    2. Folder cabang lalu folder toko per cabang dibuat lewat batch Drive
+    3. Semua baris masuk antrian tulis berurutan -> satu append_rows
+    Ada error validasi -> tidak ada yang ditulis.
+    """
+    errors: list[dict] = []
+    valid: list[dict] = []
+    seen: set[str] = set()
+    for i, rec in enumerate(records, start=1):
+        if not isinstance(rec, dict):
+            errors.append({"baris": i, "error": "Format baris tidak valid."})
+            continue
+        rec = {
+            str(k).strip().lower(): "" if v is None else str(v).strip()
+            for k, v in rec.items() if k is not None
+        }
+        missing = [f for f in _IMPORT_REQUIRED if not rec.get(f)]
+        if missing:
+            errors.append({"baris": i, "error": f"Kolom wajib kosong: {', '.join(missing)}."})
+            continue
+        key = rec["kode_toko"].upper()
+        if key in seen:
+            errors.append({"baris": i, "kode_toko": rec["kode_toko"], "error": "Kode toko ganda di file import."})
+            continue
+        seen.add(key)
+        valid.append({f: rec.get(f, "") for f in _IMPORT_FIELDS} | {"_baris": i})
+
+    existing = SHEET_CACHE.existing(seen)
+    skipped = [r["kode_toko"] for r in valid if r["kode_toko"].upper() in existing]
+    if skipped and not skip_existing:
+        errors.extend(
+            {"baris": r["_baris"], "kode_toko": r["kode_toko"], "error": "Kode toko sudah terdaftar."}
+            for r in valid if r["kode_toko"].upper() in existing
+        )
+    if errors:
+        errors.sort(key=lambda e: e["baris"])
+        return {"ok": False, "message": f"{len(errors)} baris tidak valid, tidak ada yang diimpor.",
+                "errors": errors}
+    valid = [r for r in valid if r["kode_toko"].upper() not in existing]
+
+    drive_service = POOL.drive()
+    by_cabang: dict[str, list[dict]] = {}
+    for r in valid:
+        by_cabang.setdefault(r["cabang"], []).append(r)
+    toko_folders: dict[str, str] = {}
+    with stage("import_folders"):
+        cabang_folders = get_or_create_folders(drive_service, list(by_cabang), DRIVE_ROOT_ID, cache=FOLDER_CACHE)
+        for cabang, recs in by_cabang.items():
+            names = {r["kode_toko"]: _toko_folder_name(r["kode_toko"], r["nama_toko"]) for r in recs}
+            created = get_or_create_folders(
+                drive_service, list(names.values()), cabang_folders[cabang], cache=FOLDER_CACHE,
+            )
+            for kode, name in names.items():
+                toko_folders[kode] = created[name]
+
+    with sheet_rows():
+        # Bisa saja toko yang sama baru disimpan lewat endpoint lain
+        raced = SHEET_CACHE.existing(r["kode_toko"] for r in valid)
+        skipped += [r["kode_toko"] for r in valid if r["kode_toko"].upper() in raced]
+        rows = [
+            _sheet_row(r, toko_folders[r["kode_toko"]], [])
+            for r in valid if r["kode_toko"].upper() not in raced
+        ]
+        with SHEET_CACHE.writing():
+            SHEET_WRITER.append_many(rows)
+            for row_values in rows:
+                SHEET_CACHE.on_append(row_values)
+
+    print(f"Import selesai: {len(rows)} toko baru, {len(skipped)} dilewati.")
+    return {
+        "ok": True,
+        "message": f"{len(rows)} toko berhasil diimpor",
+        "imported": len(rows),
+        "skipped": skipped,
+    }
+
+
+@app.post("/documents/import")
+async def import_documents(request: Request, skip_existing: bool = Query(False)):
+    """
+    Import massal data toko (tanpa file). Body salah satu dari:
+    - text/csv            : header kode_toko,nama_toko,cabang,luas_sales,...
+    - application/x-ndjson: satu objek JSON per baris
+    - application/json    : list objek atau {"items": [...]}
+    ?skip_existing=true: kode toko yang sudah terdaftar dilewati, bukan error.
+    """
+    try:
+        body = await request.body()
+        try:
+            records = await run_blocking(
+                IO_EXECUTOR, _parse_import, body, request.headers.get("content-type", ""),
+            )
+        except (ValueError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f"Format file import tidak valid: {e}")
+        if not isinstance(records, list) or not records:
+            raise HTTPException(status_code=400, detail="Tidak ada data toko untuk diimpor.")
+
+        result = await run_blocking(DOCUMENT_EXECUTOR, impor_dokumen, records, skip_existing)
+        if not result["ok"]:
+            return JSONResponse(status_code=400, content=result)
+        return result
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print("=== ERROR DETAIL ===")
+        traceback.print_exc()
+        print("====================")
+        raise HTTPException(status_code=500, detail=f"Gagal mengimpor dokumen: {e}")
+
+
+# Upload session client (chunk bisa dilanjutkan setelah koneksi putus)
+UPLOAD_SESSIONS = UploadSessionStore(
+    os.getenv("UPLOAD_SESSION_DIR", "upload_sessions"),
+    ttl_seconds=int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600))),
+    max_size=int(os.getenv("UPLOAD_SESSION_MAX_SIZE", "0")),
+)
+
+
+def _has_content(f: dict) -> bool:
+    return bool(f.get("data") or f.get("upload_id") or f.get("stream") is not None)
+
+
+def _loader_for(f: dict):
+    """Sumber isi file: stream (multipart), upload session, atau base64."""
+    if f.get("stream") is not None:
+        return lambda: f["stream"]
+    if f.get("upload_id"):
+        return lambda: UPLOAD_SESSIONS.open_completed(f["upload_id"])
+    return _decoder(f.get("data"))
+
+
+def _close_if_stream(source):
+    if not isinstance(source, (bytes, bytearray)) and hasattr(source, "close"):
+        source.close()
+
+
+def _load_with_md5(f: dict):
+    """
+    Muat isi file sekali lalu hitung md5-nya (format sama dengan
+    md5Checksum Drive). Kembalikan (source, md5_hex); source bisa langsung
+    dipakai sebagai hasil UploadJob.load.
+    """
+    source = _loader_for(f)()
+    if isinstance(source, (bytes, bytearray)):
+        return source, hashlib.md5(source).hexdigest()
+    h = hashlib.md5()
+    source.seek(0)
+    for block in iter(lambda: source.read(1024 * 1024), b""):
+        h.update(block)
+    source.seek(0)
+    return source, h.hexdigest()
+
+
+def _content_md5(drive_file: dict) -> str | None:
+    """md5 isi asli file Drive (sebelum kompresi gambar, jika ada)."""
+    return (drive_file.get("appProperties") or {}).get("src_md5") or drive_file.get("md5Checksum")
+
+
+def _stored_files(kode_toko: str, record: dict) -> list[dict]:
+    """
+    Daftar file toko dari FILE_STORE. Toko lama yang belum punya mirror
+    diisi sekali dari sel file_links spreadsheet.
+    """
+    if not FILE_STORE.has_store(kode_toko):
+        parsed = parse_file_links(record.get("file_links", ""))
+        if parsed:
+            FILE_STORE.replace_all(kode_toko, parsed)
+    return FILE_STORE.files_for(kode_toko)
+
+
+def _dedup_source(f: dict) -> dict | None:
+    """
+    Entri tanpa isi tetapi ber-sha256 (hasil pre-flight): cari file Drive
+    dengan isi yang sama di FILE_STORE (toko mana pun).
+    """
+    sha256 = (f.get("sha256") or "").strip().lower()
+    if not sha256 or _has_content(f):
+        return None
+    return FILE_STORE.find_by_hash(sha256)
+
+
+_COPY_FIELDS = "id, webViewLink, thumbnailLink, name, mimeType, md5Checksum, size, appProperties"
+
+
+def copy_known_files(drive_service, copies: dict) -> dict:
+    """
+    Tempatkan isi yang sudah ada di Drive lewat files.copy (server-side,
+    tanpa upload ulang) lalu beri akses publik dalam batch.
+    copies: {key: (source_row, folder_id, filename)}.
+    Kembalikan {key: file Drive hasil salinan atau None jika gagal}.
+    """
+    if not copies:
+        return {}
+    items = copy_files_batch(drive_service, {
+        key: {
+            "file_id": src["file_id"],
+            "name": filename,
+            "parent_id": folder_id,
+            "app_properties": {"sha256": src["sha256"]},
+        }
+        for key, (src, folder_id, filename) in copies.items()
+    }, fields=_COPY_FIELDS)
+    copied = {}
+    for key, item in items.items():
+        if item.ok:
+            copied[key] = item.response
+        else:
+            print(f"Gagal menyalin {copies[key][2]} dari file yang sudah ada: {item.error}")
+            copied[key] = None
+    if MEDIA_BASE_URL:
+        return copied
+    granted = grant_public_batch(drive_service, [c["id"] for c in copied.values() if c])
+    for fid, item in granted.items():
+        if not item.ok:
+            print(f"Tidak bisa set permission publik untuk {fid}: {item.error}")
+    return copied
+
+
+def _thumb_link(thumbs_by_file_id: dict, file_id: str) -> str:
+    thumb = thumbs_by_file_id.get(file_id)
+    return direct_link_for_id(thumb["id"]) if thumb else ""
+
+
+def _progress_tracker(kategori_log: dict, progress):
+    """
+    Callback on_result untuk pipeline: hitung file yang sudah diproses per
+    kategori lalu laporkan salinan kategori_log ke `progress`.
+    """
+    lock = threading.Lock()
+
+    def on_result(res):
+        with lock:
+            kategori_log[res.job.category]["selesai"] += 1
+            snapshot = {cat: dict(info) for cat, info in kategori_log.items()}
+        if progress is not None:
+            progress(snapshot)
+
+    return on_result
+
+
+def _toko_folder_name(kode_toko: str, nama_toko: str) -> str:
+    return f"{kode_toko}_{nama_toko}".replace("/", "-")
+
+
+def _sheet_row(payload: dict, toko_folder: str, file_links: list[dict]) -> list:
+    """Urutan kolom sheet dokumen untuk satu toko baru."""
+    return [
+        payload.get("kode_toko"),
+        payload.get("nama_toko"),
+        payload.get("cabang"),
+        payload.get("luas_sales", ""),
+        payload.get("luas_parkir", ""),
+        payload.get("luas_gudang", ""),
+        f"https://drive.google.com/drive/folders/{toko_folder}",
+        render_file_links(file_links),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    ]
+
+
+def simpan_dokumen(payload: dict, progress=None) -> dict:
+    """
+    Inti proses simpan dokumen baru (folder Drive, upload, append sheet).
+    Dipakai bersama oleh endpoint JSON base64, multipart dan job queue.
+    progress(kategori_log) dipanggil setiap ada file yang selesai diproses.
+    """
+    kode_toko = payload.get("kode_toko")
+    if not all([kode_toko, payload.get("nama_toko"), payload.get("cabang")]):
+        raise HTTPException(status_code=400, detail="Data toko belum lengkap.")
+
+    # Submission kode_toko yang sama diproses bergantian (cek duplikat aman)
+    with STORE_LOCKS.hold(kode_toko):
+        return _simpan_dokumen(payload, progress)
+
+
+def _simpan_dokumen(payload: dict, progress=None) -> dict:
+    kode_toko = payload.get("kode_toko")
+    nama_toko = payload.get("nama_toko")
+    cabang = payload.get("cabang")
+    files = payload.get("files", [])
+
+    # === 1️⃣ Ambil layanan Drive & Sheet ===
+    drive_service = POOL.drive()
+
+    # === 2️⃣ Validasi kode_toko unik sebelum proses upload ===
+    try:
+        if SHEET_CACHE.find(kode_toko):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Kode toko '{kode_toko}' sudah terdaftar."
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Gagal membaca spreadsheet untuk validasi duplikat: {e}")
+
+    # === 3️⃣ Lanjutkan proses upload ke Drive ===
+    # Semua folder kategori (+ folder thumbnail) dicari/dibuat dalam satu batch
+    folder_names = [(f.get("category") or "lainnya").strip() or "lainnya" for f in files]
+    if IMAGE_PROCESSOR.enabled:
+        folder_names.append(THUMBNAIL_FOLDER)
+    for attempt in range(2):
+        try:
+            cabang_folder = get_or_create_folder(cabang, DRIVE_ROOT_ID, drive_service)
+            toko_name = _toko_folder_name(kode_toko, nama_toko)
+            toko_cached = toko_name in FOLDER_CACHE.children(cabang_folder)
+            toko_folder = get_or_create_folder(toko_name, cabang_folder, drive_service)
+            cached_ids = set(FOLDER_CACHE.children(toko_folder).values())
+            category_folders: dict[str, str] = get_or_create_folders(
+                drive_service, folder_names, toko_folder, cache=FOLDER_CACHE,
+            )
+        except Exception as e:
+            if attempt or status_of(e) != 404:
+                raise
+            # ID folder dari cache sudah tidak ada di Drive (folder cabang/toko
+            # dihapus): lupakan cabang beserta folder toko di bawahnya, ulangi sekali
+            print(f"Folder cache basi untuk cabang {cabang}, dicari ulang: {e}")
+            FOLDER_CACHE.forget(DRIVE_ROOT_ID, cabang)
+            continue
+        # ID dari cache belum pernah dicek ke Drive: satu request memastikan
+        # folder toko & kategori yang diambil dari cache masih ada. Folder
+        # yang baru dibuat tidak ikut dicek (list Drive bisa terlambat).
+        to_check = [fid for fid in category_folders.values() if fid in cached_ids]
+        if attempt or not (toko_cached or to_check) \
+                or folders_exist(drive_service, toko_folder, to_check):
+            break
+        print(f"Folder cache basi untuk toko {kode_toko}, dicari ulang.")
+        FOLDER_CACHE.forget(toko_folder)
+        FOLDER_CACHE.forget(DRIVE_ROOT_ID, cabang)
+    thumb_folder = category_folders.get(THUMBNAIL_FOLDER)
+    file_links: list[dict] = []
+    kategori_log: dict[str, dict] = {}
+    jobs: list[UploadJob] = []
+    copies: dict[int, tuple] = {}
+    missing: list[str] = []
+
+    for idx, f in enumerate(files, start=1):
+        category = (f.get("category") or "lainnya").strip() or "lainnya"
+        filename = f.get("filename") or f"file_{idx}"
+        if f.get("sha256") and not _has_content(f):
+            # Isi dikenal dari pre-flight: salin dari Drive, bukan upload
+            src = _dedup_source(f)
+            if not src:
+                missing.append(f"{category}/{filename}")
+                continue
+            copies[idx] = (src, category_folders[category], filename)
+
+        if category not in kategori_log:
+            kategori_log[category] = {"total": 0, "selesai": 0, "sukses": 0}
+        kategori_log[category]["total"] += 1
+        if idx in copies:
+            continue
+
+        jobs.append(UploadJob(
+            category=category,
+            filename=filename,
+            mime_type=guess_mime(filename, f.get("type")),
+            folder_id=category_folders[category],
+            load=_loader_for(f),
+            close_source=bool(f.get("upload_id")),
+            thumb_folder_id=thumb_folder,
+        ))
+
+    # Decode, upload & permission berjalan paralel
+    if progress is not None:
+        progress({cat: dict(info) for cat, info in kategori_log.items()})
+    for res in run_uploads(drive_service, jobs, on_result=_progress_tracker(kategori_log, progress)):
+        category, filename = res.job.category, res.job.filename
+        if not res.ok:
+            if res.stage == "decode":
+                print(f"Gagal decode base64 untuk {filename}: {res.error}")
+            else:
+                print(f"Gagal upload {filename} → {category}: {res.error}")
+            continue
+
+        direct_link = direct_link_for(res.uploaded)
+        if direct_link:
+            file_links.append(file_entry(category, filename, direct_link, thumb_link_for(res), res.uploaded))
+            kategori_log[category]["sukses"] += 1
+            print(f"Uploaded: {filename} → {category}")
+        else:
+            print(f"{filename} diunggah tetapi tidak memiliki link valid.")
+
+    deduplicated = 0
+    for idx, copied in copy_known_files(drive_service, copies).items():
+        src, _, filename = copies[idx]
+        category = (files[idx - 1].get("category") or "lainnya").strip() or "lainnya"
+        kategori_log[category]["selesai"] += 1
+        if copied:
+            file_links.append(file_entry(
+                category, filename, direct_link_for(copied), src.get("thumb_link") or "", copied
+            ))
+            kategori_log[category]["sukses"] += 1
+            deduplicated += 1
+            print(f"Disalin (isi sudah ada): {filename} → {category}")
+        else:
+            # Client tidak mengirim isi karena pre-flight: harus dikirim ulang
+            missing.append(f"{category}/{filename}")
+    for label in missing:
+        print(f"Isi {label} tidak tersedia (hash tidak dikenal / gagal salin), file dilewati.")
+
+    print("\n========== HASIL UPLOAD ==========")
+    for cat, info in kategori_log.items():
+        print(f"📂 {cat}: {info['sukses']}/{info['total']} sukses")
+    print("=================================\n")
+
+    # === 4️⃣ Simpan metadata ke Sheet ===
+    row_values = _sheet_row(payload, toko_folder, file_links)
+    with sheet_rows(), SHEET_CACHE.writing():
+        if SHEET_CACHE.find(kode_toko):
+            raise HTTPException(status_code=400, detail=f"Kode toko '{kode_toko}' sudah terdaftar.")
+        SHEET_WRITER.append(row_values)
+        SHEET_CACHE.on_append(row_values)
+    FILE_STORE.replace_all(kode_toko, file_links)
+    if progress is not None:
+        progress(kategori_log)
+
+    return {
+        "ok": True,
+        "message": f"{len(file_links)} file berhasil diunggah ke Google Drive",
+        "folder_link": f"https://drive.google.com/drive/folders/{toko_folder}",
+        "files_uploaded": len(file_links),
+        "files_deduplicated": deduplicated,
+        "missing": missing,
+    }
+
 
 @app.post("/save-document-base64/")
 async def save_document_base64(request: Request):
@@ -279,133 +1244,111 @@ async def save_document_base64(request: Request):
         ...
       ]
     }
+
+    Query ?mode=async: payload disimpan ke antrian lokal dan langsung
+    dibalas 202 + job_id; progres dicek lewat GET /jobs/{job_id}.
     """
     try:
-        payload = await request.json()
+        payload = await read_json(request)
+        if request.query_params.get("mode") == "async":
+            if not all([payload.get("kode_toko"), payload.get("nama_toko"), payload.get("cabang")]):
+                raise HTTPException(status_code=400, detail="Data toko belum lengkap.")
+            job_id = await run_blocking(IO_EXECUTOR, JOB_QUEUE.submit, "simpan", payload)
+            return JSONResponse(
+                status_code=202,
+                content={"ok": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"},
+            )
+        return await run_blocking(DOCUMENT_EXECUTOR, simpan_dokumen, payload)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print("=== ERROR DETAIL ===")
+        traceback.print_exc()
+        print("====================")
+        raise HTTPException(status_code=500, detail=f"Gagal menyimpan dokumen: {e}")
 
-        kode_toko = payload.get("kode_toko")
-        nama_toko = payload.get("nama_toko")
-        cabang = payload.get("cabang")
-        luas_sales = payload.get("luas_sales", "")
-        luas_parkir = payload.get("luas_parkir", "")
-        luas_gudang = payload.get("luas_gudang", "")
-        files = payload.get("files", [])
 
-        if not all([kode_toko, nama_toko, cabang]):
-            raise HTTPException(status_code=400, detail="Data toko belum lengkap.")
+# =========================
+# JOB QUEUE (submission async)
+# =========================
+def _handle_job(kind: str, payload: dict, progress):
+    if kind == "simpan":
+        return simpan_dokumen(payload, progress=progress)
+    raise ValueError(f"Jenis job tidak dikenal: {kind}")
 
-        # === 1️⃣ Ambil layanan Drive & Sheet ===
-        drive_service, SHEET = get_services()
 
-        # === 2️⃣ Validasi kode_toko unik sebelum proses upload ===
-        try:
-            existing_records = SHEET.get_all_records()
-            for row in existing_records:
-                existing_code = str(row.get("kode_toko") or row.get("KodeToko") or "").strip().upper()
-                if existing_code == kode_toko.strip().upper():
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Kode toko '{kode_toko}' sudah terdaftar."
-                    )
-        except HTTPException:
-            raise
-        except Exception as e:
-            print(f"Gagal membaca spreadsheet untuk validasi duplikat: {e}")
+JOB_QUEUE = JobQueue(
+    db_path=os.getenv("JOB_DB_PATH", "jobs.sqlite3"),
+    spool_dir=os.getenv("JOB_SPOOL_DIR", "job_spool"),
+    handler=_handle_job,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+)
 
-        # === 3️⃣ Lanjutkan proses upload ke Drive ===
-        cabang_folder = get_or_create_folder(cabang, DRIVE_ROOT_ID, drive_service)
-        toko_folder_name = f"{kode_toko}_{nama_toko}".replace("/", "-")
-        toko_folder = get_or_create_folder(toko_folder_name, cabang_folder, drive_service)
 
-        category_folders: dict[str, str] = {}
-        file_links: list[str] = []
-        kategori_log: dict[str, dict] = {}
+@app.on_event("startup")
+def start_background_workers():
+    SHEET_WRITER.start()
+    JOB_QUEUE.start()
+    LOGIN_INDEX.start()
+    DRIVE_MIRROR.start()
 
-        for idx, f in enumerate(files, start=1):
-            category = (f.get("category") or "lainnya").strip() or "lainnya"
-            if category not in category_folders:
-                category_folders[category] = get_or_create_folder(category, toko_folder, drive_service)
-                kategori_log[category] = {"total": 0, "sukses": 0}
-            kategori_log[category]["total"] += 1
 
-            category_folder_id = category_folders[category]
-            filename = f.get("filename") or f"file_{idx}"
-            mime_type = guess_mime(filename, f.get("type"))
+@app.on_event("shutdown")
+def stop_background_workers():
+    JOB_QUEUE.stop()
+    LOGIN_INDEX.stop()
+    DRIVE_MIRROR.stop()
+    # Tunggu request yang masih berjalan sebelum flush terakhir
+    DOCUMENT_EXECUTOR.shutdown()
+    IO_EXECUTOR.shutdown()
+    UPLOAD_PIPELINE.shutdown()
+    IMAGE_PROCESSOR.shutdown()
+    ARCHIVER.shutdown()
+    # flush-on-shutdown: sisa tulisan sheet dikirim sebelum proses berhenti
+    SHEET_WRITER.stop()
 
-            # Decode base64
-            try:
-                raw = decode_base64_maybe_with_prefix(f.get("data") or "")
-            except Exception as e:
-                print(f"Gagal decode base64 untuk {filename}: {e}")
-                continue
 
-            try:
-                uploaded = upload_one_file(
-                    drive_service=drive_service,
-                    folder_id=category_folder_id,
-                    filename=filename,
-                    mime_type=mime_type,
-                    raw_bytes=raw,
-                    max_retry=2
-                )
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status job + progres per kategori (total/selesai/sukses)."""
+    job = JOB_QUEUE.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan.")
+    return {"ok": True, **job}
 
-                file_id = uploaded.get("id")
-                link = uploaded.get("webViewLink")
-                thumb = uploaded.get("thumbnailLink")
-
-                # Set permission publik
-                if file_id:
-                    try:
-                        drive_service.permissions().create(
-                            fileId=file_id,
-                            body={"type": "anyone", "role": "reader"},
-                            fields="id"
-                        ).execute()
-                    except Exception as perm_err:
-                        print(f"Tidak bisa set permission publik untuk {filename}: {perm_err}")
-
-                # Bentuk direct link
-                direct_link = ""
-                if link:
-                    fid = link.split("/d/")[-1].split("/")[0]
-                    direct_link = f"https://drive.google.com/uc?export=view&id={fid}"
-                elif thumb:
-                    direct_link = thumb
-
-                if direct_link:
-                    file_links.append(f"{category}|{filename}|{direct_link}")
-                    kategori_log[category]["sukses"] += 1
-                    print(f"Uploaded: {filename} → {category}")
-                else:
-                    print(f"{filename} diunggah tetapi tidak memiliki link valid.")
-            except Exception as e:
-                print(f"Gagal upload {filename} → {category}: {e}")
-
-        print("\n========== HASIL UPLOAD ==========")
-        for cat, info in kategori_log.items():
-            print(f"📂 {cat}: {info['sukses']}/{info['total']} sukses")
-        print("=================================\n")
-
-        # === 4️⃣ Simpan metadata ke Sheet ===
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        SHEET.append_row([
-            kode_toko,
-            nama_toko,
-            cabang,
-            luas_sales,
-            luas_parkir,
-            luas_gudang,
-            f"https://drive.google.com/drive/folders/{toko_folder}",
-            ", ".join(file_links),
-            now,
-        ])
 
-        return {
-            "ok": True,
-            "message": f"{len(file_links)} file berhasil diunggah ke Google Drive",
-            "folder_link": f"https://drive.google.com/drive/folders/{toko_folder}",
-            "files_uploaded": len(file_links),
-        }
+# Field form yang berisi metadata toko; part file lain dianggap kategori
+_MULTIPART_META_FIELDS = ("kode_toko", "nama_toko", "cabang", "luas_sales", "luas_parkir", "luas_gudang")
+
+
+@app.post("/save-document-multipart/")
+async def save_document_multipart(request: Request):
+    """
+    Versi streaming dari /save-document-base64/ (multipart/form-data).
+    - Field teks: kode_toko, nama_toko, cabang, luas_sales, luas_parkir, luas_gudang
+    - Part file: nama field = kategori (misal "fotoAsal"), boleh berulang
+
+    Tiap part di-spool ke SpooledTemporaryFile oleh parser multipart lalu
+    dialirkan langsung ke MediaIoBaseUpload (resumable, per chunk), jadi
+    pemakaian memori tidak bergantung pada besar total batch.
+    """
+    form = None
+    try:
+        form = await request.form()
+        payload = {key: str(form.get(key) or "") for key in _MULTIPART_META_FIELDS}
+        files = []
+        for field_name, value in form.multi_items():
+            if field_name in _MULTIPART_META_FIELDS or isinstance(value, str):
+                continue
+            files.append({
+                "category": field_name,
+                "filename": value.filename,
+                "type": value.content_type,
+                "stream": value.file,
+            })
+        payload["files"] = files
+        return await run_blocking(DOCUMENT_EXECUTOR, simpan_dokumen, payload)
 
     except HTTPException as e:
         raise e
@@ -414,202 +1357,490 @@ async def save_document_base64(request: Request):
         traceback.print_exc()
         print("====================")
         raise HTTPException(status_code=500, detail=f"Gagal menyimpan dokumen: {e}")
+    finally:
+        if form is not None:
+            await form.close()
 
 
-@app.put("/document/{kode_toko}")
-async def update_document(kode_toko: str, request: Request):
+# =========================
+# PRE-FLIGHT HASH (deduplikasi)
+# =========================
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@app.post("/uploads/preflight")
+async def upload_preflight(request: Request):
     """
-    Versi lengkap:
-    - File dikenali unik per kategori (kategori + filename)
-    - File yang dihapus hanya dihapus di kategori sama
-    - File baru disimpan di folder kategori yang sesuai
-    - Validasi: tidak boleh upload file dengan nama sama di kategori yang sama
+    Cek isi file mana yang sudah tersimpan sebelum mengirim byte.
+    Payload: { "files": [ { "category": "...", "filename": "...",
+                            "size": 123, "sha256": "<hex>" }, ... ] }
+    Balasan per file: "stored": true -> kirim entri tanpa "data" tetapi
+    dengan "sha256" yang sama ke /save-document-base64/ atau
+    PUT /document/{kode_toko}; server menyalin file Drive yang sudah ada.
+    "stored": false -> kirim isi seperti biasa.
+    """
+    data = await read_json(request)
+    files = data.get("files") or []
+    hashes = [(f.get("sha256") or "").strip().lower() for f in files]
+    invalid = [h for h in hashes if not _SHA256_RE.match(h)]
+    if invalid:
+        raise HTTPException(status_code=400, detail="sha256 harus 64 karakter hex.")
+
+    known = await run_blocking(IO_EXECUTOR, FILE_STORE.known_hashes, hashes)
+    result = [
+        {
+            "category": f.get("category"),
+            "filename": f.get("filename"),
+            "size": f.get("size"),
+            "sha256": h,
+            "stored": h in known,
+        }
+        for f, h in zip(files, hashes)
+    ]
+    stored = sum(1 for r in result if r["stored"])
+    return {
+        "ok": True,
+        "files": result,
+        "stored": stored,
+        "missing": len(result) - stored,
+        "bytes_saved": sum(int(r["size"] or 0) for r in result if r["stored"]),
+    }
+
+
+# =========================
+# UPLOAD SESSION (chunk resumable dari client)
+# =========================
+def _session_error(e: UploadSessionError):
+    detail = {"message": e.message}
+    if e.offset is not None:
+        detail["offset"] = e.offset
+    return HTTPException(status_code=e.status_code, detail=detail)
+
+
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+@app.post("/upload-sessions")
+async def create_upload_session(request: Request):
+    """
+    Buat upload session.
+    Payload: { "filename": "denah.dwg", "size": 123456, "type": "...",
+               "category": "denah", "sha256": "<opsional>" }
+    File yang sudah difinalisasi dirujuk dengan "upload_id" pada entri files
+    di /save-document-base64/ atau PUT /document/{kode_toko}.
     """
     try:
-        data = await request.json()
-        files = data.get("files", [])
-
-        drive_service, SHEET = get_services()
-
-        # 🔹 Validasi duplikat file berdasarkan kategori + nama
-        seen = set()
-        duplicates = []
-        for f in files:
-            category = (f.get("category") or "pendukung").strip() or "pendukung"
-            filename = f.get("filename")
-            if not filename:
-                continue
-            key = (category.lower(), filename.lower())
-            if key in seen:
-                duplicates.append(f"{category}/{filename}")
-            seen.add(key)
-
-        if duplicates:
-            return {
-                "ok": False,
-                "message": f"Tidak boleh upload file duplikat pada kategori yang sama! Duplikat ditemukan: {', '.join(duplicates)}"
-            }
-
-        # 🔹 Cari data toko
-        records = SHEET.get_all_records()
-        row_index = next(
-            (i + 2 for i, r in enumerate(records)
-             if str(r.get("kode_toko", "")).strip() == str(kode_toko).strip()),
-            None
+        data = await read_json(request)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body JSON tidak valid.")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Body harus berupa objek JSON.")
+    filename = data.get("filename")
+    if not isinstance(filename, str) or not filename.strip():
+        raise HTTPException(status_code=400, detail="filename wajib diisi.")
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="size harus berupa angka.")
+    try:
+        session = await run_blocking(
+            IO_EXECUTOR, UPLOAD_SESSIONS.create,
+            filename=filename,
+            size=size,
+            mime_type=data.get("type"),
+            category=data.get("category"),
+            sha256=data.get("sha256"),
         )
-        if not row_index:
-            raise HTTPException(status_code=404, detail="Data tidak ditemukan di spreadsheet.")
+    except UploadSessionError as e:
+        raise _session_error(e)
+    return {"ok": True, "chunk_size": UPLOAD_CHUNK_SIZE, **session}
 
-        # 🔹 Ambil folder toko dari spreadsheet
-        old_folder_link = records[row_index - 2].get("folder_link")
-        if not old_folder_link or "folders/" not in old_folder_link:
-            raise HTTPException(status_code=400, detail="Folder Drive toko tidak valid.")
-        toko_folder_id = old_folder_link.split("folders/")[-1]
-
-        # 🔹 Ambil daftar folder kategori
-        subfolders = drive_service.files().list(
-            q=f"'{toko_folder_id}' in parents and trashed = false and mimeType = 'application/vnd.google-apps.folder'",
-            fields="files(id, name)"
-        ).execute().get("files", [])
-        category_folders = {sf["name"]: sf["id"] for sf in subfolders}
-
-        # 🔹 Ambil file lama dari spreadsheet
-        old_file_links = records[row_index - 2].get("file_links", "")
-        old_files = []
-        if old_file_links:
-            for entry in old_file_links.split(","):
-                parts = [p.strip() for p in entry.split("|")]
-                if len(parts) >= 3:
-                    cat, filename, link = parts[:3]
-                    old_files.append({"category": cat, "filename": filename, "link": link})
-
-        # 🔹 Ambil semua file dari subfolder kategori
-        existing_files = []
-        for cat, folder_id in category_folders.items():
-            result = drive_service.files().list(
-                q=f"'{folder_id}' in parents and trashed = false",
-                fields="files(id, name)"
-            ).execute()
-            for f in result.get("files", []):
-                existing_files.append({
-                    "id": f["id"],
-                    "name": f["name"],
-                    "category": cat,
-                })
-
-        # === 🔹 DELETE: Hapus file lama hanya jika hilang di kategori yang sama ===
-        existing_keys = {(f["category"], f["name"]) for f in existing_files}
-        new_keys = {(f.get("category"), f.get("filename")) for f in files if f.get("filename")}
-        to_delete = [f for f in existing_files if (f["category"], f["name"]) not in new_keys]
-
-        for f in to_delete:
+
+@app.get("/upload-sessions/{upload_id}")
+def get_upload_session(upload_id: str):
+    """Offset terakhir yang diterima server, untuk melanjutkan upload."""
+    try:
+        return {"ok": True, **UPLOAD_SESSIONS.status(upload_id)}
+    except UploadSessionError as e:
+        raise _session_error(e)
+
+
+@app.put("/upload-sessions/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request):
+    """
+    Kirim satu chunk. Header Content-Range: bytes <start>-<end>/<total>.
+    Jika start tidak sama dengan offset server, balasan 409 berisi offset
+    yang benar sehingga client bisa melanjutkan dari sana.
+    """
+    start = 0
+    content_range = request.headers.get("content-range")
+    if content_range:
+        match = _CONTENT_RANGE_RE.match(content_range.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail="Header Content-Range tidak valid.")
+        start = int(match.group(1))
+
+    # Body di-spool dulu (memori terbatas) lalu ditulis di bawah lock session.
+    # Spool pindah ke disk setelah 1 MB: tulisan per blok dijalankan di
+    # executor supaya event loop tidak tertahan I/O disk
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        pending, pending_size = [], 0
+        async for chunk in request.stream():
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= 1024 * 1024:
+                await run_blocking(IO_EXECUTOR, spool.write, b"".join(pending))
+                pending, pending_size = [], 0
+        if pending:
+            await run_blocking(IO_EXECUTOR, spool.write, b"".join(pending))
+        spool.seek(0)
+        try:
+            session = await run_blocking(
+                IO_EXECUTOR, UPLOAD_SESSIONS.write,
+                upload_id, start, iter(lambda: spool.read(1024 * 1024), b""),
+            )
+        except UploadSessionError as e:
+            raise _session_error(e)
+    return {"ok": True, **session}
+
+
+@app.post("/upload-sessions/{upload_id}/finalize")
+def finalize_upload_session(upload_id: str):
+    try:
+        return {"ok": True, **UPLOAD_SESSIONS.finalize(upload_id)}
+    except UploadSessionError as e:
+        raise _session_error(e)
+
+
+@app.delete("/upload-sessions/{upload_id}")
+def delete_upload_session(upload_id: str):
+    UPLOAD_SESSIONS.delete(upload_id)
+    return {"ok": True}
+
+
+def perbarui_dokumen(kode_toko: str, data: dict) -> dict:
+    """Inti proses update dokumen; dipanggil dengan lock kode_toko dipegang."""
+    files = data.get("files", [])
+
+    drive_service = POOL.drive()
+
+    # 🔹 Validasi duplikat file berdasarkan kategori + nama
+    seen = set()
+    duplicates = []
+    for f in files:
+        category = (f.get("category") or "pendukung").strip() or "pendukung"
+        filename = f.get("filename")
+        if not filename:
+            continue
+        key = (category.lower(), filename.lower())
+        if key in seen:
+            duplicates.append(f"{category}/{filename}")
+        seen.add(key)
+
+    if duplicates:
+        return {
+            "ok": False,
+            "message": f"Tidak boleh upload file duplikat pada kategori yang sama! Duplikat ditemukan: {', '.join(duplicates)}"
+        }
+
+    # 🔹 Cari data toko
+    found = SHEET_CACHE.find(kode_toko)
+    if not found:
+        raise HTTPException(status_code=404, detail="Data tidak ditemukan di spreadsheet.")
+    _, record = found
+
+    # 🔹 Ambil folder toko dari spreadsheet
+    old_folder_link = record.get("folder_link")
+    if not old_folder_link or "folders/" not in old_folder_link:
+        raise HTTPException(status_code=400, detail="Folder Drive toko tidak valid.")
+    toko_folder_id = old_folder_link.split("folders/")[-1]
+
+    # 🔹 Ambil folder kategori + semua file di dalamnya (tanpa N+1 list).
+    # md5Checksum ikut diambil untuk diff berbasis isi file. Mirror lokal
+    # dipakai jika sudah siap; selama crawl awal tetap list langsung.
+    mirrored = DRIVE_MIRROR.tree(toko_folder_id)
+    if mirrored is not None:
+        category_folders, tree_files = mirrored
+        FOLDER_CACHE.put_many(toko_folder_id, category_folders)
+    else:
+        category_folders, tree_files = resolve_tree(
+            drive_service, toko_folder_id, cache=FOLDER_CACHE,
+            file_fields="id, name, parents, md5Checksum, size, appProperties",
+        )
+    # Folder _thumbnails bukan kategori; thumbnail dipetakan ke ID file aslinya
+    thumb_folder = category_folders.pop(THUMBNAIL_FOLDER, None)
+    thumbs_by_file_id = {
+        f["name"][len("thumb_"):].rsplit(".", 1)[0]: f
+        for f in tree_files
+        if f["category"] == THUMBNAIL_FOLDER and f["name"].startswith("thumb_")
+    }
+    existing_by_key = {
+        (f["category"], f["name"]): f for f in tree_files if f["category"] != THUMBNAIL_FOLDER
+    }
+
+    # 🔹 Ambil file lama dari FILE_STORE (fallback: urai sel spreadsheet)
+    old_files = {(e["category"], e["filename"]): e for e in _stored_files(kode_toko, record)}
+
+    # Normalisasi entri payload sekali di awal
+    entries = []
+    for idx, f in enumerate(files, start=1):
+        category = (f.get("category") or "pendukung").strip() or "pendukung"
+        filename = f.get("filename") or f"file_{idx}"
+        entries.append((category, filename, f))
+    incoming_keys = {(category, filename) for category, filename, _ in entries}
+
+    # Folder kategori yang belum ada dibuat sekaligus dalam satu batch
+    new_categories = [
+        c for c in dict.fromkeys(category for category, _, _ in entries)
+        if c not in category_folders
+    ]
+    if IMAGE_PROCESSOR.enabled and not thumb_folder:
+        new_categories.append(THUMBNAIL_FOLDER)
+    if new_categories:
+        created = create_folders_batch(drive_service, new_categories, toko_folder_id)
+        thumb_folder = created.pop(THUMBNAIL_FOLDER, thumb_folder)
+        FOLDER_CACHE.put_many(toko_folder_id, created)
+        category_folders.update(created)
+        for c in new_categories:
+            print(f"📁 Buat folder kategori baru: {c}")
+
+    # === 🔹 DIFF: bandingkan md5 isi baru dengan md5Checksum di Drive ===
+    # File di Drive yang tidak ada di payload = kandidat hapus (atau
+    # sumber rename jika isinya sama dengan file baru di kategori itu).
+    orphans_by_md5: dict[tuple[str, str], list[dict]] = {}
+    for key, ef in existing_by_key.items():
+        if key not in incoming_keys and _content_md5(ef):
+            orphans_by_md5.setdefault((ef["category"], _content_md5(ef)), []).append(ef)
+
+    diff = {"uploaded": [], "replaced": [], "renamed": [], "unchanged": [], "deleted": []}
+    renames: dict[str, str] = {}
+    replaced: dict[int, dict] = {}
+    consumed_ids: set[str] = set()
+
+    # Slot per entri payload supaya urutan file_links tetap sama
+    slots: list[str | None] = [None] * len(entries)
+    kategori_log = {}
+    jobs: list[tuple[int, UploadJob]] = []
+    copies: dict[int, tuple] = {}
+    diff["copied"] = []
+    # Isi yang harus dikirim ulang client (hash tidak dikenal / salin gagal)
+    missing: list[str] = []
+    stale: list[dict] = []
+
+    for pos, (category, filename, f) in enumerate(entries):
+        label = f"{category}/{filename}"
+        existing = existing_by_key.get((category, filename))
+
+        # === CASE 1: file baru (punya base64 data / upload_id)
+        if _has_content(f):
             try:
-                drive_service.files().delete(fileId=f["id"]).execute()
-                print(f"Hapus file: {f['name']} (kategori: {f['category']})")
-            except Exception as del_err:
-                print(f"Gagal hapus {f['name']}: {del_err}")
-
-        # === 🔹 UPLOAD / PERTAHANKAN ===
-        file_links = []
-        kategori_log = {}
-
-        for idx, f in enumerate(files, start=1):
-            category = (f.get("category") or "pendukung").strip() or "pendukung"
-            filename = f.get("filename") or f"file_{idx}"
+                source, incoming_md5 = _load_with_md5(f)
+            except Exception as e:
+                print(f"Gagal membaca isi {filename}: {e}")
+                continue
+
             mime_type = guess_mime(filename, f.get("type"))
+            if not existing:
+                # Foto yang dulu dinormalisasi (foto.heic -> foto.jpg) dicocokkan
+                # dengan nama hasil prosesnya, bukan diperlakukan sebagai rename
+                processed_name = IMAGE_PROCESSOR.processed_name(filename, mime_type)
+                alias = existing_by_key.get((category, processed_name))
+                if alias and (category, processed_name) not in incoming_keys \
+                        and alias["id"] not in consumed_ids:
+                    existing = alias
+                    consumed_ids.add(alias["id"])
+                    for candidates in orphans_by_md5.values():
+                        if alias in candidates:
+                            candidates.remove(alias)
+
+            if existing and _content_md5(existing) == incoming_md5:
+                _close_if_stream(source)
+                old = old_files.get((category, existing["name"]))
+                slots[pos] = file_entry(
+                    category, existing["name"],
+                    old["link"] if old else direct_link_for_id(existing["id"]),
+                    _thumb_link(thumbs_by_file_id, existing["id"]),
+                    existing,
+                )
+                diff["unchanged"].append(label)
+                continue
 
-            # Pastikan folder kategori ada
-            if category not in category_folders:
-                new_folder = drive_service.files().create(
-                    body={
-                        "name": category,
-                        "mimeType": "application/vnd.google-apps.folder",
-                        "parents": [toko_folder_id],
-                    },
-                    fields="id"
-                ).execute()
-                category_folders[category] = new_folder["id"]
-                print(f"📁 Buat folder kategori baru: {category}")
-
-            # === CASE 1: file baru (punya base64 data)
-            if f.get("data"):
-                if category not in kategori_log:
-                    kategori_log[category] = {"total": 0, "sukses": 0}
-                kategori_log[category]["total"] += 1
-
-                try:
-                    raw = decode_base64_maybe_with_prefix(f["data"])
-                    uploaded = upload_one_file(
-                        drive_service=drive_service,
-                        folder_id=category_folders[category],
-                        filename=filename,
-                        mime_type=mime_type,
-                        raw_bytes=raw,
-                        max_retry=2
-                    )
-
-                    file_id = uploaded.get("id")
-                    link = uploaded.get("webViewLink")
-                    if link:
-                        file_id = link.split("/d/")[-1].split("/")[0]
-                        direct_link = f"https://drive.google.com/uc?export=view&id={file_id}"
-                    else:
-                        direct_link = uploaded.get("thumbnailLink", "")
-
-                    # Buka akses publik
-                    if file_id:
-                        try:
-                            drive_service.permissions().create(
-                                fileId=file_id,
-                                body={"type": "anyone", "role": "reader"},
-                                fields="id"
-                            ).execute()
-                        except Exception:
-                            pass
-
-                    file_links.append(f"{category}|{filename}|{direct_link}")
-                    kategori_log[category]["sukses"] += 1
-                    print(f"Upload baru: {filename} ke kategori {category}")
-
-                except Exception as e:
-                    print(f"Gagal upload {filename}: {e}")
-
-            # === CASE 2: file lama (tanpa data base64)
-            else:
-                existing = next(
-                    (x for x in old_files
-                     if x["filename"] == filename and x["category"] == category),
-                    None
+            candidates = orphans_by_md5.get((category, incoming_md5), [])
+            if not existing and candidates:
+                src = candidates.pop(0)
+                _close_if_stream(source)
+                renames[src["id"]] = filename
+                consumed_ids.add(src["id"])
+                slots[pos] = file_entry(
+                    category, filename, direct_link_for_id(src["id"]),
+                    _thumb_link(thumbs_by_file_id, src["id"]),
+                    src,
                 )
+                diff["renamed"].append({"from": f"{category}/{src['name']}", "to": label})
+                continue
+
+            if category not in kategori_log:
+                kategori_log[category] = {"total": 0, "sukses": 0}
+            kategori_log[category]["total"] += 1
+            if existing:
+                replaced[pos] = existing
+
+            jobs.append((pos, UploadJob(
+                category=category,
+                filename=filename,
+                mime_type=mime_type,
+                folder_id=category_folders[category],
+                load=lambda source=source: source,
+                close_source=bool(f.get("upload_id")),
+                thumb_folder_id=thumb_folder,
+            )))
+
+        # === CASE 2: file lama (tanpa data base64)
+        else:
+            old = old_files.get((category, filename))
+            wanted = (f.get("sha256") or "").strip().lower()
+            current = ((existing or {}).get("appProperties") or {}).get("sha256") or (old or {}).get("sha256")
+            if old and (not wanted or not current or current == wanted):
+                slots[pos] = old
+                diff["unchanged"].append(label)
+                print(f"🔁 Pertahankan file lama: {old['filename']} ({old['category']})")
+            elif wanted and (src := _dedup_source(f)):
+                # Isi dikenal dari pre-flight: salin file Drive yang sudah ada
+                copies[pos] = (src, category_folders[category], filename)
+            else:
+                print(f"File lama tidak ditemukan: {filename} ({category})")
+                if wanted:
+                    missing.append(label)
                 if existing:
-                    file_links.append(f"{existing['category']}|{existing['filename']}|{existing['link']}")
-                    print(f"🔁 Pertahankan file lama: {existing['filename']} ({existing['category']})")
-                else:
-                    print(f"File lama tidak ditemukan: {filename} ({category})")
-
-        # === 🔹 UPDATE spreadsheet ===
-        SHEET.update(
-            f"A{row_index}:I{row_index}",
-            [[
-                data.get("kode_toko", ""),
-                data.get("nama_toko", ""),
-                data.get("cabang", ""),
-                data.get("luas_sales", ""),
-                data.get("luas_parkir", ""),
-                data.get("luas_gudang", ""),
-                old_folder_link,
-                ", ".join(file_links),
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            ]]
+                    # Isi di Drive bukan yang diminta & tidak lagi dirujuk: hapus
+                    stale.append(existing)
+
+    # === 🔹 RENAME (isi sama, nama beda) ===
+    if renames:
+        for fid, item in rename_files_batch(drive_service, renames).items():
+            if not item.ok:
+                print(f"Gagal rename {fid} → {renames[fid]}: {item.error}")
+
+    # === 🔹 UPLOAD hanya file yang benar-benar berubah ===
+    to_delete = [
+        ef for key, ef in existing_by_key.items()
+        if key not in incoming_keys and ef["id"] not in consumed_ids
+    ] + [ef for ef in stale if ef["id"] not in consumed_ids]
+    results = run_uploads(drive_service, [job for _, job in jobs])
+    for (slot, _), res in zip(jobs, results):
+        category, filename = res.job.category, res.job.filename
+        if not res.ok:
+            print(f"Gagal upload {filename}: {res.error}")
+            if slot in replaced:
+                # upload versi baru gagal: versi lama tetap dipakai
+                old_file = replaced[slot]
+                slots[slot] = file_entry(
+                    category, old_file["name"], direct_link_for_id(old_file["id"]),
+                    _thumb_link(thumbs_by_file_id, old_file["id"]),
+                    old_file,
+                )
+            continue
+        slots[slot] = file_entry(
+            category, filename, direct_link_for(res.uploaded), thumb_link_for(res), res.uploaded
+        )
+        kategori_log[category]["sukses"] += 1
+        if slot in replaced:
+            # versi lama dihapus hanya setelah versi baru berhasil naik
+            to_delete.append(replaced[slot])
+            diff["replaced"].append(f"{category}/{filename}")
+        else:
+            diff["uploaded"].append(f"{category}/{filename}")
+        print(f"Upload baru: {filename} ke kategori {category}")
+
+    # === 🔹 COPY: isi yang sudah ada di Drive (dedup lintas toko) ===
+    for pos, copied in copy_known_files(drive_service, copies).items():
+        src, _, filename = copies[pos]
+        category = entries[pos][0]
+        existing = existing_by_key.get((category, filename))
+        if not copied:
+            # Versi lama (jika ada) dipertahankan sampai client mengirim isinya
+            old = old_files.get((category, filename))
+            if old:
+                slots[pos] = old
+            missing.append(f"{category}/{filename}")
+            continue
+        slots[pos] = file_entry(
+            category, filename, direct_link_for(copied), src.get("thumb_link") or "", copied
         )
+        if existing and existing["id"] not in consumed_ids:
+            to_delete.append(existing)
+        diff["copied"].append(f"{category}/{filename}")
+
+    # === 🔹 DELETE: file yang hilang dari payload / versi lama yang diganti ===
+    delete_ids = [f["id"] for f in to_delete]
+    delete_ids += [thumbs_by_file_id[fid]["id"] for fid in delete_ids if fid in thumbs_by_file_id]
+    deleted = delete_files_batch(drive_service, delete_ids)
+    for f in to_delete:
+        item = deleted[f["id"]]
+        if item.ok:
+            diff["deleted"].append(f"{f['category']}/{f['name']}")
+            print(f"Hapus file: {f['name']} (kategori: {f['category']})")
+        else:
+            print(f"Gagal hapus {f['name']}: {item.error}")
+
+    file_links = [entry for entry in slots if entry]
+
+    # === 🔹 UPDATE spreadsheet ===
+    row_values = [
+        data.get("kode_toko", ""),
+        data.get("nama_toko", ""),
+        data.get("cabang", ""),
+        data.get("luas_sales", ""),
+        data.get("luas_parkir", ""),
+        data.get("luas_gudang", ""),
+        old_folder_link,
+        render_file_links(file_links),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    ]
+    # Row index dicari ulang tepat saat menulis: baris bisa bergeser karena
+    # delete lain selama proses upload di atas
+    with sheet_rows(), SHEET_CACHE.writing():
+        found = SHEET_CACHE.find(kode_toko)
+        if not found:
+            raise HTTPException(status_code=404, detail="Data tidak ditemukan di spreadsheet.")
+        row_index = found[0]
+        SHEET_WRITER.update(f"A{row_index}:I{row_index}", [row_values])
+        SHEET_CACHE.on_update(row_index, row_values)
+    new_kode = data.get("kode_toko") or kode_toko
+    if str(new_kode).strip().upper() != str(kode_toko).strip().upper():
+        FILE_STORE.delete_store(kode_toko)
+    FILE_STORE.replace_all(new_kode, file_links)
+
+    return {
+        "ok": True,
+        "message": "Dokumen berhasil diperbarui.",
+        "folder_link": old_folder_link,
+        "files_uploaded": len(file_links),
+        "diff": diff,
+        "missing": missing,
+    }
 
-        return {
-            "ok": True,
-            "message": "Dokumen berhasil diperbarui.",
-            "folder_link": old_folder_link,
-            "files_uploaded": len(file_links),
-        }
 
+def _perbarui_terkunci(kode_toko: str, data: dict) -> dict:
+    with STORE_LOCKS.hold(kode_toko):
+        return perbarui_dokumen(kode_toko, data)
+
+
+@app.put("/document/{kode_toko}")
+async def update_document(kode_toko: str, request: Request):
+    """
+    Versi lengkap:
+    - File dikenali unik per kategori (kategori + filename)
+    - File yang dihapus hanya dihapus di kategori sama
+    - File baru disimpan di folder kategori yang sesuai
+    - Validasi: tidak boleh upload file dengan nama sama di kategori yang sama
+    """
+    try:
+        data = await read_json(request)
+        return await run_blocking(DOCUMENT_EXECUTOR, _perbarui_terkunci, kode_toko, data)
+
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Gagal update dokumen: {e}")
@@ -618,47 +1849,232 @@ async def update_document(kode_toko: str, request: Request):
 @app.delete("/document/{kode_toko}")
 async def delete_document(kode_toko: str):
     try:
-        drive_service, SHEET = get_services()
-        records = SHEET.get_all_records()
-        row_index = next(
-            (i + 2 for i, r in enumerate(records) if str(r.get("kode_toko", "")).strip() == str(kode_toko).strip()),
-            None
-        )
-        if not row_index:
-            raise HTTPException(status_code=404, detail="Data tidak ditemukan.")
+        return await run_blocking(DOCUMENT_EXECUTOR, _hapus_terkunci, kode_toko)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Gagal hapus: {e}")
 
-        # hapus folder di Drive jika ada
-        folder_link = records[row_index - 2].get("folder_link")
-        if folder_link and "folders/" in folder_link:
-            folder_id = folder_link.split("folders/")[-1]
-            try:
-                drive_service.files().delete(fileId=folder_id).execute()
-            except Exception as e:
-                print("Gagal hapus folder di Drive:", e)
 
-        SHEET.delete_rows(row_index)
-        return {"ok": True, "message": "Dokumen berhasil dihapus."}
+def _hapus_terkunci(kode_toko: str) -> dict:
+    with STORE_LOCKS.hold(kode_toko):
+        return hapus_dokumen(kode_toko)
+
+
+def hapus_dokumen(kode_toko: str) -> dict:
+    drive_service = POOL.drive()
+    found = SHEET_CACHE.find(kode_toko)
+    if not found:
+        raise HTTPException(status_code=404, detail="Data tidak ditemukan.")
+    _, record = found
+
+    # hapus folder di Drive jika ada
+    folder_link = record.get("folder_link")
+    if folder_link and "folders/" in folder_link:
+        folder_id = folder_link.split("folders/")[-1]
+        try:
+            GOOGLE_RETRY.call(
+                "drive", "delete", drive_service.files().delete(fileId=folder_id).execute
+            )
+        except Exception as e:
+            print("Gagal hapus folder di Drive:", e)
+        FOLDER_CACHE.forget(folder_id)
+
+    with sheet_rows(), SHEET_CACHE.writing():
+        found = SHEET_CACHE.find(kode_toko)
+        if found:
+            SHEET_WRITER.delete_row(found[0], kode_toko)
+            SHEET_CACHE.on_delete(found[0])
+    FILE_STORE.delete_store(kode_toko)
+    return {"ok": True, "message": "Dokumen berhasil dihapus."}
+
+
+@app.delete("/document/{kode_toko}/files/{category}/{filename}")
+def delete_document_file(kode_toko: str, category: str, filename: str):
+    """
+    Hapus satu file dari toko: file Drive (+ thumbnail) dan entrinya.
+    Hanya sel file_links (kolom H) yang ditulis ulang, bukan seluruh baris.
+    """
+    try:
+        with STORE_LOCKS.hold(kode_toko):
+            return _hapus_file_dokumen(kode_toko, category, filename)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Gagal hapus: {e}")
+        raise HTTPException(status_code=500, detail=f"Gagal hapus file: {e}")
+
+
+def _hapus_file_dokumen(kode_toko: str, category: str, filename: str) -> dict:
+    drive_service = POOL.drive()
+    found = SHEET_CACHE.find(kode_toko)
+    if not found:
+        raise HTTPException(status_code=404, detail="Data tidak ditemukan.")
+    _, record = found
+    _stored_files(kode_toko, record)  # pastikan FILE_STORE sudah terisi
+    entry = FILE_STORE.get(kode_toko, category, filename)
+    if not entry:
+        raise HTTPException(status_code=404, detail="File tidak ditemukan.")
+
+    drive_ids = [entry.get("file_id"), file_id_from_link(entry.get("thumb_link") or "")]
+    deleted = delete_files_batch(drive_service, [fid for fid in drive_ids if fid])
+    for fid, item in deleted.items():
+        if not item.ok:
+            print(f"Gagal hapus {fid}: {item.error}")
+
+    FILE_STORE.delete(kode_toko, category, filename)
+    cell = FILE_STORE.render(kode_toko)
+    with sheet_rows(), SHEET_CACHE.writing():
+        found = SHEET_CACHE.find(kode_toko)
+        if found:
+            SHEET_WRITER.update(f"H{found[0]}", [[cell]])
+            SHEET_CACHE.on_patch(found[0], {"file_links": cell})
+    return {"ok": True, "message": f"File {filename} dihapus."}
 
 
 @app.get("/documents/{kode_toko}")
-def get_documents(kode_toko: str):
+def get_documents(kode_toko: str, request: Request):
     try:
-        _, SHEET = get_services()
-        records = SHEET.get_all_records()
-        found = next(
-            (r for r in records if str(r.get("kode_toko", "")).strip() == str(kode_toko).strip()),
-            None
-        )
+        found = SHEET_CACHE.find(kode_toko)
         if not found:
             raise HTTPException(status_code=404, detail="Data tidak ditemukan.")
-        return {"ok": True, "data": found}
+        # ETag dari isi baris: berubah hanya jika baris toko ini berubah
+        record = found[1]
+        etag = weak_etag(*(f"{k}={v}" for k, v in sorted(record.items())))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return FastJSONResponse({"ok": True, "data": record}, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal ambil data: {e}")
 
 
+# Unduhan ZIP per toko: ARCHIVE_PARALLEL file diunduh bersamaan per arsip,
+# total thread unduh dibatasi ARCHIVE_WORKERS untuk semua arsip.
+ARCHIVER = StoreArchiver(
+    lambda: POOL.drive(),
+    workers=int(os.getenv("ARCHIVE_WORKERS", "8")),
+    parallel=int(os.getenv("ARCHIVE_PARALLEL", "4")),
+    spool_limit=int(os.getenv("ARCHIVE_SPOOL_LIMIT", str(8 * 1024 * 1024))),
+)
+
+
+@app.get("/documents/{kode_toko}/archive")
+def download_archive(kode_toko: str):
+    """Semua file toko dalam satu ZIP (folder per kategori), dikirim bertahap."""
+    try:
+        found = SHEET_CACHE.find(kode_toko)
+        if not found:
+            raise HTTPException(status_code=404, detail="Data tidak ditemukan.")
+        entries = []
+        for f in _stored_files(kode_toko, found[1]):
+            file_id = f.get("file_id") or file_id_from_link(f.get("link", ""))
+            if file_id:
+                entries.append({"category": f["category"], "filename": f["filename"], "file_id": file_id})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal ambil data: {e}")
+    if not entries:
+        raise HTTPException(status_code=404, detail="Toko ini belum punya file.")
+
+    archive_name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(kode_toko)) or "dokumen"
+    return StreamingResponse(
+        ARCHIVER.stream(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}.zip"'},
+    )
+
+
+# =========================
+# MEDIA PROXY
+# =========================
+# Cache disk LRU untuk isi file Drive (pratinjau & thumbnail DocumentTable)
+MEDIA_CACHE = MediaCache(
+    os.getenv("MEDIA_CACHE_DIR", "media_cache"),
+    drive_factory=lambda: POOL.drive(),
+    max_bytes=int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    revalidate=float(os.getenv("MEDIA_REVALIDATE", "300")),
+    widths=tuple(int(w) for w in os.getenv("MEDIA_WIDTHS", "160,320,640,1280").split(",") if w.strip()),
+)
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "86400"))
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Satu rentang 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' -> (start, end).
+    ValueError jika header tidak dikenali (diabaikan, kirim penuh);
+    None jika rentang di luar ukuran file (416).
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        raise ValueError(header)
+    if not m.group(1):
+        length = int(m.group(2))
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(m.group(1))
+    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+@app.get("/media/{file_id}")
+def get_media(file_id: str, request: Request, w: Optional[int] = Query(None, ge=16, le=4096)):
+    """
+    Proxy isi file Drive milik toko (dari cache disk).
+    - ETag + If-None-Match -> 304
+    - Range: bytes=a-b -> 206 (satu rentang)
+    - ?w=320: varian gambar lebih kecil (lebar dibulatkan ke MEDIA_WIDTHS)
+    """
+    # Hanya file yang tercatat milik toko; bukan proxy ke seluruh isi Drive
+    if not FILE_STORE.has_file(file_id, [drive_view_link(file_id), direct_link_for_id(file_id)]):
+        raise HTTPException(status_code=404, detail="File tidak ditemukan.")
+    try:
+        entry, fh = MEDIA_CACHE.open(file_id, w)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        if status_of(e) == 404:
+            raise HTTPException(status_code=404, detail="File tidak ditemukan di Drive.")
+        print(f"Gagal mengambil media {file_id}: {e}")
+        raise HTTPException(status_code=502, detail=f"Gagal mengambil file dari Drive: {e}")
+
+    etag = f'"{entry.etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={MEDIA_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        fh.close()
+        return Response(status_code=304, headers=headers)
+
+    start, end, status = 0, entry.size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = _byte_range(range_header, entry.size)
+        except ValueError:
+            byte_range = (start, end)
+        if byte_range is None:
+            fh.close()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{entry.size}"})
+        start, end = byte_range
+        if (start, end) != (0, entry.size - 1):
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+    headers["Content-Length"] = str(max(0, end - start + 1))
+    return StreamingResponse(
+        iter_range(fh, start, end), status_code=status, media_type=entry.mime_type, headers=headers,
+    )
+
+
 # --- HEALTH CHECK ---
 @app.get("/health", response_class=Response)
 async def health():
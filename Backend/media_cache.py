@@ -0,0 +1,286 @@
+"""
+Cache disk (LRU, dibatasi ukuran) untuk proxy /media/{file_id}.
+
+- Isi file Drive disimpan di cache_dir; index (ukuran, mime, etag, waktu
+  akses) di SQLite sehingga cache tetap hangat setelah restart
+- ETag = md5Checksum Drive (+ lebar varian). Setelah `revalidate` detik
+  entri dicek ulang lewat files.get (metadata saja); isi hanya diunduh
+  lagi jika md5 berubah
+- Varian kecil (?w=320) dibuat dari file asli yang sudah di-cache, lebar
+  dibulatkan ke daftar `widths` agar jumlah varian terbatas (butuh Pillow)
+- Request bersamaan untuk key yang sama digabung: hanya satu unduhan Drive,
+  sisanya menunggu hasilnya
+- Total ukuran melebihi max_bytes -> entri paling lama tidak diakses dibuang
+"""
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from googleapiclient.http import MediaIoBaseDownload
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow opsional: tanpa Pillow varian ukuran dinonaktifkan
+    Image = None
+    ImageOps = None
+
+_META_FIELDS = "id, mimeType, md5Checksum, size, modifiedTime"
+
+
+@dataclass
+class MediaEntry:
+    key: str
+    path: str
+    mime_type: str
+    size: int
+    etag: str
+    checked_at: float
+
+
+def iter_range(fh, start: int, end: int, block: int = 256 * 1024):
+    """Baca byte start..end (inklusif) dari file yang sudah dibuka, lalu tutup."""
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = fh.read(min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fh.close()
+
+
+def _link_or_copy(src: str, dest: str):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class MediaCache:
+    def __init__(self, cache_dir: str, drive_factory, max_bytes: int = 512 * 1024 * 1024,
+                 revalidate: float = 300.0, widths: tuple[int, ...] = (160, 320, 640, 1280),
+                 chunk_size: int = 4 * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self._drive = drive_factory
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.widths = tuple(sorted(widths))
+        self.chunk_size = chunk_size
+
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "revalidated": 0, "evictions": 0}
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    mime_type TEXT,
+                    size INTEGER NOT NULL,
+                    etag TEXT NOT NULL,
+                    checked_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS media_accessed ON media(accessed_at)")
+            self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM media").fetchone()[0]
+
+    # -------------------------
+    # Index
+    # -------------------------
+    def _lookup(self, key: str) -> MediaEntry | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, path, mime_type, size, etag, checked_at FROM media WHERE key = ?", (key,)
+            ).fetchone()
+        return MediaEntry(*row) if row else None
+
+    def _touch(self, key: str, checked: bool = False):
+        now = time.time()
+        with self._lock, self._db:
+            if checked:
+                self._db.execute("UPDATE media SET accessed_at = ?, checked_at = ? WHERE key = ?", (now, now, key))
+            else:
+                self._db.execute("UPDATE media SET accessed_at = ? WHERE key = ?", (now, key))
+
+    def _store(self, key: str, path: str, mime_type: str, etag: str) -> MediaEntry:
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock, self._db:
+            old = self._db.execute("SELECT size FROM media WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO media (key, path, mime_type, size, etag, checked_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, path, mime_type, size, etag, now, now),
+            )
+            self._total += size - (old[0] if old else 0)
+        self._evict(keep=key)
+        return MediaEntry(key, path, mime_type, size, etag, now)
+
+    def _forget(self, key: str):
+        with self._lock, self._db:
+            row = self._db.execute("SELECT size FROM media WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM media WHERE key = ?", (key,))
+                self._total -= row[0]
+
+    def _evict(self, keep: str):
+        with self._lock, self._db:
+            while self._total > self.max_bytes:
+                row = self._db.execute(
+                    "SELECT key, path, size FROM media WHERE key != ? ORDER BY accessed_at LIMIT 1", (keep,)
+                ).fetchone()
+                if row is None:
+                    break
+                self._db.execute("DELETE FROM media WHERE key = ?", (row[0],))
+                self._total -= row[2]
+                self.stats["evictions"] += 1
+                try:
+                    # File yang sedang dikirim tetap bisa dibaca (fd masih terbuka)
+                    os.remove(row[1])
+                except OSError:
+                    pass
+
+    # -------------------------
+    # Ambil
+    # -------------------------
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def snap_width(self, width: int | None) -> int | None:
+        """Lebar varian yang benar-benar dipakai (None = file asli)."""
+        if not width or Image is None or not self.widths:
+            return None
+        return next((w for w in self.widths if w >= width), self.widths[-1])
+
+    def get(self, file_id: str, width: int | None = None) -> MediaEntry:
+        width = self.snap_width(width)
+        key = file_id if width is None else f"{file_id}@w{width}"
+        entry = self._lookup(key)
+        if entry is not None and time.time() - entry.checked_at < self.revalidate \
+                and os.path.exists(entry.path):
+            self._touch(key)
+            self.stats["hits"] += 1
+            return entry
+        return self._coalesce(key, lambda: self._load(key, file_id, width, entry))
+
+    def open(self, file_id: str, width: int | None = None):
+        """(MediaEntry, file handle). Entri yang terbuang di antaranya diambil ulang."""
+        for _ in range(2):
+            entry = self.get(file_id, width)
+            try:
+                return entry, open(entry.path, "rb")
+            except FileNotFoundError:
+                self._forget(entry.key)
+        raise FileNotFoundError(file_id)
+
+    def _coalesce(self, key: str, load):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+        try:
+            result = load()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _load(self, key: str, file_id: str, width: int | None, stale: MediaEntry | None) -> MediaEntry:
+        drive = self._drive()
+        meta = GOOGLE_RETRY.call(
+            "drive", "media_meta", drive.files().get(fileId=file_id, fields=_META_FIELDS).execute
+        )
+        etag = meta.get("md5Checksum") or meta.get("modifiedTime") or file_id
+        mime_type = meta.get("mimeType") or "application/octet-stream"
+        if width is not None:
+            etag = f"{etag}-w{width}"
+
+        if stale is not None and stale.etag == etag and os.path.exists(stale.path):
+            self._touch(key, checked=True)
+            self.stats["revalidated"] += 1
+            return stale
+
+        self.stats["misses"] += 1
+        path = self._path_for(key)
+        tmp = f"{path}.tmp-{threading.get_ident()}"
+        try:
+            if width is None:
+                self._download(drive, file_id, tmp)
+            else:
+                original = self.get(file_id)
+                resized = self._resize(original, width, tmp) if mime_type.startswith("image/") else None
+                if resized is None:
+                    # Bukan gambar / sudah lebih kecil dari varian: varian = file asli
+                    _link_or_copy(original.path, tmp)
+                mime_type = resized or original.mime_type
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return self._store(key, path, mime_type, etag)
+
+    def _download(self, drive, file_id: str, dest: str):
+        with open(dest, "wb") as fh, stage("drive_download"):
+            downloader = MediaIoBaseDownload(
+                fh, drive.files().get_media(fileId=file_id), chunksize=self.chunk_size,
+            )
+            done = False
+            while not done:
+                _, done = GOOGLE_RETRY.call("drive", "download", downloader.next_chunk)
+
+    @staticmethod
+    def _resize(original: MediaEntry, width: int, dest: str) -> str | None:
+        """Tulis varian ke dest dan kembalikan mime-nya; None = pakai file asli."""
+        try:
+            with stage("media_resize"), Image.open(original.path) as img:
+                img = ImageOps.exif_transpose(img)
+                if img.width <= width:
+                    return None
+                img.thumbnail((width, img.height))
+                fmt, mime_type = ("PNG", "image/png") if original.mime_type == "image/png" else ("JPEG", "image/jpeg")
+                if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                buf = io.BytesIO()
+                img.save(buf, fmt, quality=82, optimize=True)
+            with open(dest, "wb") as fh:
+                fh.write(buf.getvalue())
+            return mime_type
+        except Exception as e:
+            # Format tidak dikenali Pillow (misal HEIC tanpa pillow-heif)
+            print(f"Gagal membuat varian {width}px untuk {original.key}: {e}")
+            return None
+
+    def info(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+            return {
+                "entries": entries,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "resize": Image is not None,
+                **self.stats,
+            }
@@ -0,0 +1,207 @@
+"""
+Metrik format teks Prometheus (tanpa dependensi tambahan).
+
+- Counter / Gauge / Histogram dengan label, disimpan di REGISTRY
+- stage("nama") mengukur durasi satu tahap (ambil service, baca sheet,
+  decode base64, upload Drive, permission, ...) ke app_stage_seconds
+- Trace per request (opsional): span tiap stage dikumpulkan di contextvar
+  lalu dikirim sebagai header Server-Timing oleh middleware di main.py
+
+Thread pekerja hanya melihat trace request jika dijalankan lewat
+contextvars.copy_context() (lihat BlockingExecutor dan UploadPipeline).
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Detik; cukup lebar untuk request ringan sampai upload besar
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels_text(self.labelnames, k)} {_fmt(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [hitungan per bucket..., sum, count]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self._header()
+        for key, entry in items:
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-2] + [entry[-1]]):
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_fmt(entry[-2])}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "app_stage_seconds", "Durasi per tahap proses (detik).", ("stage",)
+)
+API_CALLS = REGISTRY.counter(
+    "google_api_calls_total", "Jumlah request HTTP ke Google API.", ("api", "op")
+)
+API_RETRIES = REGISTRY.counter(
+    "google_api_retries_total", "Jumlah retry karena 429/5xx.", ("api", "op")
+)
+UPLOAD_BYTES = REGISTRY.counter(
+    "upload_bytes_total", "Total byte yang diunggah ke Drive."
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Request HTTP yang sedang diproses."
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Durasi request HTTP (detik).", ("method", "route", "status")
+)
+
+
+# -------------------------
+# Trace per request
+# -------------------------
+_TRACE: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def start_trace():
+    """Mulai kumpulkan span untuk request ini; kembalikan token reset."""
+    return _TRACE.set([])
+
+
+def end_trace(token) -> list[tuple[str, float]]:
+    spans = _TRACE.get() or []
+    _TRACE.reset(token)
+    return spans
+
+
+def server_timing(spans: list[tuple[str, float]]) -> str:
+    """Gabungkan span per stage menjadi nilai header Server-Timing."""
+    totals: dict[str, list] = {}
+    for name, seconds in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    return ", ".join(
+        f'{name};dur={total * 1000:.1f};desc="x{count}"' for name, (total, count) in totals.items()
+    )
+
+
+@contextmanager
+def stage(name: str):
+    """Ukur durasi blok sebagai satu tahap (histogram + span trace)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        spans = _TRACE.get()
+        if spans is not None:
+            spans.append((name, elapsed))
@@ -0,0 +1,308 @@
+"""
+Cache in-memory untuk worksheet dokumen.
+
+Snapshot sheet disimpan bersama index hash:
+- kode_toko (UPPER)  -> posisi baris
+- cabang    (lower)  -> daftar posisi baris
+
+Setelah TTL habis snapshot divalidasi ulang: isi sheet diunduh lagi lalu
+dibandingkan digest-nya (mirip ETag). Jika sama, index lama tetap dipakai.
+Tulisan dari proses ini sendiri (append/update/delete) langsung diterapkan
+ke snapshot (write-through) sehingga pembacaan berikutnya tidak perlu
+menyentuh Sheets API. Nilai sel mentah ikut diperbarui, jadi digest yang
+diharapkan setelah tulisan itu sampai ke sheet tetap bisa dicocokkan.
+"""
+import copy
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from gspread.utils import numericise_all
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+
+def _kode_key(value) -> str:
+    return str(value or "").strip().upper()
+
+
+def _cabang_key(value) -> str:
+    return str(value or "").strip().lower()
+
+
+def _cell(value) -> str:
+    return "" if value is None else str(value)
+
+
+def _digest(values: list[list]) -> str:
+    h = hashlib.sha1()
+    for row in values:
+        # Sel kosong di ujung baris diabaikan: get_all_values mengisi baris
+        # sampai lebar sheet, tulisan lokal tidak
+        cells = [_cell(v) for v in row]
+        while cells and cells[-1] == "":
+            cells.pop()
+        h.update("\x1f".join(cells).encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+class SheetCache:
+    def __init__(self, worksheet_getter, ttl: float = 30.0, before_load=None):
+        self._get_ws = worksheet_getter
+        self.ttl = ttl
+        # Dipanggil sebelum mengunduh ulang sheet (misal flush tulisan tertunda).
+        # Mengembalikan False -> masih ada tulisan yang belum sampai ke sheet,
+        # snapshot lokal (sudah berisi tulisan itu) tetap dipakai
+        self.before_load = before_load
+
+        self._lock = threading.RLock()
+        self._headers: list[str] = []
+        self._records: list[dict] = []
+        self._by_kode: dict[str, int] = {}
+        self._by_cabang: dict[str, list[int]] = {}
+        # (cabang, sort_key, descending) -> posisi baris terurut
+        self._order_cache: dict[tuple, list[int]] = {}
+        # Nilai sel mentah (baris 0 = header) + digest yang diharapkan dari
+        # sheet; None = dihitung ulang saat validasi berikutnya
+        self._rows: list[list] = []
+        self._digest: str | None = None
+        self._etag: str | None = None
+        self._checked_at = 0.0
+
+        self.stats = {"hits": 0, "fetches": 0, "revalidated": 0, "rebuilds": 0}
+
+    # -------------------------
+    # Snapshot & index
+    # -------------------------
+    def _record_from_values(self, values: list) -> dict:
+        row = list(values) + [""] * (len(self._headers) - len(values))
+        return dict(zip(self._headers, numericise_all(row[: len(self._headers)])))
+
+    def _kode_of(self, record: dict):
+        return record.get("kode_toko") or record.get("KodeToko")
+
+    def _cabang_of(self, record: dict):
+        return record.get("cabang") or record.get("CABANG")
+
+    def _rebuild_index(self):
+        self._by_kode = {}
+        self._by_cabang = {}
+        self._order_cache.clear()
+        for pos, rec in enumerate(self._records):
+            kode = _kode_key(self._kode_of(rec))
+            if kode and kode not in self._by_kode:
+                self._by_kode[kode] = pos
+            self._by_cabang.setdefault(_cabang_key(self._cabang_of(rec)), []).append(pos)
+        self.stats["rebuilds"] += 1
+
+    def _load(self):
+        if self.before_load is not None and self.before_load() is False and self._etag is not None:
+            print("Tulisan sheet masih tertunda, snapshot lokal tetap dipakai.")
+            self._checked_at = time.monotonic()
+            return
+        ws = self._get_ws()
+        with stage("sheet_read"):
+            values = GOOGLE_RETRY.call("sheets", "get_all_values", ws.get_all_values)
+        self.stats["fetches"] += 1
+        digest = _digest(values)
+        self._checked_at = time.monotonic()
+        if self._etag is not None and self._digest is None:
+            # Ada write-through sejak unduhan terakhir: digest snapshot lokal
+            self._digest = _digest(self._rows)
+        if self._etag is not None and digest == self._digest:
+            self.stats["revalidated"] += 1
+            return
+
+        self._headers = [str(h) for h in (values[0] if values else [])]
+        self._records = [self._record_from_values(v) for v in values[1:]]
+        self._rows = values
+        self._etag = self._digest = digest
+        self._rebuild_index()
+
+    def _ensure_fresh(self):
+        if self._etag is None or time.monotonic() - self._checked_at > self.ttl:
+            self._load()
+        else:
+            self.stats["hits"] += 1
+
+    def _bump_etag(self):
+        # Versi lokal berubah setelah write-through (ETag HTTP ikut berubah).
+        # Digest dihitung ulang dari _rows saat validasi berikutnya: jika
+        # sheet berisi persis tulisan ini, snapshot & index tetap dipakai.
+        self._etag = hashlib.sha1(f"{self._etag}:{time.time_ns()}".encode()).hexdigest()
+        self._digest = None
+        self._order_cache.clear()
+
+    # -------------------------
+    # Baca
+    # -------------------------
+    @property
+    def etag(self) -> str | None:
+        with self._lock:
+            self._ensure_fresh()
+            return self._etag
+
+    def headers(self) -> list[str]:
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._headers)
+
+    def existing(self, kodes) -> set[str]:
+        """Kode toko (UPPER) dari `kodes` yang sudah ada, dicek dalam satu lock."""
+        with self._lock:
+            self._ensure_fresh()
+            return {k for k in (_kode_key(v) for v in kodes) if k in self._by_kode}
+
+    def find(self, kode_toko: str) -> tuple[int, dict] | None:
+        """Kembalikan (row_index sheet, record) atau None."""
+        with self._lock:
+            self._ensure_fresh()
+            pos = self._by_kode.get(_kode_key(kode_toko))
+            if pos is None:
+                return None
+            return pos + 2, copy.deepcopy(self._records[pos])
+
+    def _ordered_positions(self, cabang: str | None, sort: str | None, descending: bool) -> list[int]:
+        # Kunci cache hanya dari nama kolom & cabang yang benar-benar ada,
+        # supaya nilai query sembarang tidak membuat cache tumbuh tanpa batas
+        column = None
+        if sort:
+            column = next((h for h in self._headers if h.lower() == sort.lower()), None)
+            if column is None:
+                raise ValueError(f"Kolom sort tidak dikenal: {sort}")
+        cabang_key = _cabang_key(cabang) if cabang else None
+        if cabang_key is not None and cabang_key not in self._by_cabang:
+            return []
+        key = (cabang_key, column, descending)
+        positions = self._order_cache.get(key)
+        if positions is not None:
+            return positions
+
+        if cabang_key is not None:
+            positions = list(self._by_cabang[cabang_key])
+        else:
+            positions = list(range(len(self._records)))
+        if column:
+            def sort_value(pos):
+                value = self._records[pos].get(column, "")
+                # angka diurutkan sebagai angka, sisanya sebagai teks
+                if isinstance(value, (int, float)):
+                    return (0, value, "")
+                return (1, 0, str(value).lower())
+
+            positions.sort(key=sort_value, reverse=descending)
+        elif descending:
+            positions.reverse()
+        self._order_cache[key] = positions
+        return positions
+
+    def page(self, cabang: str | None = None, sort: str | None = None, descending: bool = False,
+             offset: int = 0, limit: int | None = None) -> tuple[int, list[dict]]:
+        """
+        Ambil sebagian baris (opsional per cabang & terurut).
+        Urutan per (cabang, sort) disimpan sampai snapshot berubah, jadi biaya
+        per request hanya sebanding dengan jumlah baris yang dikembalikan.
+        Kembalikan (total baris yang cocok, baris halaman ini); ValueError
+        jika `sort` bukan nama kolom sheet.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            positions = self._ordered_positions(cabang, sort, descending)
+            end = len(positions) if limit is None else offset + limit
+            return len(positions), [copy.deepcopy(self._records[p]) for p in positions[offset:end]]
+
+    # -------------------------
+    # Write-through
+    # -------------------------
+    @contextmanager
+    def writing(self):
+        """
+        Tahan lock cache selama tulisan diantrikan + diterapkan ke snapshot.
+        Tanpa ini reload (yang mem-flush antrian) bisa menyela di antaranya:
+        baris yang sudah masuk snapshot lalu diterapkan sekali lagi.
+        """
+        with self._lock:
+            yield
+
+    def on_append(self, values: list):
+        with self._lock:
+            if self._etag is None:
+                return
+            rec = self._record_from_values(values)
+            kode = _kode_key(self._kode_of(rec))
+            if kode and kode in self._by_kode:
+                # Baris sudah ada di snapshot (misal ikut reload): jangan dobel
+                if self._records[self._by_kode[kode]] != rec:
+                    self.invalidate()
+                return
+            pos = len(self._records)
+            self._records.append(rec)
+            self._rows.append([_cell(v) for v in values])
+            if kode:
+                self._by_kode[kode] = pos
+            self._by_cabang.setdefault(_cabang_key(self._cabang_of(rec)), []).append(pos)
+            self._bump_etag()
+
+    def on_update(self, row_index: int, values: list):
+        with self._lock:
+            if self._etag is None:
+                return
+            pos = row_index - 2
+            if not 0 <= pos < len(self._records):
+                self.invalidate()
+                return
+            old = self._records[pos]
+            rec = self._record_from_values(values)
+            self._records[pos] = rec
+            self._rows[pos + 1] = [_cell(v) for v in values]
+            # Index hanya perlu dibangun ulang jika kunci berubah
+            if (_kode_key(self._kode_of(old)) != _kode_key(self._kode_of(rec))
+                    or _cabang_key(self._cabang_of(old)) != _cabang_key(self._cabang_of(rec))):
+                self._rebuild_index()
+            self._bump_etag()
+
+    def on_patch(self, row_index: int, fields: dict):
+        """Write-through untuk update sebagian kolom (kunci tidak berubah)."""
+        with self._lock:
+            if self._etag is None:
+                return
+            pos = row_index - 2
+            if not 0 <= pos < len(self._records):
+                self.invalidate()
+                return
+            self._records[pos].update(fields)
+            row = self._rows[pos + 1]
+            for name, value in fields.items():
+                if name in self._headers:
+                    col = self._headers.index(name)
+                    row.extend([""] * (col + 1 - len(row)))
+                    row[col] = _cell(value)
+            self._bump_etag()
+
+    def on_delete(self, row_index: int):
+        with self._lock:
+            if self._etag is None:
+                return
+            pos = row_index - 2
+            if not 0 <= pos < len(self._records):
+                self.invalidate()
+                return
+            del self._records[pos]
+            del self._rows[pos + 1]
+            self._rebuild_index()
+            self._bump_etag()
+
+    def refresh(self):
+        """Paksa validasi ulang ke Sheets API sekarang juga."""
+        with self._lock:
+            self._checked_at = float("-inf")
+            self._ensure_fresh()
+
+    def invalidate(self):
+        # Tanpa lock: dipanggil juga dari thread SheetWriteBuffer yang bisa
+        # sedang ditunggu oleh pemegang lock cache (lihat before_load)
+        self._etag = None
+        self._checked_at = 0.0
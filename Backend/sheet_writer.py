@@ -0,0 +1,294 @@
+"""
+Buffer tulis (write-behind) untuk worksheet dokumen.
+
+Operasi append/update/delete tidak langsung dikirim ke Sheets API tetapi
+diantrikan lalu di-flush berkala (interval pendek):
+- append berurutan     -> satu append_rows (values.append)
+- update berurutan     -> satu batch_update (range sama: yang terakhir menang)
+- delete               -> delete_rows, dieksekusi sesuai urutan antrian
+
+Urutan antar operasi selalu dipertahankan sehingga row index yang dihitung
+dari cache tetap benar. Append dan delete tidak idempoten: jika responsnya
+hilang (putus/5xx) kolom kode_toko dibaca ulang untuk memastikan apa yang
+sudah diterapkan, bukan dikirim ulang begitu saja (baris ganda / baris toko
+lain ikut terhapus). Pembacaan melihat tulisan yang masih tertunda lewat
+SheetCache (write-through), dan cache memanggil flush() sebelum mengunduh
+ulang sheet. Saat shutdown semua sisa antrian di-flush.
+
+Flush yang gagal tidak membuang antrian: operasi dikembalikan ke depan
+antrian dan dicoba lagi dengan backoff eksponensial (client sudah menerima
+ok). Grup yang hasilnya tidak pasti dicek ulang ke sheet sebelum dikirim.
+Operasi yang terpaksa tidak diterapkan (mode langsung, atau masih tersisa
+saat shutdown) ditulis ke file dead letter (JSON lines) agar bisa
+dipulihkan, dan tercatat di metrik sheet_ops_dropped_total.
+"""
+import json
+import threading
+import time
+import traceback
+
+from google_retry import GOOGLE_RETRY, is_retryable, is_throttled
+from metrics import REGISTRY, stage
+
+SHEET_PENDING = REGISTRY.gauge(
+    "sheet_pending_ops", "Operasi sheet yang masih menunggu flush."
+)
+SHEET_FLUSH_FAILURES = REGISTRY.counter(
+    "sheet_flush_failures_total", "Flush sheet yang gagal (antrian dicoba lagi)."
+)
+SHEET_OPS_DROPPED = REGISTRY.counter(
+    "sheet_ops_dropped_total", "Operasi sheet yang tidak diterapkan (ditulis ke dead letter)."
+)
+
+
+class SheetWriteBuffer:
+    def __init__(self, worksheet_getter, flush_interval: float = 1.0,
+                 max_pending: int = 200, max_failures: int = 5, max_backoff: float = 60.0,
+                 dead_letter_path: str | None = None, on_drop=None):
+        self._get_ws = worksheet_getter
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Gagal berturut-turut sebanyak ini -> peringatan di log
+        self.max_failures = max_failures
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path
+        # Dipanggil jika operasi tidak diterapkan (cache perlu di-invalidate)
+        self.on_drop = on_drop
+
+        self._pending: list[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._failures = 0
+        # Grup pertama antrian mungkin sudah (sebagian) diterapkan: cek dulu
+        self._verify_first = False
+        self._retry_at = 0.0
+        self.stats = {"ops": 0, "api_calls": 0, "flushes": 0, "failures": 0, "dropped": 0}
+
+    @property
+    def write_behind(self) -> bool:
+        return self.flush_interval > 0
+
+    # -------------------------
+    # Antrian
+    # -------------------------
+    def _enqueue(self, op: tuple):
+        with self._lock:
+            self._pending.append(op)
+            self.stats["ops"] += 1
+            full = len(self._pending) >= self.max_pending
+            SHEET_PENDING.set(len(self._pending))
+        if not self.write_behind:
+            self.flush(raise_errors=True)
+        elif full:
+            self._wakeup.set()
+
+    def append(self, values: list):
+        self._enqueue(("append", values))
+
+    def append_many(self, rows: list[list]):
+        """Beberapa baris sekaligus: selalu berurutan -> satu append_rows."""
+        with self._lock:
+            self._pending.extend(("append", values) for values in rows)
+            self.stats["ops"] += len(rows)
+            SHEET_PENDING.set(len(self._pending))
+        if not self.write_behind:
+            self.flush(raise_errors=True)
+        else:
+            self._wakeup.set()
+
+    def update(self, range_name: str, values: list[list]):
+        self._enqueue(("update", range_name, values))
+
+    def delete_row(self, row_index: int, kode_toko: str | None = None):
+        # kode_toko dipakai untuk mencari ulang baris jika hasil delete tidak pasti
+        self._enqueue(("delete", row_index, kode_toko))
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # -------------------------
+    # Flush
+    # -------------------------
+    @staticmethod
+    def _group(ops: list[tuple]) -> list[tuple[str, list[tuple]]]:
+        groups: list[tuple[str, list[tuple]]] = []
+        for op in ops:
+            if groups and groups[-1][0] == op[0] and op[0] != "delete":
+                groups[-1][1].append(op)
+            else:
+                groups.append((op[0], [op]))
+        return groups
+
+    def _send(self, ws, kind: str, ops: list[tuple]):
+        with stage(f"sheet_{kind}"):
+            GOOGLE_RETRY.call(
+                "sheets", kind, lambda: self._send_ops(ws, kind, ops), idempotent=kind == "update",
+            )
+        with self._lock:
+            self.stats["api_calls"] += 1
+
+    @staticmethod
+    def _send_ops(ws, kind: str, ops: list[tuple]):
+        if kind == "append":
+            ws.append_rows([op[1] for op in ops], value_input_option="RAW")
+        elif kind == "update":
+            merged: dict[str, list[list]] = {}
+            for _, range_name, values in ops:
+                merged.pop(range_name, None)
+                merged[range_name] = values
+            ws.batch_update(
+                [{"range": r, "values": v} for r, v in merged.items()],
+                value_input_option="RAW",
+            )
+        else:
+            ws.delete_rows(ops[0][1])
+
+    @staticmethod
+    def _unapplied(ws, kind: str, ops: list[tuple]) -> list[tuple]:
+        """Operasi append/delete yang ternyata belum diterapkan di sheet."""
+        kodes = [
+            str(v).strip().upper()
+            for v in GOOGLE_RETRY.call("sheets", "col_values", lambda: ws.col_values(1))
+        ]
+        if kind == "append":
+            present = set(kodes[1:])
+            return [op for op in ops if str(op[1][0]).strip().upper() not in present]
+        _, _, kode_toko = ops[0]
+        key = str(kode_toko or "").strip().upper()
+        if not key or key not in kodes[1:]:
+            # Sudah terhapus (atau tidak bisa dipastikan: jangan hapus baris lain)
+            return []
+        return [("delete", kodes.index(key, 1) + 1, kode_toko)]
+
+    def flush(self, raise_errors: bool = False):
+        """Kirim semua operasi tertunda sesuai urutan."""
+        with self._flush_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+                verify, self._verify_first = self._verify_first, False
+            if not ops:
+                return
+
+            groups = self._group(ops)
+            ws = None
+            for i, (kind, group_ops) in enumerate(groups):
+                uncertain = verify and i == 0 and kind != "update"
+                try:
+                    if ws is None:
+                        ws = self._get_ws()
+                    if uncertain:
+                        group_ops = self._unapplied(ws, kind, group_ops)
+                        uncertain = False
+                    if group_ops:
+                        self._send(ws, kind, group_ops)
+                    continue
+                except Exception as e:
+                    error = e
+                if not uncertain and ws is not None and kind != "update" \
+                        and is_retryable(error) and not is_throttled(error):
+                    # Respons hilang: lihat dulu apa yang sudah masuk ke sheet
+                    try:
+                        group_ops = self._unapplied(ws, kind, group_ops)
+                    except Exception:
+                        uncertain = True
+                    else:
+                        if not group_ops:
+                            continue
+
+                remaining = group_ops + [op for _, g in groups[i + 1:] for op in g]
+                self._failed(error, remaining, uncertain)
+                if raise_errors:
+                    raise error
+                return
+            with self._lock:
+                self._failures = 0
+                self._retry_at = 0.0
+                self.stats["flushes"] += 1
+                SHEET_PENDING.set(len(self._pending))
+
+    def _failed(self, error: Exception, remaining: list[tuple], uncertain: bool):
+        traceback.print_exception(error)
+        SHEET_FLUSH_FAILURES.inc()
+        with self._lock:
+            self.stats["failures"] += 1
+        if not self.write_behind:
+            # Mode langsung: pemanggil menerima error, operasi tidak diulang
+            self._dead_letter(remaining, error)
+            return
+        with self._lock:
+            self._failures += 1
+            failures = self._failures
+            # Kembalikan ke depan antrian, dicoba lagi setelah backoff
+            self._pending = remaining + self._pending
+            self._verify_first = uncertain
+            delay = min(self.max_backoff, max(self.flush_interval, 1.0) * 2 ** (failures - 1))
+            self._retry_at = time.monotonic() + delay
+            SHEET_PENDING.set(len(self._pending))
+        level = "PERINGATAN: " if failures >= self.max_failures else ""
+        print(f"{level}Flush sheet gagal {failures}x berturut-turut, "
+              f"{len(remaining)} operasi dicoba lagi dalam {delay:.0f} detik.")
+
+    def _dead_letter(self, ops: list[tuple], error):
+        """Catat operasi yang tidak diterapkan supaya bisa dipulihkan manual."""
+        if not ops:
+            return
+        with self._lock:
+            self.stats["dropped"] += len(ops)
+        SHEET_OPS_DROPPED.inc(len(ops))
+        print(f"Gagal menerapkan {len(ops)} operasi sheet, dicatat ke {self.dead_letter_path or 'log'}.")
+        lines = [
+            json.dumps({"time": time.time(), "error": str(error), "op": list(op)}, ensure_ascii=False, default=str)
+            for op in ops
+        ]
+        try:
+            if not self.dead_letter_path:
+                raise OSError("dead_letter_path tidak diisi")
+            with open(self.dead_letter_path, "a", encoding="utf-8") as fh:
+                fh.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Dead letter tidak bisa ditulis ({e}), operasi:")
+            for line in lines:
+                print(line)
+        if self.on_drop is not None:
+            self.on_drop()
+
+    # -------------------------
+    # Background thread
+    # -------------------------
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                # Masih dalam backoff setelah flush gagal
+                continue
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        if not self.write_behind or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="sheet-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            traceback.print_exc()
+        with self._lock:
+            leftover, self._pending = self._pending, []
+        # Proses berhenti: sisa antrian tidak boleh hilang tanpa jejak
+        self._dead_letter(leftover, "shutdown sebelum flush berhasil")
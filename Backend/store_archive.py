@@ -0,0 +1,162 @@
+"""
+Unduhan ZIP berisi semua dokumen satu toko, dikirim sebagai stream.
+
+File Drive diunduh paralel (MediaIoBaseDownload, jendela `parallel` file
+per arsip di atas pool bersama) ke SpooledTemporaryFile: file kecil tetap
+di memori, file besar pindah ke disk. Entri ZIP ditulis sesuai urutan
+selesai unduh sehingga byte pertama terkirim begitu file tercepat selesai,
+dan ZipFile menulis ke sink non-seekable (data descriptor) yang dikosongkan
+setiap blok -> arsip tidak pernah utuh di memori.
+
+File yang gagal diunduh dicatat di _GAGAL.txt pada akhir arsip.
+"""
+import contextvars
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from googleapiclient.http import MediaIoBaseDownload
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+# Format yang sudah terkompresi: deflate hanya membuang CPU
+_STORED_EXT = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".pdf", ".zip", ".rar", ".7z",
+    ".mp4", ".mov", ".mp3", ".docx", ".xlsx", ".pptx",
+}
+_COPY_BLOCK = 1024 * 1024
+
+
+class _Sink:
+    """Tujuan tulis ZipFile tanpa seek/tell: byte ditampung sampai drain()."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _safe(part: str) -> str:
+    part = str(part or "").replace("\\", "-").replace("/", "-").strip()
+    return part if part not in ("", ".", "..") else "_"
+
+
+def _discard(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class StoreArchiver:
+    def __init__(self, drive_factory, workers: int = 8, parallel: int = 4,
+                 spool_limit: int = 8 * 1024 * 1024, chunk_size: int = 4 * 1024 * 1024):
+        self._drive = drive_factory
+        self.parallel = max(1, parallel)
+        self.spool_limit = spool_limit
+        self.chunk_size = chunk_size
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="archive")
+
+    def _download(self, file_id: str):
+        drive = self._drive()
+        buf = tempfile.SpooledTemporaryFile(max_size=self.spool_limit)
+        try:
+            downloader = MediaIoBaseDownload(
+                buf, drive.files().get_media(fileId=file_id), chunksize=self.chunk_size,
+            )
+            done = False
+            with stage("drive_download"):
+                while not done:
+                    _, done = GOOGLE_RETRY.call("drive", "download", downloader.next_chunk)
+            buf.seek(0)
+            return buf
+        except Exception:
+            buf.close()
+            raise
+
+    @staticmethod
+    def _write_entry(zf: zipfile.ZipFile, sink: _Sink, path: str, data):
+        size = data.seek(0, os.SEEK_END)
+        data.seek(0)
+        info = zipfile.ZipInfo(path, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        info.compress_type = (
+            zipfile.ZIP_STORED if os.path.splitext(path)[1].lower() in _STORED_EXT else zipfile.ZIP_DEFLATED
+        )
+        # file_size diisi dulu supaya ZipFile memutuskan ZIP64 untuk file > 2 GB
+        info.file_size = size
+        with zf.open(info, "w") as out:
+            for block in iter(lambda: data.read(_COPY_BLOCK), b""):
+                out.write(block)
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+
+    def stream(self, entries: list[dict]):
+        """
+        entries: [{"category", "filename", "file_id"}]. Generator byte ZIP
+        dengan struktur <category>/<filename>.
+        """
+        sink = _Sink()
+        todo = iter(entries)
+        pending: dict = {}
+        failed: list[str] = []
+        used: set[str] = set()
+        ctx = contextvars.copy_context()
+
+        def fill():
+            while len(pending) < self.parallel:
+                entry = next(todo, None)
+                if entry is None:
+                    return
+                pending[self._pool.submit(ctx.copy().run, self._download, entry["file_id"])] = entry
+
+        try:
+            with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+                fill()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        entry = pending.pop(future)
+                        path = f"{_safe(entry['category'])}/{_safe(entry['filename'])}"
+                        try:
+                            data = future.result()
+                        except Exception as e:
+                            print(f"Gagal unduh {path} untuk arsip: {e}")
+                            failed.append(f"{path}: {e}")
+                            continue
+                        if path in used:
+                            root, ext = os.path.splitext(path)
+                            path = f"{root}_{entry['file_id']}{ext}"
+                        used.add(path)
+                        try:
+                            yield from self._write_entry(zf, sink, path, data)
+                        finally:
+                            data.close()
+                    fill()
+                if failed:
+                    zf.writestr("_GAGAL.txt", "\n".join(failed) + "\n")
+            # Central directory ditulis saat ZipFile ditutup
+            yield sink.drain()
+        finally:
+            # Client putus di tengah: batalkan antrian, buang hasil yang telanjur jalan
+            for future in pending:
+                if not future.cancel():
+                    future.add_done_callback(_discard)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
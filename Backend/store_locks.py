@@ -0,0 +1,68 @@
+"""
+Lock per kode_toko.
+
+Mutasi satu toko (simpan, update, hapus) dijalankan berurutan sehingga
+cek-duplikat dan perubahan file tidak saling balapan. Lock thread dipakai
+di dalam satu proses; jika `lock_dir` diisi, lock file (fcntl.flock) juga
+diambil supaya beberapa worker uvicorn ikut saling menunggu.
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock thread
+    fcntl = None
+
+
+class StoreLocks:
+    def __init__(self, lock_dir: str | None = None):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self._guard = threading.Lock()
+        # key -> [lock, jumlah pemakai]; dibuang saat tidak ada yang memakai
+        self._locks: dict[str, list] = {}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    @property
+    def shared(self) -> bool:
+        """True jika lock juga berlaku antar proses."""
+        return bool(self.lock_dir)
+
+    @staticmethod
+    def _normalise(key: str) -> str:
+        return str(key or "").strip().upper()
+
+    def _acquire_thread_lock(self, key: str) -> threading.Lock:
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        return entry[0]
+
+    def _release_thread_lock(self, key: str):
+        with self._guard:
+            entry = self._locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    @contextmanager
+    def hold(self, key: str):
+        key = self._normalise(key)
+        self._acquire_thread_lock(key)
+        fh = None
+        try:
+            if self.lock_dir:
+                name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+                fh = open(os.path.join(self.lock_dir, f"{name}.lock"), "a+")
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            if fh is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                fh.close()
+            self._release_thread_lock(key)
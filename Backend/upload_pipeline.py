@@ -0,0 +1,258 @@
+"""
+Pipeline upload paralel ke Google Drive.
+
+Setiap file melewati tahap decode -> upload -> grant permission di dalam
+thread pool dengan batas konkurensi. Laju pemanggilan API diatur token
+bucket (bukan jeda tetap), dan tiap worker memakai client Drive miliknya
+sendiri (lihat GoogleServicePool.drive()).
+"""
+import contextvars
+import hashlib
+import io
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from google_retry import GOOGLE_RETRY
+from metrics import stage
+
+
+class TokenBucket:
+    """Rate limiter sederhana: `rate` token per detik, maksimal `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def sha256_of(source) -> str:
+    """sha256 isi bytes / stream (posisi stream dikembalikan ke awal)."""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    h = hashlib.sha256()
+    source.seek(0)
+    for block in iter(lambda: source.read(1024 * 1024), b""):
+        h.update(block)
+    source.seek(0)
+    return h.hexdigest()
+
+
+@dataclass
+class UploadJob:
+    category: str
+    filename: str
+    mime_type: str
+    folder_id: str
+    # Dipanggil di worker: mengembalikan bytes file (decode base64 dsb.)
+    # atau objek file-like yang akan diunggah per chunk
+    load: Callable[[], Any]
+    # Tutup stream hasil load() setelah upload (misal file upload session)
+    close_source: bool = False
+    # Folder tujuan thumbnail (jika pemrosesan gambar aktif)
+    thumb_folder_id: Optional[str] = None
+    # Disimpan sebagai appProperties file Drive (misal md5 file asli)
+    app_properties: dict = field(default_factory=dict)
+
+
+@dataclass
+class UploadResult:
+    job: UploadJob
+    uploaded: Optional[dict] = None
+    error: Optional[str] = None
+    stage: str = ""
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.uploaded is not None and self.error is None
+
+
+class UploadPipeline:
+    def __init__(
+        self,
+        drive_factory: Callable,
+        upload_fn: Callable,
+        concurrency: int = 4,
+        limiter: Optional[TokenBucket] = None,
+        grant_public: bool = True,
+        image_processor=None,
+        workers: Optional[int] = None,
+    ):
+        self.drive_factory = drive_factory
+        self.upload_fn = upload_fn
+        # concurrency: job paralel per run(); workers: total thread bersama.
+        # Thread hidup selama proses -> client Drive per-thread dipakai ulang.
+        self.concurrency = max(1, int(concurrency))
+        self.workers = max(1, int(workers or self.concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        self.limiter = limiter
+        self.grant_public = grant_public
+        self.image_processor = image_processor
+
+    def _throttle(self):
+        if self.limiter is not None:
+            with stage("rate_limit_wait"):
+                self.limiter.acquire()
+
+    def _maybe_process_image(self, job: UploadJob, source, result: UploadResult):
+        """
+        Jalankan ImageProcessor untuk foto. Nama file & MIME pada job ikut
+        diperbarui (misal .heic -> .jpg); md5 file asli disimpan di
+        appProperties supaya diff update tetap mengenali isi yang sama.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            size = len(source)
+        else:
+            size = source.seek(0, io.SEEK_END)
+        if not self.image_processor.accepts(job.mime_type, size):
+            return source
+
+        if isinstance(source, (bytes, bytearray)):
+            raw = bytes(source)
+        else:
+            source.seek(0)
+            raw = source.read()
+        try:
+            with stage("image_process"):
+                processed = self.image_processor.process(raw, job.filename, job.mime_type)
+        except Exception as e:
+            # Gambar rusak / format tak dikenali: unggah isi asli apa adanya
+            print(f"Gagal memproses gambar {job.filename}, diunggah apa adanya: {e}")
+            if not isinstance(source, (bytes, bytearray)):
+                source.seek(0)
+            return source
+        job.app_properties["src_md5"] = hashlib.md5(raw).hexdigest()
+        job.filename = processed.filename
+        job.mime_type = processed.mime_type
+        result.extra["thumbnail_bytes"] = processed.thumbnail
+        return processed.data
+
+    def _upload_thumbnail(self, drive_service, job: UploadJob, file_id: str, data: bytes) -> dict:
+        self._throttle()
+        return self.upload_fn(
+            drive_service=drive_service,
+            folder_id=job.thumb_folder_id,
+            filename=f"thumb_{file_id}.jpg",
+            mime_type="image/jpeg",
+            raw_bytes=data,
+        )
+
+    def _process(self, job: UploadJob) -> UploadResult:
+        result = UploadResult(job=job)
+        original = source = None
+        try:
+            result.stage = "decode"
+            original = source = job.load()
+            # Hash isi asli disimpan di appProperties -> index deduplikasi
+            if "sha256" not in job.app_properties:
+                with stage("hash"):
+                    job.app_properties["sha256"] = sha256_of(source)
+            if self.image_processor is not None:
+                result.stage = "process"
+                source = self._maybe_process_image(job, source, result)
+            if isinstance(source, (bytes, bytearray)):
+                content = {"raw_bytes": bytes(source)}
+            else:
+                content = {"stream": source}
+
+            result.stage = "upload"
+            self._throttle()
+            drive_service = self.drive_factory()
+            uploaded = self.upload_fn(
+                drive_service=drive_service,
+                folder_id=job.folder_id,
+                filename=job.filename,
+                mime_type=job.mime_type,
+                **content,
+                **({"app_properties": job.app_properties} if job.app_properties else {}),
+            )
+            result.uploaded = uploaded
+
+            file_id = uploaded.get("id")
+            thumb_bytes = result.extra.pop("thumbnail_bytes", None)
+            if thumb_bytes and job.thumb_folder_id and file_id:
+                result.stage = "thumbnail"
+                try:
+                    result.extra["thumbnail"] = self._upload_thumbnail(
+                        drive_service, job, file_id, thumb_bytes
+                    )
+                except Exception as thumb_err:
+                    print(f"Gagal upload thumbnail {job.filename}: {thumb_err}")
+            if self.grant_public and file_id:
+                result.stage = "permission"
+                self._throttle()
+                try:
+                    request = drive_service.permissions().create(
+                        fileId=file_id,
+                        body={"type": "anyone", "role": "reader"},
+                        fields="id"
+                    )
+                    GOOGLE_RETRY.call("drive", "permission", request.execute)
+                except Exception as perm_err:
+                    # Upload tetap dianggap sukses, hanya akses publik yang gagal
+                    print(f"Tidak bisa set permission publik untuk {job.filename}: {perm_err}")
+            result.stage = "done"
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            if job.close_source and hasattr(original, "close"):
+                original.close()
+        return result
+
+    def run(self, jobs: list[UploadJob], on_result: Optional[Callable] = None) -> list[UploadResult]:
+        """
+        Jalankan semua job; urutan hasil sama dengan urutan input.
+        on_result(result) dipanggil begitu satu job selesai (untuk progres).
+        """
+        if not jobs:
+            return []
+
+        def process(job):
+            result = self._process(job)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        # Tiap job memakai salinan context pemanggil (trace metrik request).
+        # Maksimal `concurrency` job per run di executor bersama, supaya satu
+        # submission besar tidak memonopoli semua thread.
+        ctx = contextvars.copy_context()
+        results: list[Optional[UploadResult]] = [None] * len(jobs)
+        todo = iter(enumerate(jobs))
+        running: dict = {}
+
+        def fill():
+            for idx, job in todo:
+                running[self._executor.submit(ctx.copy().run, process, job)] = idx
+                if len(running) >= self.concurrency:
+                    return
+
+        fill()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+            fill()
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
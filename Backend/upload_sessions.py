@@ -0,0 +1,189 @@
+"""
+Upload session untuk client (upload per chunk yang bisa dilanjutkan).
+
+Alur:
+1. create()   -> upload_id + offset 0
+2. write()    -> tulis chunk pada offset yang diharapkan server
+3. status()   -> client yang koneksinya putus menanyakan offset terakhir
+4. finalize() -> cek ukuran (dan sha256 bila dikirim), status jadi "complete"
+
+File yang sudah complete dirujuk lewat "upload_id" di entri files pada
+payload simpan/update dokumen, lalu diunggah ke Drive dari disk.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class UploadSessionError(Exception):
+    def __init__(self, status_code: int, message: str, offset: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.offset = offset
+
+
+class UploadSessionStore:
+    def __init__(self, base_dir: str, ttl_seconds: int = 24 * 3600, max_size: int = 0):
+        self.base_dir = base_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._session_locks: dict[str, threading.Lock] = {}
+        os.makedirs(base_dir, exist_ok=True)
+
+    # -------------------------
+    # Path & metadata
+    # -------------------------
+    def _dir(self, upload_id: str) -> str:
+        # upload_id selalu uuid hex; tolak selain itu agar aman dipakai di path
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadSessionError(404, "Upload session tidak ditemukan.")
+        return os.path.join(self.base_dir, upload_id)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), "meta.json")
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), "data.bin")
+
+    def _read_meta(self, upload_id: str) -> dict:
+        try:
+            with open(self._meta_path(upload_id), "r") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            raise UploadSessionError(404, "Upload session tidak ditemukan.")
+
+    def _write_meta(self, meta: dict):
+        tmp = self._meta_path(meta["upload_id"]) + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._meta_path(meta["upload_id"]))
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _public(self, meta: dict) -> dict:
+        offset = os.path.getsize(self.data_path(meta["upload_id"]))
+        return {
+            "upload_id": meta["upload_id"],
+            "filename": meta["filename"],
+            "category": meta.get("category"),
+            "size": meta["size"],
+            "offset": offset,
+            "status": meta["status"],
+        }
+
+    # -------------------------
+    # API
+    # -------------------------
+    def create(self, filename: str, size: int, mime_type: str | None = None,
+               category: str | None = None, sha256: str | None = None) -> dict:
+        if not filename:
+            raise UploadSessionError(400, "filename wajib diisi.")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadSessionError(400, "size tidak valid.")
+        if size < 0:
+            raise UploadSessionError(400, "size tidak valid.")
+        if self.max_size and size > self.max_size:
+            raise UploadSessionError(413, "Ukuran file melebihi batas.")
+
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        open(self.data_path(upload_id), "wb").close()
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "type": mime_type,
+            "category": category,
+            "size": size,
+            "sha256": (sha256 or "").lower() or None,
+            "status": "open",
+            "created_at": time.time(),
+        }
+        self._write_meta(meta)
+        return self._public(meta)
+
+    def status(self, upload_id: str) -> dict:
+        return self._public(self._read_meta(upload_id))
+
+    def write(self, upload_id: str, start: int, chunks) -> dict:
+        """
+        Tulis chunk mulai dari `start`. `chunks` adalah iterable bytes
+        (body request dibaca bertahap). Offset harus sama dengan jumlah byte
+        yang sudah diterima; jika tidak, client diberi tahu offset yang benar.
+        """
+        with self._session_lock(upload_id):
+            meta = self._read_meta(upload_id)
+            if meta["status"] != "open":
+                raise UploadSessionError(409, "Upload session sudah difinalisasi.")
+            path = self.data_path(upload_id)
+            offset = os.path.getsize(path)
+            if start != offset:
+                raise UploadSessionError(409, "Offset chunk tidak sesuai.", offset=offset)
+
+            written = 0
+            with open(path, "ab") as fh:
+                try:
+                    for chunk in chunks:
+                        if offset + written + len(chunk) > meta["size"]:
+                            raise UploadSessionError(400, "Chunk melebihi ukuran file.")
+                        fh.write(chunk)
+                        written += len(chunk)
+                except UploadSessionError:
+                    fh.truncate(offset)
+                    raise
+            return self._public(meta)
+
+    def finalize(self, upload_id: str) -> dict:
+        with self._session_lock(upload_id):
+            meta = self._read_meta(upload_id)
+            if meta["status"] == "complete":
+                return self._public(meta)
+            path = self.data_path(upload_id)
+            received = os.path.getsize(path)
+            if received != meta["size"]:
+                raise UploadSessionError(409, "Upload belum lengkap.", offset=received)
+
+            if meta.get("sha256"):
+                h = hashlib.sha256()
+                with open(path, "rb") as fh:
+                    for block in iter(lambda: fh.read(1024 * 1024), b""):
+                        h.update(block)
+                if h.hexdigest() != meta["sha256"]:
+                    raise UploadSessionError(422, "Checksum sha256 tidak cocok.")
+
+            meta["status"] = "complete"
+            self._write_meta(meta)
+            return self._public(meta)
+
+    def open_completed(self, upload_id: str):
+        """Buka file hasil upload yang sudah complete (mode rb)."""
+        meta = self._read_meta(upload_id)
+        if meta["status"] != "complete":
+            raise UploadSessionError(409, "Upload session belum difinalisasi.")
+        return open(self.data_path(upload_id), "rb")
+
+    def delete(self, upload_id: str):
+        with self._session_lock(upload_id):
+            shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+        with self._lock:
+            self._session_locks.pop(upload_id, None)
+
+    def cleanup_expired(self):
+        now = time.time()
+        for name in os.listdir(self.base_dir):
+            try:
+                meta = self._read_meta(name)
+            except UploadSessionError:
+                continue
+            if now - meta.get("created_at", now) > self.ttl_seconds:
+                self.delete(name)
@@ -24,6 +24,11 @@ export default function StoreForm({ initialData = null, onSaved = () => {} }) {
   const [existingFiles, setExistingFiles] = useState([]); // 🔹 Simpan file lama (Drive)
   const [saving, setSaving] = useState(false);
 
+  // 🔹 Nama file di sel file_links di-escape backend ("," → %2C, "|" → %7C, "%" → %25)
+  function unquoteName(name) {
+    return name.replace(/%7C/g, "|").replace(/%2C/g, ",").replace(/%25/g, "%");
+  }
+
   // 🔹 Format angka 10000 → 100,00
   function formatDecimal(value) {
     if (!value) return "";
@@ -67,12 +72,13 @@ export default function StoreForm({ initialData = null, onSaved = () => {} }) {
         entries.forEach((entry) => {
           const parts = entry.split("|");
           let category = "pendukung", name = "", url = "";
-          if (parts.length === 3) [category, name, url] = parts;
+          // format: kategori|nama|link[|thumbnail]
+          if (parts.length >= 3) [category, name, url] = parts;
           else if (parts.length === 2) [name, url] = parts;
           else url = entry;
 
           category = (category || "").trim();
-          name = (name || "").trim();
+          name = unquoteName((name || "").trim());
           url = (url || "").trim();
           if (!buckets[category]) category = "pendukung";
 